@@ -2,21 +2,36 @@
 # general python modules
 # ======================
 import time
+START_TIME = time.perf_counter()    # startup times are measured from here
 import logging
 from functools import wraps
+import io
 import os
 import sys
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import numpy as np
+import secrets
+import argparse
+from urllib.parse import urlparse
 from threading import Thread
-
-# ===================
-# module from SpicePy
-# ===================
-import spicepy.netlist as ntl
-from spicepy.netsolve import net_solve
+from functools import partial
+from collections import deque
+
+# ===========================
+# solver (SpicePy) and workers
+# ===========================
+# NumPy, matplotlib and SpicePy are imported by the solver workers only (see botlib.jobs)
+import botlib.jobs as jobs
+import botlib.profiling as profiling
+from botlib.pool import SolverPool, PoolFull, SolverTimeout
+from botlib.scheduler import FairScheduler, RateLimited, TooManyJobs, Overloaded
+from botlib.cache import ResultCache, SingleFlight, RetryJob, netlist_key
+from botlib.settings import SettingsStore
+from botlib.pending import PendingNetlists
+from botlib.stats import UsageStats, StatsHandler, WINDOWS
+from botlib.broadcast import Broadcast
+from botlib.users import UserRegistry
+from botlib.logs import file_handler, start_logging, log_segments
+from botlib.webhook import WebhookServer, start_webhook
+from botlib.metrics import Registry, MetricsServer, process_rss
 
 # ==========================
 # python-temegam-bot modules
@@ -37,6 +52,204 @@ fid = open('./admin_only/admin_list.txt', 'r')
 LIST_OF_ADMINS = [int(adm) for adm in fid.readline().split()]
 fid.close()
 
+# ===============================
+# user settings
+# ===============================
+settings_store = SettingsStore('./users/settings.db')
+
+# ===============================
+# user registry
+# ===============================
+# all users (used by /send2all) with last-seen time and reachability
+user_registry = UserRegistry('./users/users_database.db', './users/users_status.log')
+
+# ===============================
+# users waiting for a netlist (after /netlist)
+# ===============================
+# entries expire after PENDING_TTL seconds (expired entries are removed every PENDING_SWEEP seconds)
+PENDING_TTL = 3600
+PENDING_SWEEP = 600
+pending_netlists = PendingNetlists(ttl=PENDING_TTL, filename='./users/pending_netlists.json')
+
+# ===============================
+# startup
+# ===============================
+# time (s) from START_TIME to the connection with Telegram ('front-end') and to the
+# warm-up of all solver workers ('workers'), shown by /stat
+startup_times = {}
+workers_ready = []
+
+# environment variable set by /r: chat id of the admin and time of the restart
+RESTART_ENV = 'SPICEPYBOT_RESTART'
+
+
+def worker_ready(seconds):
+    """
+    'worker_ready' is called every time a solver worker is warm
+
+    :param seconds: warm-up time of the worker (s)
+    :return: None
+    """
+    warm_up_seconds.observe(seconds)
+    workers_ready.append(seconds)
+    if (len(workers_ready) >= solver_pool.processes) and ('workers' not in startup_times):
+        startup_times['workers'] = time.perf_counter() - START_TIME
+        print("SpicePyBot: {} solver workers ready in {:.2f} s".format(solver_pool.processes,
+                                                                       startup_times['workers']))
+
+# ===============================
+# solver pool
+# ===============================
+# number of worker processes, timeout (s) of a single solve and max number of queued solves.
+# Workers are started with the bot (new interpreters, see botlib.pool): they import the heavy modules and warm up in background
+SOLVER_PROCESSES = os.cpu_count()
+SOLVER_TIMEOUT = 60
+SOLVER_QUEUE = 100
+solver_pool = SolverPool(processes=SOLVER_PROCESSES, timeout=SOLVER_TIMEOUT, max_queue=SOLVER_QUEUE,
+                         initializer=jobs.warm_up, on_ready=worker_ready)
+
+# ===============================
+# admission control and fair scheduling
+# ===============================
+# each user can submit ADMISSION_BURST netlists at once and then one every 1/ADMISSION_RATE seconds,
+# each chat can have at most MAX_JOBS_PER_CHAT netlists waiting or running (admins are not limited)
+ADMISSION_RATE = 0.1
+ADMISSION_BURST = 5
+MAX_JOBS_PER_CHAT = 2
+scheduler = FairScheduler(solver_pool, rate=ADMISSION_RATE, burst=ADMISSION_BURST,
+                          max_per_chat=MAX_JOBS_PER_CHAT, max_queue=SOLVER_QUEUE)
+
+# CPU budget of a job (s): larger analyses are downscaled or rejected (see botlib.cost).
+# The budget shrinks when jobs are waiting (but never below SOLVE_BUDGET_MIN)
+SOLVE_BUDGET = 10.0
+SOLVE_BUDGET_MIN = 2.0
+
+
+def solve_budget():
+    """
+    'solve_budget' provides the CPU budget of a new job according to the current load
+
+    :return: budget (s)
+    """
+    load = scheduler.queue_depth() / scheduler.slots
+    return max(SOLVE_BUDGET_MIN, SOLVE_BUDGET / (1 + load))
+
+# ===============================
+# rendering
+# ===============================
+# resolution of the plots: when the budget is at its minimum (heavy load) plots are
+# rendered as low-resolution previews with a 256-color palette
+RENDER_DPI = jobs.RENDER_DPI
+PREVIEW_DPI = jobs.PREVIEW_DPI
+
+# maximum number of photos of an album and maximum length of a message (Telegram limits)
+MEDIA_GROUP_MAX = 10
+MESSAGE_MAX = 4096
+
+# rendering time (s) of the last RENDER_WINDOW plots (shown by /stat)
+RENDER_WINDOW = 1000
+render_times = deque(maxlen=RENDER_WINDOW)
+
+# ===============================
+# result cache
+# ===============================
+# solutions already computed are sent again without solving the network
+CACHE_ENTRIES = 1000
+CACHE_BYTES = 100 * 2**20
+CACHE_FILE = './users/result_cache.pkl'    # set to None to avoid saving the cache on restart
+result_cache = ResultCache(max_entries=CACHE_ENTRIES, max_bytes=CACHE_BYTES, filename=CACHE_FILE)
+
+
+
+def cache_solution(key, sol):
+    """
+    'cache_solution' stores a solution in the cache (solutions rejected, downscaled or rendered as
+    previews because of the load are not stored)
+
+    :param key: cache key
+    :param sol: solution
+    :return: None
+    """
+    if sol['solved'] and not (sol.get('downscaled') or sol.get('preview')):
+        result_cache.put(key, sol)
+
+
+# identical netlists submitted while the first one is being solved wait for its result
+in_flight = SingleFlight(on_result=cache_solution)
+
+# ===============================
+# metrics
+# ===============================
+# exposed by /metrics (admins) and, with --metrics-port, on http://<--metrics-listen>:<port>/metrics
+metrics = Registry()
+stage_seconds = metrics.histogram('spicepybot_stage_seconds', 'Time spent in each stage of a solve '
+                                  '(parse, frequency_span, solve, branch, print, render, upload)', ['stage'])
+job_seconds = metrics.histogram('spicepybot_job_seconds', 'Time from submission to result of a job '
+                                '(waiting time included)', ['analysis'])
+solves_total = metrics.counter('spicepybot_solves_total', 'Netlists solved', ['analysis'])
+errors_total = metrics.counter('spicepybot_errors_total', 'Failed requests', ['kind'])
+rejected_total = metrics.counter('spicepybot_rejected_total', 'Netlists rejected by the cost guard')
+downscaled_total = metrics.counter('spicepybot_downscaled_total', 'Analyses downscaled by the cost guard')
+engine_fallbacks_total = metrics.counter('spicepybot_engine_fallbacks_total',
+                                         'Networks solved by SpicePy because the sparse engine failed')
+metrics.counter('spicepybot_cache_hits_total', 'Solutions found in the result cache',
+                func=lambda: result_cache.stats()['hits'])
+metrics.counter('spicepybot_cache_misses_total', 'Solutions not found in the result cache',
+                func=lambda: result_cache.stats()['misses'])
+metrics.counter('spicepybot_coalesced_total', 'Requests that joined an identical running job',
+                func=lambda: in_flight.coalesced)
+metrics.gauge('spicepybot_queue_depth', 'Jobs waiting in the scheduler', func=scheduler.queue_depth)
+metrics.gauge('spicepybot_jobs_in_flight', 'Jobs running in the solver workers', func=solver_pool.in_flight)
+metrics.gauge('spicepybot_worker_rss_bytes', 'Resident memory of each solver worker', ['pid'],
+              func=lambda: {(pid,): process_rss(pid) for pid in solver_pool.worker_pids()})
+metrics.gauge('spicepybot_rss_bytes', 'Resident memory of the bot process', func=lambda: process_rss(os.getpid()))
+warm_up_seconds = metrics.histogram('spicepybot_worker_warm_up_seconds', 'Time from the start of a solver worker '
+                                    'to its warm-up (imports and figure templates)')
+metrics.gauge('spicepybot_startup_seconds', 'Startup time of the front-end and of the solver workers', ['stage'],
+              func=lambda: {(stage,): seconds for stage, seconds in startup_times.items()})
+
+
+def record_job(sol, elapsed, update, netlist):
+    """
+    'record_job' updates the metrics with the result of a job computed by the solver pool
+    (failures of the sparse engine are logged in SolverLog)
+
+    :param sol: solution (see botlib.solver.solve)
+    :param elapsed: time from submission to result (s)
+    :param update: bot update
+    :param netlist: string with the netlist
+    :return: None
+    """
+    render_times.extend(sol.get('render_time', []))
+    for stage, seconds in sol.get('timings', {}).items():
+        stage_seconds.observe(seconds, stage=stage)
+    job_seconds.observe(elapsed, analysis=sol['analysis'])
+    if not sol['solved']:
+        rejected_total.inc()
+    if sol['downscaled']:
+        downscaled_total.inc()
+    if sol.get('engine_fallback'):
+        engine_fallbacks_total.inc()
+        SolverLog.warning('UserID: ' + str(update.effective_user.id) + ' - Engine fallback (' +
+                          sol['engine_fallback'] + '): ' + netlist.replace('\n', '  /  '))
+
+# ===============================
+# profiling (/profile)
+# ===============================
+# admins (chat id) whose next netlist is solved under cProfile
+profile_next = set()
+
+# ===============================
+# broadcast (/send2all)
+# ===============================
+# concurrent senders and checkpoint file (used to resume the broadcast after a restart)
+BROADCAST_WORKERS = 8
+BROADCAST_CHECKPOINT = './users/broadcast.json'
+broadcast_job = None
+
+# number of threads of the dispatcher (handlers waiting for the solver pool run on them)
+BOT_WORKERS = 32
+
 
 # ==========================
 # Logging
@@ -53,25 +266,31 @@ class MyFilter(object):
 # formatter
 fmt = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+# rotation: size of a log file (bytes) and number of rotated logs (compressed) that are kept
+LOG_MAX_BYTES = 10 * 2**20
+LOG_BACKUPS = 10
+
 # StatLog: log how the log is used (only INFO)
 StatLog = logging.getLogger('StatLog')
-h1 = logging.FileHandler('StatBot.log')
-h1.setFormatter(fmt)
-StatLog.addHandler(h1)
+h1 = file_handler('StatBot.log', fmt, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUPS)
 StatLog.setLevel(logging.INFO)
 StatLog.addFilter(MyFilter(logging.INFO))
 
+# running aggregates of StatLog (used by /stat), admins are excluded
+STATS_CHECKPOINT = 600    # seconds between two checkpoints
+usage_stats = UsageStats(filename='./users/stats.json', exclude=LIST_OF_ADMINS)
+h4 = StatsHandler(usage_stats)
+
 # SolverLog: catch error in the netlist (>= WARNING)
 SolverLog = logging.getLogger('SolverLog')
-h2 = logging.FileHandler('SolverLog.log')
-h2.setFormatter(fmt)
-SolverLog.addHandler(h2)
+h2 = file_handler('SolverLog.log', fmt, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUPS)
 
 # OtherLog: catch all other error using the dispatcher (>= WARNING)
 OtherLog = logging.getLogger('OtherLog')
-h3 = logging.FileHandler('OtherLog.log')
-h3.setFormatter(fmt)
-OtherLog.addHandler(h3)
+h3 = file_handler('OtherLog.log', fmt, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUPS)
+
+# loggers only put records in a queue: a background thread writes them
+log_listener = start_logging({StatLog: [h1, h4], SolverLog: [h2], OtherLog: [h3]})
 
 
 # ==========================
@@ -106,157 +325,275 @@ def error_callback(update, context):
 # compute the solution
 def get_solution(fname, update, context):
     """
-    'get_solution' computes the solution of a network using SpicePy
+    'get_solution' computes the solution of a network using SpicePy.
+    The network is parsed, solved and rendered by a worker of the solver pool.
 
     :param fname: filename with the netlist
     :param update: bot update
     :param context: CallbackContext
     :return:
-        * mex:  solution formatted in a string
+        * sol: solution (see botlib.solver.solve)
     """
+    # read the netlist
+    with open(fname) as f:
+        netlist = f.read()
+
+    # netlist to be profiled (/profile)
+    if profile_next and (update.message.chat_id in profile_next):
+        profile_next.discard(update.message.chat_id)
+        return profile_solution(netlist, update, context)
+
     try:
-        # create network and solve it
-        net = ntl.Network(fname)
-
-        # check if number of nodes exceeds the limit
-        NMAX = 40
-        if net.node_num > NMAX:
-            mex = "Your netlist includes more than {:d} nodes.\n".format(net.node_num)
-            mex += "*The maximum allowed number on this bot is {:d}.*\n".format(NMAX)
-            mex += "Please reduce the number of nodes or take a look to the computational core of this bot "
-            mex += "that does not have this limitation:\n"
-            mex += "[SpicePy project](https://github.com/giaccone/SpicePy)"
+        args = solve_args(netlist, update.message.chat_id)
+        netlist, nodal_pot, polar, dB, budget, dpi, palette, composite = args
+        key = netlist_key(netlist, nodal_pot, polar, dB, composite)
+        sol = cached_job(key, update, context, jobs.solve, *args)
 
-        else:
+        # Log every time a network is solved
+        # To make stat it is saved the type of network and the UserID
+        if sol['solved']:
+            StatLog.info('Analysis: ' + sol['analysis'] + ' - UserID: ' + str(update.effective_user.id))
+            solves_total.inc(analysis=sol['analysis'])
 
-            # limit sample for .tran to 2000 (max)
-            if net.analysis[0].lower() == '.tran':
-                Nsamples = float(net.convert_unit(net.analysis[2])) / float(net.convert_unit(net.analysis[1]))
-                if Nsamples > 2000:
-                    step = float(net.convert_unit(net.analysis[2]))/1999
-                    net.analysis[1] = '{:.3e}'.format(step)
-
-                    mex = "Your netlits defines a '.tran' analysis with *{:d}* samples\n".format(int(Nsamples))
-                    mex += "Since this bot runs on a limited hardware shared by many users\n"
-                    mex += "The analysis has been limited to *2000* samples:\n"
-                    mex += "`.tran " + net.analysis[1] + " " + net.analysis[-1] + "`"
-
-
-                    context.bot.send_message(chat_id=update.message.chat_id,
-                                     text=mex,
-                                     parse_mode=telegram.ParseMode.MARKDOWN)
-
-            # limit sample for .ac to 2000 (max)
-            elif net.analysis[0].lower() == '.ac':
-                # get frequencies
-                net.frequency_span()
-
-                if not np.isscalar(net.f):
-                    # get Nsamples
-                    Nsamples = len(net.f)
-                    # limit di 2000 max
-                    if Nsamples > 2000:
-                        scale = 2000 / Nsamples
-                        old_analysys = "`" + " ".join(net.analysis) + "`"
-                        net.analysis[2] = str(int(np.ceil(scale * float(net.convert_unit(net.analysis[2])))))
-                        new_analysys = "`" + " ".join(net.analysis) + "`"
-
-                        mex = "Your netlits defines a '.tran' analysis with *{:d}* samples\n".format(int(Nsamples))
-                        mex += "Since this bot runs on a limited hardware shared by many users\n"
-                        mex += "The analysis has been limited to *2000* samples:\n"
-                        mex += "original analysis: " + old_analysys + "\n"
-                        mex += "ner analysis: " + new_analysys + "\n"
-
-                        context.bot.send_message(chat_id=update.message.chat_id,
-                                         text=mex,
-                                         parse_mode=telegram.ParseMode.MARKDOWN)
-
-            # get configurations
-            fname = './users/' + str(update.message.chat_id) + '.cnf'
-            fid = open(fname, 'r')
-            flag = fid.readline()[:-1]  # read nodal_pot conf
-            nodal_pot = flag == 'True'
-            flag = fid.readline()[:-1]  # read polar conf
-            polar = flag == 'True'
-            flag = fid.readline()  # read dB conf
-            dB = flag == 'True'
-
-            if net.analysis[0] == '.op':
-                # forcepolar to False for .op problems
-                polar = False
-
-            # solve the network
-            net_solve(net)
-
-            # .op and .ac (single-frequency): prepare mex to be printed
-            if (net.analysis[0].lower() == '.op') | ((net.analysis[0].lower() == '.ac') & (np.isscalar(net.f))):
-                # get branch quantities
-                net.branch_voltage()
-                net.branch_current()
-                net.branch_power()
-
-                # prepare message
-                mex = net.print(polar=polar, message=True)
-                mex = mex.replace('==============================================\n'
-                                  '               branch quantities'
-                                  '\n==============================================\n', '*branch quantities*\n`')
-                mex = mex.replace('----------------------------------------------', '')
-                mex += '`'
-
-                # if the user wants node potentials add it to mex
-                if nodal_pot:
-                    # create local dictionary node-number 2 node-label
-                    num2node_label = {num: name for name, num in net.node_label2num.items() if name != '0'}
-
-                    # compute the node potentials
-                    mex0 = '*node potentials*\n`'
-                    for num in num2node_label:
-                        voltage = net.get_voltage('(' + num2node_label[num] + ')')[0]
-                        if polar:
-                            mex0 += 'v(' + num2node_label[num] + ') = {:10.4f} V < {:10.4f}°\n'.format(np.abs(voltage),np.angle(voltage) * 180 / np.pi)
-                        else:
-                            mex0 += 'v(' + num2node_label[num] + ') = {:10.4f} V\n'.format(voltage)
-
-
-                    # add newline
-                    mex0 += '`\n\n'
-
-                    # add node potentials before branch quantities
-                    mex = mex0 + mex
-
-            elif net.analysis[0].lower() == '.tran':
-                hf = net.plot(to_file=True, filename='./users/tran_plot_' + str(update.message.chat_id) + '.png',dpi_value=150)
-                mex = None
-                plt.close(hf)
-
-            elif net.analysis[0].lower() == '.ac':
-                hf = net.bode(to_file=True, decibel=dB, filename='./users/bode_plot_' + str(update.message.chat_id) + '.png', dpi_value=150)
-                mex = None
-                if isinstance(hf, list):
-                    for fig in hf:
-                        plt.close(fig)
-                else:
-                    plt.close(hf)
-
-            # Log every time a network is solved
-            # To make stat it is saved the type of network and the UserID
-            StatLog.info('Analysis: ' + net.analysis[0] + ' - UserID: ' + str(update.effective_user.id))
-
-        return net, mex
-
-    except:
-        # set network to None
-        net = None
-        # read network with issues
-        wrong_net = ''
-        with open(fname) as f:
-            for line in f:
-                wrong_net += line
-        wrong_net = wrong_net.replace('\n', '  /  ')
+        return sol
+
+    except Exception as e:
+        return error_solution(e, netlist, update)
+
+
+def solve_args(netlist, chat_id):
+    """
+    'solve_args' provides the arguments of botlib.solver.solve according to the user settings
+    and to the current load
+
+    :param netlist: string with the netlist
+    :param chat_id: chat id of the user
+    :return: tuple (netlist, nodal_pot, polar, dB, budget, dpi, palette, composite)
+    """
+    # get configurations
+    nodal_pot, polar, dB, composite = settings_store.get(chat_id)
+
+    # resolution of the plots according to the current load
+    budget = solve_budget()
+    if budget > SOLVE_BUDGET_MIN:
+        dpi, palette = RENDER_DPI, False
+    else:
+        dpi, palette = PREVIEW_DPI, True
+
+    return netlist, nodal_pot, polar, dB, budget, dpi, palette, composite
+
+
+def profile_solution(netlist, update, context):
+    """
+    'profile_solution' solves a netlist under cProfile (see botlib.profiling) and sends the hotspots
+    and the full profile. The result cache is not used.
+
+    :param netlist: string with the netlist
+    :param update: bot update
+    :param context: CallbackContext
+    :return: sol (see botlib.solver.solve)
+    """
+    try:
+        job = submit_job(update, context, profiling.profile, jobs.solve,
+                         *solve_args(netlist, update.message.chat_id))
+        res = job.result()
+    except Exception as e:
+        return error_solution(e, netlist, update)
+
+    # hotspots and full profile (pstats format and text)
+    context.bot.send_message(chat_id=update.message.chat_id, text=profiling.format_hotspots(res),
+                             parse_mode=telegram.ParseMode.MARKDOWN)
+    context.bot.send_document(chat_id=update.message.chat_id, document=io.BytesIO(res['stats']),
+                              filename='profile.prof')
+    context.bot.send_document(chat_id=update.message.chat_id, document=io.BytesIO(res['listing'].encode('utf-8')),
+                              filename='profile.txt')
+
+    if res['error'] is not None:
+        return error_solution(RuntimeError(res['error']), netlist, update)
+    return res['result']
 
+
+def cached_job(key, update, context, func, *args):
+    """
+    'cached_job' provides the result of a job from the cache, otherwise the job is submitted
+    to the solver pool (identical jobs being solved are not submitted again)
+
+    :param key: cache key of the job
+    :param update: bot update
+    :param context: CallbackContext
+    :param func: function to be executed in the solver pool
+    :param args: arguments of func (the netlist first)
+    :return: sol (see botlib.solver.solve)
+    """
+    sol = result_cache.get(key)
+    if sol is None:
+        start = time.perf_counter()
+        while True:
+            job, leader = in_flight.acquire(key)
+            if leader:
+                try:
+                    pool_job, position = schedule_job(update, func, *args)
+                except (RateLimited, TooManyJobs):
+                    # limits of the leader only: the waiting requests submit the job themselves
+                    in_flight.release(key)
+                    raise
+                except Exception as e:
+                    in_flight.fail(key, e)
+                    raise
+                in_flight.attach(key, pool_job)
+                notify_position(update, context, position)
+
+            try:
+                sol = job.result()
+                break
+            except RetryJob:
+                continue
+
+        if leader:
+            record_job(sol, time.perf_counter() - start, update, args[0])
+    return sol
+
+
+def submit_job(update, context, func, *args):
+    """
+    'submit_job' submits a job to the solver pool through the scheduler and tells the user
+    the position in the queue
+
+    :param update: bot update
+    :param context: CallbackContext
+    :param func: function to be executed in the solver pool
+    :param args: arguments of func
+    :return: Future with the result of the job
+    """
+    job, position = schedule_job(update, func, *args)
+    notify_position(update, context, position)
+    return job
+
+
+def schedule_job(update, func, *args):
+    """
+    'schedule_job' submits a job to the solver pool through the scheduler (admins have priority)
+
+    :param update: bot update
+    :param func: function to be executed in the solver pool
+    :param args: arguments of func
+    :return: Future with the result of the job and position in the queue (0: running)
+    """
+    user_id = update.effective_user.id
+    return scheduler.submit(user_id, update.message.chat_id, func, *args, priority=user_id in LIST_OF_ADMINS)
+
+
+def notify_position(update, context, position):
+    """
+    'notify_position' tells the user that the job is queued (the job runs anyway if the message fails)
+
+    :param update: bot update
+    :param context: CallbackContext
+    :param position: position in the queue (0: running)
+    :return: None
+    """
+    if position > 0:
+        try:
+            context.bot.send_message(chat_id=update.message.chat_id,
+                                     text="Your netlist is queued, position {}.".format(position))
+        except telegram.error.TelegramError:
+            pass
+
+
+def error_solution(error, netlist, update):
+    """
+    'error_solution' provides the solution sent when a job fails
+
+    :param error: exception raised by the job
+    :param netlist: string with the netlist
+    :param update: bot update
+    :return: sol (see botlib.solver.solve) with the class of the error in 'error'
+        ('busy', 'rate', 'jobs', 'timeout' or 'netlist')
+    """
+    if isinstance(error, (Overloaded, PoolFull)):
+        kind = 'busy'
+        mex = "*The bot is very busy right now*.\nPlease send your netlist again in a few minutes."
+
+    elif isinstance(error, RateLimited):
+        kind = 'rate'
+        mex = "*You are sending too many netlists*.\nPlease wait a few seconds before sending a new one."
+
+    elif isinstance(error, TooManyJobs):
+        kind = 'jobs'
+        mex = "*Your previous netlists are still being solved*.\nPlease wait for their results."
+
+    elif isinstance(error, SolverTimeout):
+        kind = 'timeout'
+        # log error
+        SolverLog.error('UserID: ' + str(update.effective_user.id) + ' - Netlist timeout: ' +
+                        netlist.replace('\n', '  /  '))
+        mex = "*Your netlist took too long to be solved* (more than {} s).\n".format(SOLVER_TIMEOUT)
+        mex += "Since this bot runs on a limited hardware shared by many users, please reduce the analysis."
+
+    else:
+        kind = 'netlist'
         # log error
-        SolverLog.error('UserID: ' + str(update.effective_user.id) + ' - Netlist error: ' + wrong_net)
-        return net, "*Something went wrong with your netlist*.\nPlease check the netlist format."
+        SolverLog.error('UserID: ' + str(update.effective_user.id) + ' - Netlist error: ' +
+                        netlist.replace('\n', '  /  '))
+        mex = "*Something went wrong with your netlist*.\nPlease check the netlist format."
+
+    errors_total.inc(kind=kind)
+    return {'analysis': None, 'solved': False, 'mex': mex, 'notes': [], 'plots': [], 'error': kind}
+
+
+# send the solution
+def send_solution(sol, update, context):
+    """
+    'send_solution' sends the solution (text or plots) to the user
+
+    :param sol: solution (see botlib.solver.solve)
+    :param update: bot update
+    :param context: CallbackContext
+    :return: None
+    """
+    start = time.perf_counter()
+
+    # messages about limitations of the analysis
+    for mex in sol['notes']:
+        context.bot.send_message(chat_id=update.message.chat_id, text=mex,
+                                 parse_mode=telegram.ParseMode.MARKDOWN)
+
+    # typing
+    context.bot.send_chat_action(chat_id=update.message.chat_id, action=telegram.ChatAction.TYPING)
+
+    if sol.get('files'):    # exported data (/export)
+        for filename, data in sol['files']:
+            context.bot.send_document(chat_id=update.message.chat_id, document=io.BytesIO(data), filename=filename)
+
+    elif len(sol['plots']) == 1:    # in case of .tran or .ac-multi-freq send the plots
+        context.bot.send_photo(chat_id=update.message.chat_id, photo=io.BytesIO(sol['plots'][0]))
+
+    elif sol['plots']:    # several bode plots: one album (at most MEDIA_GROUP_MAX photos each)
+        for k in range(0, len(sol['plots']), MEDIA_GROUP_MAX):
+            plots = sol['plots'][k:k + MEDIA_GROUP_MAX]
+            if len(plots) == 1:
+                context.bot.send_photo(chat_id=update.message.chat_id, photo=io.BytesIO(plots[0]))
+            else:
+                context.bot.send_media_group(chat_id=update.message.chat_id,
+                                             media=[telegram.InputMediaPhoto(io.BytesIO(plot)) for plot in plots])
+
+    else:    # otherwise print results
+        mex = 'Please remember that all components are analyzed with *passive sign convention*.\nHere you have  ' \
+              '*the circuit solution*.\n\n' + sol['mex']
+        if len(mex) <= MESSAGE_MAX:
+            context.bot.send_message(chat_id=update.message.chat_id, text=mex,
+                                     parse_mode=telegram.ParseMode.MARKDOWN, disable_web_page_preview=True)
+
+        else:    # large networks: the solution is sent in a text file
+            mex = 'Please remember that all components are analyzed with *passive sign convention*.\nYour circuit ' \
+                  'solution is too long for a message: *here you have it in a file*.'
+            context.bot.send_message(chat_id=update.message.chat_id, text=mex,
+                                     parse_mode=telegram.ParseMode.MARKDOWN, disable_web_page_preview=True)
+            text = sol['mex'].replace('`', '').replace('*', '')
+            context.bot.send_document(chat_id=update.message.chat_id, document=io.BytesIO(text.encode('utf-8')),
+                                      filename='solution.txt')
+
+    stage_seconds.observe(time.perf_counter() - start, stage='upload')
 
 
 # ==========================
@@ -329,12 +666,8 @@ def start(update, context):
     context.bot.send_message(chat_id=update.message.chat_id,
                      text=msg,
                      parse_mode=telegram.ParseMode.MARKDOWN, disable_web_page_preview=True)
-    fname = './users/' + str(update.message.chat_id) + '.cnf'
-    fid = open(fname, 'w')
-    fid.write('False\n')  # this is for the node potential
-    fid.write('False\n')  # this is for the polar flag
-    fid.write('False')    # this is for the decibel flag
-    fid.close()
+    settings_store.reset(update.message.chat_id)
+    user_registry.touch(update.message.chat_id)
 
 
 # =========================================
@@ -349,15 +682,7 @@ def catch_netlist(update, context):
     :param context: CallbackContext
     :return: None
     """
-
-    # if current user don't have cnf file create it
-    if not os.path.exists('./users/' + str(update.message.chat_id) + '.cnf'):
-        fname = './users/' + str(update.message.chat_id) + '.cnf'
-        fid = open(fname, 'w')
-        fid.write('False\n')  # this is for the node potential
-        fid.write('False\n')  # this is for the polar flag
-        fid.write('False')    # this is for the decibel flag
-        fid.close()
+    user_registry.touch(update.message.chat_id)
 
     # catch the netlist from file
     file = context.bot.getFile(update.message.document.file_id)
@@ -372,32 +697,8 @@ def catch_netlist(update, context):
     context.bot.send_message(chat_id=update.message.chat_id, text=mex)
 
     # compute solution
-    net, mex = get_solution(fname, update, context)
-
-    # typing
-    context.bot.send_chat_action(chat_id=update.message.chat_id, action=telegram.ChatAction.TYPING)
-
-    if mex is None:    # in case of .tran or .ac-multi-freq mex is none, hence send the plot
-        if net.analysis[0].lower() == '.tran':
-            context.bot.send_photo(chat_id=update.message.chat_id,
-                           photo=open('./users/tran_plot_' + str(update.message.chat_id) + '.png', 'rb'))
-        elif net.analysis[0].lower() == '.ac':
-            N = int(len(net.tf_cmd.split()[1:]) / 2)
-            if N == 1:
-                context.bot.send_photo(chat_id=update.message.chat_id,
-                               photo=open('./users/bode_plot_' + str(update.message.chat_id) + '.png', 'rb'))
-            else:
-                for k in range(N):
-                    context.bot.send_photo(chat_id=update.message.chat_id,
-                                   photo=open(
-                                       './users/bode_plot_' + str(update.message.chat_id) + '_' + str(k) + '.png',
-                                       'rb'))
-
-    else:    # otherwise print results
-        mex = 'Please remember that all components are analyzed with *passive sign convention*.\nHere you have  ' \
-              '*the circuit solution*.\n\n' + mex
-        context.bot.send_message(chat_id=update.message.chat_id, text=mex,
-                         parse_mode=telegram.ParseMode.MARKDOWN, disable_web_page_preview=True)
+    sol = get_solution(fname, update, context)
+    send_solution(sol, update, context)
 
 
 # ==========================
@@ -421,6 +722,10 @@ def help(update, context):
     msg += "1) use the command `/netlist` and write the netlist directly to the Bot (i.e. chatting with the BOT)\n\n"
     msg += "or\n\n"
     msg += "2) send a text file to the Bot including the netlist. The Bot will catch it and it'll solve it.\n\n"
+    msg += "Then you can use `/sweep <element> <start> <stop> <n>` to solve your last netlist for n values "
+    msg += "of an element (e.g. `/sweep R1 1k 10k 10`) and `/export [npz|csv]` to get all the quantities "
+    msg += "of its solution in a file. When a netlist has many transfer functions, `/composite` "
+    msg += "switches between one Bode plot for each of them and a single image with all of them.\n\n"
     msg += "*Finally*\n"
     msg += "read the full [tutorial](https://github.com/giaccone/SpicePyBot/wiki) if "
     msg += "you are completely new to this subject."
@@ -441,18 +746,91 @@ def netlist(update, context):
     :param context: CallbackContext
     :return: None
     """
+    user_registry.touch(update.message.chat_id)
+    pending_netlists.add(update.message.chat_id)
+    context.bot.send_message(chat_id=update.message.chat_id, text="Please write the netlist\nAll in one message.")
 
-    # if current user don't have cnf file create it
-    if not os.path.exists('./users/' + str(update.message.chat_id) + '.cnf'):
-        fname = './users/' + str(update.message.chat_id) + '.cnf'
-        fid = open(fname, 'w')
-        fid.write('False\n')  # this is for the node potential
-        fid.write('False\n')  # this is for the polar flag
-        fid.write('False')    # this is for the decibel flag
-        fid.close()
 
-    open("./users/" + str(update.message.chat_id) + "_waitnetlist", 'w').close()
-    context.bot.send_message(chat_id=update.message.chat_id, text="Please write the netlist\nAll in one message.")
+# =========================================
+# sweep - solve the last netlist for many values of an element
+# =========================================
+@block_group
+def sweep(update, context):
+    """
+    'sweep' solves the last netlist for n values of an element and sends one plot
+    (usage: /sweep <element> <start> <stop> <n>)
+
+    :param update: bot update
+    :param context: CallbackContext
+    :return: None
+    """
+    user_registry.touch(update.message.chat_id)
+
+    usage = "Usage: `/sweep <element> <start> <stop> <n>` (e.g. `/sweep R1 1k 10k 10`).\n"
+    usage += "The last netlist you sent is solved for n values of the element."
+
+    fname = './users/' + str(update.message.chat_id) + '.txt'
+    if (len(context.args) != 4) or (not context.args[3].isdigit()) or (not os.path.exists(fname)):
+        context.bot.send_message(chat_id=update.message.chat_id, text=usage,
+                                 parse_mode=telegram.ParseMode.MARKDOWN)
+        return
+
+    with open(fname) as f:
+        netlist = f.read()
+
+    element, start, stop, n = context.args
+    try:
+        job = submit_job(update, context, jobs.sweep, netlist, element, start, stop, int(n), solve_budget())
+        sol = job.result()
+        if sol['solved']:
+            StatLog.info('Analysis: ' + sol['analysis'] + ' - UserID: ' + str(update.effective_user.id))
+            solves_total.inc(analysis=sol['analysis'])
+    except Exception as e:
+        sol = error_solution(e, netlist, update)
+
+    send_solution(sol, update, context)
+
+
+# =========================================
+# export - numeric solution of the last netlist
+# =========================================
+@block_group
+def export(update, context):
+    """
+    'export' solves the last netlist and sends all quantities in a file
+    (usage: /export [npz|csv])
+
+    :param update: bot update
+    :param context: CallbackContext
+    :return: None
+    """
+    user_registry.touch(update.message.chat_id)
+
+    usage = "Usage: `/export [npz|csv]`.\n"
+    usage += "The solution of the last netlist you sent is exported as a compressed numpy archive (default) "
+    usage += "or as a gzipped csv file."
+
+    fname = './users/' + str(update.message.chat_id) + '.txt'
+    fmt = context.args[0].lower() if context.args else 'npz'
+    if (len(context.args) > 1) or (fmt not in jobs.EXPORT_FORMATS) or (not os.path.exists(fname)):
+        context.bot.send_message(chat_id=update.message.chat_id, text=usage,
+                                 parse_mode=telegram.ParseMode.MARKDOWN)
+        return
+
+    with open(fname) as f:
+        netlist = f.read()
+
+    try:
+        # exported data do not depend on the user settings
+        sol = cached_job(netlist_key(netlist) + '.' + fmt, update, context, jobs.export, netlist, fmt,
+                         solve_budget())
+        if sol['solved']:
+            StatLog.info('Analysis: ' + sol['analysis'] + ' - UserID: ' + str(update.effective_user.id))
+            solves_total.inc(analysis=sol['analysis'])
+    except Exception as e:
+        sol = error_solution(e, netlist, update)
+
+    send_solution(sol, update, context)
 
 
 # =========================================
@@ -468,17 +846,16 @@ def reply(update, context):
     :param context: CallbackContext
     :return: None
     """
-    # check call to /netlist
-    if os.path.exists("./users/" + str(update.message.chat_id) + "_waitnetlist"):
+    user_registry.touch(update.message.chat_id)
+
+    # check call to /netlist (the user is removed from the waiting list)
+    if pending_netlists.pop(update.message.chat_id):
         # write the netlist
         fname = "./users/" + str(update.message.chat_id) + ".txt"
         fid = open(fname, "w")
         fid.write(str(update.message.text) + '\n')
         fid.close()
 
-        # remove waitnetlist file for this user
-        os.remove("./users/" + str(update.message.chat_id) + "_waitnetlist")
-
         # send the netlist for double check to user
         mex = 'This is your netlist:\n\n'
         with open(fname) as f:
@@ -487,32 +864,8 @@ def reply(update, context):
         context.bot.send_message(chat_id=update.message.chat_id, text=mex)
 
         # compute solution
-        net, mex = get_solution(fname, update, context)
-
-        # typing
-        context.bot.send_chat_action(chat_id=update.message.chat_id, action=telegram.ChatAction.TYPING)
-
-        if mex is None:  # in case of .tran or .ac-multi-freq mex is none, hence send the plot
-            if net.analysis[0].lower() == '.tran':
-                context.bot.send_photo(chat_id=update.message.chat_id,
-                               photo=open('./users/tran_plot_' + str(update.message.chat_id) + '.png', 'rb'))
-            elif net.analysis[0].lower() == '.ac':
-                N = int(len(net.tf_cmd.split()[1:]) / 2)
-                if N == 1:
-                    context.bot.send_photo(chat_id=update.message.chat_id,
-                                   photo=open('./users/bode_plot_' + str(update.message.chat_id) + '.png', 'rb'))
-                else:
-                    for k in range(N):
-                        context.bot.send_photo(chat_id=update.message.chat_id,
-                                       photo=open(
-                                           './users/bode_plot_' + str(update.message.chat_id) + '_' + str(k) + '.png',
-                                           'rb'))
-
-        else:    # otherwise print results
-            mex = 'Please remember that all components are analyzed with *passive sign convention*.\nHere you have  ' \
-                  '*the circuit solution*.\n\n' + mex
-            context.bot.send_message(chat_id=update.message.chat_id, text=mex,
-                             parse_mode=telegram.ParseMode.MARKDOWN)
+        sol = get_solution(fname, update, context)
+        send_solution(sol, update, context)
 
     else:    # ironic answer if the user send a random mesage to the Bot
         update.message.reply_text("Come on! We are here to solve circuits and not to chat! 😀\n"
@@ -532,39 +885,13 @@ def complex_repr(update, context):
     :return: None
     """
 
-    if os.path.exists('./users/' + str(update.message.chat_id) + '.cnf'):
-        # get configurations
-        fname = './users/' + str(update.message.chat_id) + '.cnf'
-        fid = open(fname, 'r')
-        flag = fid.readline()[:-1]  # read nodal_pot conf
-        nodal_pot = flag == 'True'
-        flag = fid.readline()[:-1]  # read polar conf
-        polar = flag == 'True'
-        flag = fid.readline()  # read dB conf
-        dB = flag == 'True'
-
-        # keep nodal pot and toggle polar
-        fname = './users/' + str(update.message.chat_id) + '.cnf'
-        fid = open(fname, 'w')
-        fid.write(str(nodal_pot) + '\n')
-        fid.write(str(not polar) + '\n')
-        fid.write(str(dB))
-        fid.close()
-    else:
-        polar = False
-        # Initialize config file with polar = True (everything else False)
-        fname = './users/' + str(update.message.chat_id) + '.cnf'
-        fid = open(fname, 'w')
-        fid.write('False\n')  # this is for the node potential
-        fid.write(str(not polar) + '\n')  # this is for the polar flag
-        fid.write('False')  # this is for the decibel flag
-        fid.close()
+    settings = settings_store.toggle(update.message.chat_id, 'polar')
 
     # notify user
-    if polar:
-        context.bot.send_message(chat_id=update.message.chat_id, text="Switched to cartesian representation")
-    else:
+    if settings.polar:
         context.bot.send_message(chat_id=update.message.chat_id, text="Switched to polar representation")
+    else:
+        context.bot.send_message(chat_id=update.message.chat_id, text="Switched to cartesian representation")
 
 
 # =========================================
@@ -580,40 +907,13 @@ def nodal_pot(update, context):
     :return: None
     """
 
-    if os.path.exists('./users/' + str(update.message.chat_id) + '.cnf'):
-        # get configurations
-        fname = './users/' + str(update.message.chat_id) + '.cnf'
-        fid = open(fname, 'r')
-        flag = fid.readline()[:-1]  # read nodal_pot conf
-        nodal_pot = flag == 'True'
-        flag = fid.readline()[:-1]  # read polar conf
-        polar = flag == 'True'
-        flag = fid.readline()  # read dB conf
-        dB = flag == 'True'
-
-        # switch nodal pot keep polar
-        fname = './users/' + str(update.message.chat_id) + '.cnf'
-        fid = open(fname, 'w')
-        fid.write(str(not nodal_pot) + '\n')
-        fid.write(str(polar) + '\n')
-        fid.write(str(dB))
-        fid.close()
-    else:
-        nodal_pot = False
-
-        # Initialize config file with nodal_pot = True (everything else False)
-        fname = './users/' + str(update.message.chat_id) + '.cnf'
-        fid = open(fname, 'w')
-        fid.write(str(not nodal_pot) + '\n')   # this is for the node potential
-        fid.write('False\n')   # this is for the polar flag
-        fid.write('False')  # this is for the decibel flag
-        fid.close()
+    settings = settings_store.toggle(update.message.chat_id, 'nodal_pot')
 
     # notify user
-    if nodal_pot:
-        context.bot.send_message(chat_id=update.message.chat_id, text="Node potentials removed from results")
-    else:
+    if settings.nodal_pot:
         context.bot.send_message(chat_id=update.message.chat_id, text="Node potentials included in results")
+    else:
+        context.bot.send_message(chat_id=update.message.chat_id, text="Node potentials removed from results")
 
 
 # =========================================
@@ -629,40 +929,35 @@ def decibel(update, context):
     :return: None
     """
 
-    if os.path.exists('./users/' + str(update.message.chat_id) + '.cnf'):
-        # get configurations
-        fname = './users/' + str(update.message.chat_id) + '.cnf'
-        fid = open(fname, 'r')
-        flag = fid.readline()[:-1]  # read nodal_pot conf
-        nodal_pot = flag == 'True'
-        flag = fid.readline()[:-1]  # read polar conf
-        polar = flag == 'True'
-        flag = fid.readline()  # read dB conf
-        dB = flag == 'True'
-
-        # switch nodal pot keep polar
-        fname = './users/' + str(update.message.chat_id) + '.cnf'
-        fid = open(fname, 'w')
-        fid.write(str(nodal_pot) + '\n')
-        fid.write(str(polar) + '\n')
-        fid.write(str(not dB))
-        fid.close()
-    else:
-        dB = False
-
-        # Initialize config file with dB = True (everything else False)
-        fname = './users/' + str(update.message.chat_id) + '.cnf'
-        fid = open(fname, 'w')
-        fid.write('False\n')   # this is for the node potential
-        fid.write('False\n')   # this is for the polar flag
-        fid.write(str(not dB))  # this is for the decibel flag
-        fid.close()
+    settings = settings_store.toggle(update.message.chat_id, 'decibel')
 
     # notify user
-    if dB:
+    if settings.decibel:
+        context.bot.send_message(chat_id=update.message.chat_id, text="bode plot: decibel enabled")
+    else:
         context.bot.send_message(chat_id=update.message.chat_id, text="bode plot: decibel disabled")
+
+
+# =========================================
+# composite - toggle composite bode plot
+# =========================================
+@block_group
+def composite(update, context):
+    """
+    'composite' enable/disable a single image with the Bode plots of all transfer functions
+
+    :param update: bot update
+    :param context: CallbackContext
+    :return: None
+    """
+
+    settings = settings_store.toggle(update.message.chat_id, 'composite')
+
+    # notify user
+    if settings.composite:
+        context.bot.send_message(chat_id=update.message.chat_id, text="bode plot: all transfer functions in one image")
     else:
-        context.bot.send_message(chat_id=update.message.chat_id, text="bode plot: decibel enabled")
+        context.bot.send_message(chat_id=update.message.chat_id, text="bode plot: one image for each transfer function")
 
 
 # =========================================
@@ -672,153 +967,250 @@ def decibel(update, context):
 @restricted
 def log(update, context):
     """
-    'log' sends log files in the chat
+    'log' sends log files in the chat. Rotated logs are sent too with '/log all'
 
     :param update: bot update
     :param context: CallbackContext
     :return: None
     """
+    send_all = bool(context.args) and (context.args[0].lower() == 'all')
+
+    for logfile in ('./SolverLog.log', './OtherLog.log'):
+        segments = log_segments(logfile)
+        if not send_all:
+            segments = segments[:1]
 
-    context.bot.send_document(chat_id=update.message.chat_id, document=open('./SolverLog.log', 'rb'))
-    context.bot.send_document(chat_id=update.message.chat_id, document=open('./OtherLog.log', 'rb'))
+        for fname in segments:
+            with open(fname, 'rb') as fid:
+                context.bot.send_document(chat_id=update.message.chat_id, document=fid)
 
 
 # =========================================
-# stat - get stat
+# metrics - get metrics
 # =========================================
 @block_group
 @restricted
-def stat(update, context):
+def get_metrics(update, context):
     """
-    'stat' computes statistical information about the bot use
+    'get_metrics' sends the metrics of the bot (Prometheus text format) as a file
 
     :param update: bot update
     :param context: CallbackContext
     :return: None
     """
-    context.bot.send_document(chat_id=update.message.chat_id, document=open('./StatBot.log', 'rb'))
+    context.bot.send_document(chat_id=update.message.chat_id, document=io.BytesIO(metrics.expose().encode('utf-8')),
+                              filename='metrics.txt')
 
-    # initialize list
-    analysis = []
-    user = []
 
-    fid = open('./admin_only/admin_list.txt', 'r')
-    ADMIN_LIST = [int(adm) for adm in fid.readline().split()]
-    fid.close()
+# =========================================
+# profile - solve a netlist under cProfile
+# =========================================
+@block_group
+@restricted
+def profile(update, context):
+    """
+    'profile' solves a netlist under cProfile and sends the hotspots and the full profile:
+        * /profile: the next netlist sent to the bot
+        * /profile last: the last netlist sent to the bot
+        * /profile followed by a netlist (from the second line of the message)
 
-    with open('./StatBot.log') as fid:
-        for line in fid:
-            ele = line.split(' - ')
+    :param update: bot update
+    :param context: CallbackContext
+    :return: None
+    """
+    usage = "Usage: `/profile [last]` or `/profile` followed by a netlist (new line)."
 
-            if int(ele[-1].replace('UserID: ','')) not in ADMIN_LIST:
-                analysis.append(ele[3].replace('Analysis: ', '').lower())
-                user.append(int(ele[4].replace('UserID: ', '')))
+    fname = './users/' + str(update.message.chat_id) + '.txt'
+    netlist = update.message.text.partition('\n')[2].strip()
+    if netlist:
+        netlist += '\n'
 
-    # convert to numpy array
-    analysis = np.array(analysis)
-    user = np.array(user)
+    elif not context.args:
+        profile_next.add(update.message.chat_id)
+        context.bot.send_message(chat_id=update.message.chat_id, text="The next netlist you send will be profiled.")
+        return
 
-    # percentages
-    x = []
-    labels = '.op', '.ac', '.tran'
-    x.append(np.sum(analysis == labels[0]))
-    x.append(np.sum(analysis == labels[1]))
-    x.append(np.sum(analysis == labels[2]))
+    elif (len(context.args) == 1) and (context.args[0].lower() == 'last') and os.path.exists(fname):
+        with open(fname) as f:
+            netlist = f.read()
 
-    # create mex
-    mex = ''
-    mex += '*# of Users*: {}\n'.format(np.unique(user).size)
-    mex += '*# of Analyses*: {}\n'.format(analysis.size)
-    mex += '    *.op*: {:.2f} %\n'.format(x[0]/np.sum(x)*100)
-    mex += '    *.ac*: {:.2f} %\n'.format(x[1] / np.sum(x) * 100)
-    mex += '    *.tran*: {:.2f} %\n'.format(x[2] / np.sum(x) * 100)
+    else:
+        context.bot.send_message(chat_id=update.message.chat_id, text=usage,
+                                 parse_mode=telegram.ParseMode.MARKDOWN)
+        return
 
-    context.bot.send_message(chat_id=update.message.chat_id, text=mex,
-                     parse_mode=telegram.ParseMode.MARKDOWN)
+    sol = profile_solution(netlist, update, context)
+    send_solution(sol, update, context)
 
 
 # =========================================
-# send2all - send message to all users
+# stat - get stat
 # =========================================
 @block_group
 @restricted
-def send2all(update, context):
+def stat(update, context):
     """
-    'send2all' sends a message to all users
+    'stat' provides statistical information about the bot use.
+    A time window can be provided: /stat 24h, /stat 7d or /stat 30d
 
     :param update: bot update
     :param context: CallbackContext
     :return: None
     """
+    # get time window (if any)
+    window = context.args[0].lower() if context.args else None
+    if (window is not None) and (window not in WINDOWS):
+        context.bot.send_message(chat_id=update.message.chat_id,
+                                 text="Usage: /stat [" + "|".join(WINDOWS) + "]")
+        return
+
+    if os.path.exists('./StatBot.log'):
+        with open('./StatBot.log', 'rb') as fid:
+            context.bot.send_document(chat_id=update.message.chat_id, document=fid)
+
+    # get aggregates
+    stats = usage_stats.query(window)
+    labels = '.op', '.ac', '.tran'
+    x = [stats['analysis'][label] for label in labels]
+    total = max(sum(x), 1)
 
-    # read all users from StatBot.log
-    user = []
-    with open('./StatBot.log') as fid:
-        for line in fid:
-            ele = line.split(' - ')
-            user.append(int(ele[4].replace('UserID: ', '')))
-
-    # convert to numpy array
-    user = np.unique(np.array(user))
-
-    # merge them with the user database
-    if os.path.exists('./users/users_database.db'):
-        user_db = []
-        with open('./users/users_database.db', 'r') as fid:
-            for line in fid:
-                user_db.append(int(line))
-
-        user_db = np.unique(np.array(user_db))
-        user = np.unique(np.concatenate((user, user_db)))
-        np.savetxt('./users/users_database.db', user, fmt="%s")
-    else:
-        np.savetxt('./users/users_database.db', user, fmt="%s")
-
-    # get the message to be sent
-    fid = open('./admin_only/message.txt')
-    msg = fid.read()
-    fid.close()
+    # create mex
+    mex = ''
+    if window is not None:
+        mex += '*Last {}*\n'.format(window)
+    mex += '*# of Users*: {}\n'.format(stats['users'])
+    mex += '*# of Analyses*: {}\n'.format(sum(x))
+    mex += '    *.op*: {:.2f} %\n'.format(x[0] / total * 100)
+    mex += '    *.ac*: {:.2f} %\n'.format(x[1] / total * 100)
+    mex += '    *.tran*: {:.2f} %\n'.format(x[2] / total * 100)
+
+    # result cache
+    cache = result_cache.stats()
+    mex += '*Result cache*: {} hits, {} misses\n'.format(cache['hits'], cache['misses'])
+    mex += '    {} solutions ({:.1f} MB)\n'.format(cache['entries'], cache['bytes'] / 2**20)
+    mex += '    {} identical netlists joined a running solve\n'.format(in_flight.coalesced)
+
+    # rendering time of the last plots
+    times = sorted(render_times)
+    if times:
+        mex += '*Render time* (last {} plots): median {:.0f} ms, 95% {:.0f} ms\n'.format(
+            len(times), 1000 * times[len(times) // 2], 1000 * times[int(0.95 * (len(times) - 1))])
+
+    # startup of the last (re)start
+    if startup_times:
+        mex += '*Startup*: ' + ', '.join('{} {:.2f} s'.format(stage, startup_times[stage])
+                                         for stage in ('front-end', 'workers') if stage in startup_times) + '\n'
 
-    # send to all user
-    cnt_sent = 0
-    cnt_not_sent = 0
-    for id in user:
-        chat_id = int(id)
-        # try to send the message
-        try:
-            context.bot.send_message(chat_id=chat_id,
-                             text=msg,
-                             parse_mode=telegram.ParseMode.MARKDOWN, disable_web_page_preview=True)
-            cnt_sent += 1
+    context.bot.send_message(chat_id=update.message.chat_id, text=mex,
+                     parse_mode=telegram.ParseMode.MARKDOWN)
 
-        # if the user closed the bot, cacth exception and update cnt_not_sent
-        except telegram.error.TelegramError:
-            cnt_not_sent += 1
 
-    # print on screen
-    msg = "*{} users* notified with the above message.\n".format(cnt_sent)
-    msg += "*{} users* not notified (bot is inactive).".format(cnt_not_sent)
+# =========================================
+# send2all - send message to all users
+# =========================================
+def notify_admins(bot, msg, parse_mode=telegram.ParseMode.MARKDOWN):
+    """
+    'notify_admins' sends a message to all admins
 
+    :param bot: telegram bot
+    :param msg: message
+    :param parse_mode: parse mode of the message (None: plain text)
+    :return: None
+    """
     # get admin list
     fid = open('./admin_only/admin_list.txt', 'r')
     ADMIN_LIST = [int(adm) for adm in fid.readline().split()]
     fid.close()
 
-    # send to all admins stat about message sent
     for id in ADMIN_LIST:
         chat_id = int(id)
 
         # try to send the message
         try:
-            context.bot.send_message(chat_id=chat_id,
-                             text=msg,
-                             parse_mode=telegram.ParseMode.MARKDOWN, disable_web_page_preview=True)
+            bot.send_message(chat_id=chat_id, text=msg, parse_mode=parse_mode, disable_web_page_preview=True)
 
         # if the admin closed the bot don't care about the exception
         except telegram.error.TelegramError:
             pass
 
 
+def broadcast_progress(bot, sent, not_sent, total, finished):
+    """
+    'broadcast_progress' sends to all admins the progress of the broadcast
+
+    :param bot: telegram bot
+    :param sent: number of users notified
+    :param not_sent: number of users not notified
+    :param total: number of users
+    :param finished: True when the broadcast is completed
+    :return: None
+    """
+    if finished:
+        msg = "*{} users* notified with the above message.\n".format(sent)
+        msg += "*{} users* not notified (bot is inactive).".format(not_sent)
+    else:
+        msg = "Broadcast in progress: *{}/{}* users done.\n".format(sent + not_sent, total)
+        msg += "*{} users* notified, *{} users* not notified.".format(sent, not_sent)
+
+    # send to all admins stat about message sent
+    notify_admins(bot, msg)
+
+
+def broadcast_abort(bot, error):
+    """
+    'broadcast_abort' tells all admins that the broadcast has been aborted because of the message
+    (e.g. malformed markdown in message.txt). Users are not marked unreachable.
+
+    :param bot: telegram bot
+    :param error: error returned by Telegram
+    :return: None
+    """
+    msg = "Broadcast aborted: Telegram rejected the message ({}).\n".format(error)
+    msg += "Please fix admin_only/message.txt and run /send2all again."
+
+    # plain text: the error may include markdown characters
+    notify_admins(bot, msg, parse_mode=None)
+
+
+@block_group
+@restricted
+def send2all(update, context):
+    """
+    'send2all' sends a message to all users. The message is sent in background
+    and admins receive progress reports.
+
+    :param update: bot update
+    :param context: CallbackContext
+    :return: None
+    """
+    global broadcast_job
+
+    # only one broadcast at a time
+    if (broadcast_job is not None) and broadcast_job.is_running():
+        sent, not_sent, total = broadcast_job.counters()
+        context.bot.send_message(chat_id=update.message.chat_id,
+                                 text="A broadcast is already running ({}/{} users done).".format(sent + not_sent,
+                                                                                                  total))
+        return
+
+    # all users (skip users that closed the bot)
+    user = user_registry.reachable_users()
+
+    # get the message to be sent
+    fid = open('./admin_only/message.txt')
+    msg = fid.read()
+    fid.close()
+
+    # send to all users in background
+    broadcast_job = Broadcast(context.bot, user, msg, BROADCAST_CHECKPOINT, workers=BROADCAST_WORKERS,
+                              on_progress=partial(broadcast_progress, context.bot),
+                              on_abort=partial(broadcast_abort, context.bot),
+                              on_result=user_registry.set_reachable)
+    broadcast_job.start()
+    context.bot.send_message(chat_id=update.message.chat_id,
+                             text="Broadcast started: {} users.".format(len(user)))
+
+
 # =========================================
 # send2admin - send message to all admins
 # =========================================
@@ -899,10 +1291,10 @@ def who(update, context):
             context.bot.send_message(chat_id=admin_id, text=msg)
             if photo:
                 file = context.bot.getFile(chat.photo.small_file_id)
-                fname = './users/propic.png'
-                file.download(fname)
-                context.bot.send_photo(chat_id=admin_id, photo=open('./users/propic.png', 'rb'))
-                os.remove('./users/propic.png')    
+                propic = io.BytesIO()
+                file.download(out=propic)
+                propic.seek(0)
+                context.bot.send_photo(chat_id=admin_id, photo=propic)
             
 
     # send message when user if not found
@@ -930,24 +1322,99 @@ def unknown(update, context):
 # =========================================
 # bot - main
 # =========================================
+def parse_args():
+    """
+    'parse_args' reads the command line options
+
+    :return: options
+    """
+    parser = argparse.ArgumentParser(description='SpicePy Telegram bot')
+    parser.add_argument('--webhook', metavar='URL', default=None,
+                        help='public URL of the webhook (default: long polling)')
+    parser.add_argument('--listen', default='0.0.0.0', help='address of the webhook server')
+    parser.add_argument('--port', type=int, default=8443, help='port of the webhook server')
+    parser.add_argument('--api-url', default=None,
+                        help='Bot API base URL (e.g. a local fake Telegram API for tests)')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='port of the metrics endpoint /metrics (default: disabled)')
+    parser.add_argument('--metrics-listen', default='127.0.0.1', help='address of the metrics endpoint')
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+
+    # start the solver workers (they warm up in background)
+    solver_pool.start()
+    scheduler.start()
+
+    # load the result cache in background (solutions not loaded yet are just computed again)
+    cache_loader = Thread(target=result_cache.load, name='CacheLoader', daemon=True)
+    cache_loader.start()
+
+    # import settings from old cnf files (if any)
+    settings_store.import_cnf('./users')
+
+    # users waiting for a netlist (saved on restart and old marker files)
+    pending_netlists.load()
+    pending_netlists.import_markers('./users')
+
+    # statistics: last checkpoint and new lines of StatBot.log
+    usage_stats.load('./StatBot.log')
+
+    # user registry (all users found in StatBot.log are added, admins too)
+    user_registry.load()
+    user_registry.merge(usage_stats.all_users())
+
     # set TOKEN and initialization
     fname = './admin_only/SpicePyBot_token.txt'
-    updater = Updater(token=read_token(fname), use_context=True)
+    updater = Updater(token=read_token(fname), use_context=True, workers=BOT_WORKERS, base_url=args.api_url)
     dispatcher = updater.dispatcher
 
+    # metrics endpoint (local by default)
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = MetricsServer(metrics, args.metrics_listen, args.metrics_port)
+        metrics_server.start()
+
+    # webhook mode: updates are received by an asyncio HTTP server and put in the dispatcher queue
+    webhook = None
+    if args.webhook is not None:
+        webhook = WebhookServer(args.listen, args.port, urlparse(args.webhook).path or '/', on_update=None,
+                                secret_token=secrets.token_urlsafe(32))
+
     # restart - restart the BOT
     # -------------------------
-    def stop_and_restart():
+    def stop_and_restart(chat_id):
         """Gracefully stop the Updater and replace the current process with a new one"""
-        updater.stop()
+        stop_time = time.time()
+        if webhook is not None:
+            webhook.stop()
+
+        # same as updater.stop() without waiting for the pending long poll (getUpdates): the updates
+        # it receives are ignored by the stopped Updater and Telegram sends them to the new process
+        updater.job_queue.stop()
+        updater.running = False
+        updater.dispatcher.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        scheduler.stop()
+        solver_pool.stop()
+        cache_loader.join()
+        result_cache.save()
+        pending_netlists.save()
+        usage_stats.save('./StatBot.log')
+        log_listener.stop()
+
+        # the new process reports the downtime to the admin
+        os.environ[RESTART_ENV] = '{} {}'.format(chat_id, stop_time)
         os.execl(sys.executable, sys.executable, *sys.argv)
 
     @block_group
     @restricted
     def restart(update, context):
         update.message.reply_text('Bot is restarting...')
-        Thread(target=stop_and_restart).start()
+        Thread(target=stop_and_restart, args=(update.message.chat_id,)).start()
 
     # /r - restart the bot
     dispatcher.add_handler(CommandHandler('r', restart))
@@ -957,7 +1424,8 @@ def main():
     dispatcher.add_handler(start_handler)
 
     # catch netlist when sent to the BOT
-    dispatcher.add_handler(MessageHandler(Filters.document, catch_netlist))
+    # (run_async: the handler waits for the solver pool without blocking the dispatcher)
+    dispatcher.add_handler(MessageHandler(Filters.document, catch_netlist, run_async=True))
 
     # /help handler
     help_handler = CommandHandler('help', help)
@@ -967,6 +1435,12 @@ def main():
     netlist_handler = CommandHandler('netlist', netlist)
     dispatcher.add_handler(netlist_handler)
 
+    # /sweep - solve the last netlist for many values of an element
+    dispatcher.add_handler(CommandHandler('sweep', sweep, run_async=True))
+
+    # /export handler
+    dispatcher.add_handler(CommandHandler('export', export, run_async=True))
+
     # /complex_repr handler
     complex_repr_handler = CommandHandler('complex_repr', complex_repr)
     dispatcher.add_handler(complex_repr_handler)
@@ -979,9 +1453,18 @@ def main():
     decibel_handler = CommandHandler('decibel', decibel)
     dispatcher.add_handler(decibel_handler)
 
+    # /composite handler
+    dispatcher.add_handler(CommandHandler('composite', composite))
+
     # /log - get log file
     dispatcher.add_handler(CommandHandler('log', log))
 
+    # /metrics - get metrics (Prometheus text format)
+    dispatcher.add_handler(CommandHandler('metrics', get_metrics))
+
+    # /profile - solve a netlist under cProfile
+    dispatcher.add_handler(CommandHandler('profile', profile, run_async=True))
+
     # /stat - get stat file
     dispatcher.add_handler(CommandHandler('stat', stat))
 
@@ -999,19 +1482,67 @@ def main():
     dispatcher.add_handler(unknown_handler)
 
     # reply to random message or get netlist after /netlist
-    reply_handler = MessageHandler(Filters.text, reply)
+    reply_handler = MessageHandler(Filters.text, reply, run_async=True)
     dispatcher.add_handler(reply_handler)
 
     # log every uncaught error with error handler
     dispatcher.add_error_handler(error_callback)
 
+    # resume the broadcast interrupted by a restart (if any)
+    global broadcast_job
+    broadcast_job = Broadcast.resume(updater.bot, BROADCAST_CHECKPOINT, workers=BROADCAST_WORKERS,
+                                     on_progress=partial(broadcast_progress, updater.bot),
+                                     on_abort=partial(broadcast_abort, updater.bot),
+                                     on_result=user_registry.set_reachable)
+    if broadcast_job is not None:
+        broadcast_job.start()
+
+    # remove expired entries of users waiting for a netlist
+    updater.job_queue.run_repeating(lambda context: pending_netlists.sweep(), interval=PENDING_SWEEP)
+
+    # checkpoint of the statistics
+    updater.job_queue.run_repeating(lambda context: usage_stats.save('./StatBot.log'), interval=STATS_CHECKPOINT)
+
     # start the BOT
-    updater.start_polling()
+    if webhook is None:
+        updater.start_polling()
+    else:
+        start_webhook(updater, webhook)
+        updater.bot.set_webhook(url=args.webhook, secret_token=webhook.secret_token)
+
+    startup_times['front-end'] = time.perf_counter() - START_TIME
+    print("SpicePyBot: front-end started in {:.2f} s".format(startup_times['front-end']))
+
+    # restarted with /r: report the downtime to the admin
+    restart_info = os.environ.pop(RESTART_ENV, None)
+    if restart_info is not None:
+        chat_id, stop_time = restart_info.split()
+        mex = "Bot restarted: {:.1f} s without updates (startup {:.2f} s).".format(time.time() - float(stop_time),
+                                                                                 startup_times['front-end'])
+        try:
+            updater.bot.send_message(chat_id=int(chat_id), text=mex)
+        except telegram.error.TelegramError:
+            pass
+
     # Block until you press Ctrl-C or the process receives SIGINT, SIGTERM or
     # SIGABRT. This should be used most of the time, since start_polling() is
     # non-blocking and will stop the bot gracefully.
     updater.idle()
 
+    if webhook is not None:
+        webhook.stop()
+    if metrics_server is not None:
+        metrics_server.stop()
+
+    # stop the solver workers and save the result cache
+    scheduler.stop()
+    solver_pool.stop()
+    cache_loader.join()
+    result_cache.save()
+    pending_netlists.save()
+    usage_stats.save('./StatBot.log')
+    log_listener.stop()
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,223 @@
+# ======================
+# general python modules
+# ======================
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ==========================
+# python-temegam-bot modules
+# ==========================
+import telegram as telegram
+
+from botlib.ratelimit import TokenBucket
+
+# Telegram limits: about 30 messages per second overall, 1 message per second in the same chat
+GLOBAL_RATE = 25
+CHAT_INTERVAL = 1.0
+
+
+class BroadcastAborted(Exception):
+    """
+    'BroadcastAborted' is raised when the message cannot be sent to any chat (e.g. malformed markdown)
+    """
+    pass
+
+
+class Broadcast(object):
+    """
+    'Broadcast' sends a message to many chats in a background thread, with bounded
+    concurrency and Telegram rate limits. Progress is saved on a checkpoint file so that
+    an interrupted broadcast can be resumed (see 'resume').
+    """
+
+    def __init__(self, bot, chat_ids, text, checkpoint, workers=8, rate=GLOBAL_RATE,
+                 on_progress=None, progress_interval=30, on_result=None, on_abort=None):
+        """
+        :param bot: telegram bot
+        :param chat_ids: recipients
+        :param text: message (markdown)
+        :param checkpoint: json file with the progress
+        :param workers: number of concurrent senders
+        :param rate: maximum number of messages per second
+        :param on_progress: function called as on_progress(sent, not_sent, total, finished)
+        :param progress_interval: seconds between two calls of on_progress
+        :param on_result: function called as on_result(chat_id, reachable) when a chat is
+                          known to be reachable (message sent) or not (e.g. bot blocked)
+        :param on_abort: function called as on_abort(error) when the broadcast is aborted
+                         because the message itself is invalid (see BroadcastAborted)
+        """
+        self.bot = bot
+        self.chat_ids = [int(chat_id) for chat_id in chat_ids]
+        self.text = text
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.on_result = on_result
+        self.on_abort = on_abort
+        self.error = None    # set when the broadcast is aborted
+        self.done = {}    # chat_id --> True (sent) / False (unreachable)
+        self.failed = set()    # chats not reached after several attempts (retried by 'resume')
+        self._bucket = TokenBucket(rate)
+        self._last_sent = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @classmethod
+    def resume(cls, bot, checkpoint, **kwargs):
+        """
+        'resume' creates a broadcast from a checkpoint file
+
+        :param bot: telegram bot
+        :param checkpoint: json file with the progress
+        :param kwargs: other arguments of Broadcast
+        :return: Broadcast (None if the checkpoint does not exist)
+        """
+        if not os.path.exists(checkpoint):
+            return None
+
+        with open(checkpoint) as fid:
+            data = json.load(fid)
+
+        job = cls(bot, data['chat_ids'], data['text'], checkpoint, **kwargs)
+        job.done = {int(chat_id): sent for chat_id, sent in data['done'].items() if sent is not None}
+        return job
+
+    def start(self):
+        """
+        'start' runs the broadcast in a background thread
+
+        :return: None
+        """
+        self._save()
+        self._thread = threading.Thread(target=self._run, name='Broadcast', daemon=True)
+        self._thread.start()
+
+    def is_running(self):
+        """
+        'is_running' checks if the broadcast is running
+
+        :return: True/False
+        """
+        return (self._thread is not None) and self._thread.is_alive()
+
+    def counters(self):
+        """
+        'counters' provides the progress of the broadcast
+
+        :return: sent, not sent, total
+        """
+        with self._lock:
+            sent = sum(1 for ok in self.done.values() if ok is True)
+            return sent, len(self.done) - sent + len(self.failed), len(self.chat_ids)
+
+    def _save(self):
+        """
+        '_save' writes the checkpoint file
+
+        :return: None
+        """
+        with self._lock:
+            data = {'text': self.text, 'chat_ids': self.chat_ids,
+                    'done': {str(chat_id): sent for chat_id, sent in self.done.items()}}
+
+        with open(self.checkpoint + '.tmp', 'w') as fid:
+            json.dump(data, fid)
+        os.replace(self.checkpoint + '.tmp', self.checkpoint)
+
+    def _send(self, chat_id):
+        """
+        '_send' sends the message to a chat (retrying after RetryAfter and network errors)
+
+        :param chat_id: chat id
+        :return: True if the message has been sent, False if the chat cannot be reached
+                 and None if the message has not been sent (e.g. after several attempts)
+        :raise: BroadcastAborted if the message cannot be sent to any chat
+        """
+        for attempt in range(5):
+            # per-chat limit
+            with self._lock:
+                wait = self._last_sent.get(chat_id, 0) + CHAT_INTERVAL - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            # global limit
+            self._bucket.acquire()
+            with self._lock:
+                self._last_sent[chat_id] = time.monotonic()
+
+            try:
+                self.bot.send_message(chat_id=chat_id, text=self.text,
+                                      parse_mode=telegram.ParseMode.MARKDOWN, disable_web_page_preview=True)
+                return True
+            except telegram.error.RetryAfter as e:
+                # flood limit: all senders wait
+                self._bucket.pause(e.retry_after)
+            except telegram.error.Unauthorized:
+                # the user closed the bot
+                return False
+            except telegram.error.BadRequest as e:
+                if 'chat not found' in e.message.lower():
+                    return False
+                if "can't parse entities" in e.message.lower():
+                    # the same error for all chats: no user is marked unreachable
+                    raise BroadcastAborted(e.message)
+                return None
+            except telegram.error.NetworkError:
+                time.sleep(2 ** attempt)
+            except telegram.error.TelegramError:
+                return None
+
+        return None
+
+    def _run(self):
+        """
+        '_run' sends the message to all chats not yet done
+
+        :return: None
+        """
+        todo = [chat_id for chat_id in self.chat_ids if chat_id not in self.done]
+        last_report = [time.monotonic()]
+
+        def task(chat_id):
+            if self.error is not None:
+                return
+            try:
+                sent = self._send(chat_id)
+            except BroadcastAborted as e:
+                self.error = str(e)
+                return
+            # chats not reached are not in the checkpoint: they are retried by 'resume'
+            with self._lock:
+                if sent is None:
+                    self.failed.add(chat_id)
+                else:
+                    self.done[chat_id] = sent
+            if (self.on_result is not None) and (sent is not None):
+                self.on_result(chat_id, sent)
+
+            # checkpoint and progress report
+            report = False
+            with self._lock:
+                if time.monotonic() - last_report[0] >= self.progress_interval:
+                    last_report[0] = time.monotonic()
+                    report = True
+            if report:
+                self._save()
+                if self.on_progress is not None:
+                    self.on_progress(*self.counters(), False)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(task, todo))
+
+        # broadcast completed (or aborted: the message must be fixed): remove checkpoint
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        if self.error is not None:
+            if self.on_abort is not None:
+                self.on_abort(self.error)
+        elif self.on_progress is not None:
+            self.on_progress(*self.counters(), True)
@@ -0,0 +1,300 @@
+# ======================
+# general python modules
+# ======================
+import os
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# initial letter of all components read by SpicePy
+COMPONENTS = ('V', 'I', 'R', 'C', 'L', 'E', 'F', 'G', 'H')
+
+
+def normalize_netlist(netlist):
+    """
+    'normalize_netlist' provides a canonical form of a netlist. Only lines read by SpicePy
+    are kept (comments and unknown lines are removed) and whitespaces are collapsed.
+
+    :param netlist: string with the netlist
+    :return: list of normalized lines
+    """
+    lines = []
+    for line in netlist.split('\n'):
+        # remove inline comments
+        if ';' in line:
+            line = line[:line.index(';')]
+
+        # SpicePy reads only components and commands (starting at the first character)
+        if (line == '') or ((line[0].upper() not in COMPONENTS) and (line[0] != '.')):
+            continue
+
+        lines.append(' '.join(line.split()))
+
+        # SpicePy stops at .end
+        if (line[0] == '.') and (line.lower().find('.end') != -1):
+            break
+
+    return lines
+
+
+def netlist_key(netlist, nodal_pot=False, polar=False, dB=False, composite=False):
+    """
+    'netlist_key' computes the cache key of a netlist: hash of the normalized netlist and
+    of the user flags that change the result of its analysis
+
+    :param netlist: string with the netlist
+    :param nodal_pot: node potential flag
+    :param polar: polar flag
+    :param dB: decibel flag
+    :param composite: composite bode plot flag
+    :return: string with the key
+    """
+    lines = normalize_netlist(netlist)
+
+    # get the analysis type (the last command that is not .plot/.tf/.backanno/.end)
+    analysis = ''
+    for line in lines:
+        if (line[0] == '.') and (line.split()[0].lower() not in ('.plot', '.tf', '.backanno', '.end')):
+            analysis = line.split()[0].lower()
+
+    # keep only flags used by the analysis
+    if analysis == '.op':
+        flags = (nodal_pot,)
+    elif analysis == '.ac':
+        flags = (nodal_pot, polar, dB) + ((True,) if composite else ())
+    else:
+        flags = ()
+
+    text = '\n'.join(lines) + '\n' + repr(flags)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _sizeof(sol):
+    """
+    '_sizeof' estimates the memory used by a solution (text, plots and exported files)
+
+    :param sol: solution (see botlib.solver.solve)
+    :return: size in bytes
+    """
+    size = len(sol['mex'] or '')
+    size += sum(len(mex) for mex in sol['notes'])
+    size += sum(len(plot) for plot in sol['plots'])
+    size += sum(len(data) for filename, data in sol.get('files', []))
+    return size
+
+
+class CancelledJob(Exception):
+    """
+    'CancelledJob' is raised to the requests waiting for a cancelled job
+    """
+    pass
+
+
+class RetryJob(Exception):
+    """
+    'RetryJob' is raised to the requests waiting for a job that the leader did not submit:
+    they must acquire the key again (see SingleFlight.release)
+    """
+    pass
+
+
+class ResultCache(object):
+    """
+    'ResultCache' is a LRU cache of solutions with a limit on the number of entries and on
+    the total size. It can be saved on file to survive restarts.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=100 * 2**20, filename=None):
+        """
+        :param max_entries: maximum number of solutions
+        :param max_bytes: maximum total size of the solutions (bytes)
+        :param filename: file used by save/load (None: not persistent)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        'get' provides a cached solution
+
+        :param key: key of the solution (see netlist_key)
+        :return: solution or None if it is not in the cache
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key][0]
+            else:
+                self.misses += 1
+                return None
+
+    def put(self, key, sol):
+        """
+        'put' adds a solution to the cache (least recently used solutions are evicted)
+
+        :param key: key of the solution (see netlist_key)
+        :param sol: solution
+        :return: None
+        """
+        size = _sizeof(sol)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._data.pop(key)[1]
+            self._data[key] = (sol, size)
+            self._bytes += size
+
+            while (len(self._data) > self.max_entries) or (self._bytes > self.max_bytes):
+                self._bytes -= self._data.popitem(last=False)[1][1]
+
+    def stats(self):
+        """
+        'stats' provides the cache counters
+
+        :return: dictionary with hits, misses, entries and bytes
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._data), 'bytes': self._bytes}
+
+    def save(self):
+        """
+        'save' writes the cache on file (if filename is set)
+
+        :return: None
+        """
+        if self.filename is None:
+            return
+
+        with self._lock:
+            items = [(key, sol) for key, (sol, size) in self._data.items()]
+
+        # write a new file and replace the old one (atomic)
+        with open(self.filename + '.tmp', 'wb') as fid:
+            pickle.dump(items, fid, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.filename + '.tmp', self.filename)
+
+    def load(self):
+        """
+        'load' reads the cache from file (if filename is set and the file exists)
+
+        :return: None
+        """
+        if (self.filename is None) or (not os.path.exists(self.filename)):
+            return
+
+        try:
+            with open(self.filename, 'rb') as fid:
+                items = pickle.load(fid)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return
+
+        for key, sol in items:
+            self.put(key, sol)
+
+
+class SingleFlight(object):
+    """
+    'SingleFlight' coalesces identical jobs: while a job with a given key is running,
+    later requests with the same key wait for the same result (or exception).
+    """
+
+    def __init__(self, on_result=None):
+        """
+        :param on_result: function called as on_result(key, result) when a job succeeds,
+                          before the key is released (e.g. ResultCache.put)
+        """
+        self.on_result = on_result
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """
+        'acquire' joins the job with the given key or registers a new one
+
+        :param key: job key (see netlist_key)
+        :return:
+            * future: Future shared by all requests with the same key
+            * leader: True if the caller must submit the job (see 'attach' and 'fail')
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._calls[key] = Future()
+            future.set_running_or_notify_cancel()
+            return future, True
+
+    def attach(self, key, job):
+        """
+        'attach' passes the outcome of the submitted job to all requests with the same key
+
+        :param key: job key
+        :param job: Future of the submitted job
+        :return: None
+        """
+        job.add_done_callback(lambda job: self._resolve(key, job))
+
+    def release(self, key):
+        """
+        'release' releases a key whose job was not submitted because of the limits of the leader
+        (e.g. the rate limit of its user): the waiting requests get RetryJob and acquire the key again
+
+        :param key: job key
+        :return: None
+        """
+        with self._lock:
+            future = self._calls.pop(key)
+        future.set_exception(RetryJob("job not submitted by the leader"))
+
+    def fail(self, key, exception):
+        """
+        'fail' releases a key whose job could not be submitted
+
+        :param key: job key
+        :param exception: exception passed to the waiting requests
+        :return: None
+        """
+        with self._lock:
+            future = self._calls.pop(key)
+        future.set_exception(exception)
+
+    def in_flight(self):
+        """
+        'in_flight' provides the number of distinct jobs running
+
+        :return: number of keys
+        """
+        return len(self._calls)
+
+    def _resolve(self, key, job):
+        """
+        '_resolve' stores the result of a job and wakes up the waiting requests
+
+        :param key: job key
+        :param job: completed Future
+        :return: None
+        """
+        exception = job.exception() if not job.cancelled() else CancelledJob("job cancelled")
+        if (exception is None) and (self.on_result is not None):
+            self.on_result(key, job.result())
+
+        with self._lock:
+            future = self._calls.pop(key)
+
+        if exception is None:
+            future.set_result(job.result())
+        else:
+            future.set_exception(exception)
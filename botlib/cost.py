@@ -0,0 +1,139 @@
+# ======================
+# general python modules
+# ======================
+import numpy as np
+
+from botlib.engine import AC_DENSE_MAX
+from botlib.decimate import PLOT_WIDTH
+
+# CPU budget of a single job (s) when the bot is idle
+CPU_BUDGET = 10.0
+
+# minimum number of samples of a downscaled .tran/.ac analysis (below it the job is rejected)
+MIN_SAMPLES = 100
+
+# cost model (s) of the sparse engine (botlib.engine), measured on the bot hardware:
+#   * .tran: the matrix is factorized once, each time step costs
+#     STEP_COST + UNKNOWN_COST * unknowns + SOURCE_COST * sources (the stamps of inductors and
+#     capacitors only change the entries of the matrices: their number does not add to the cost)
+#   * .ac/.op: each frequency needs a factorization: SOLVE_COST + FACTOR_COST * unknowns
+#     (multi-frequency .ac of small networks are batched: BATCH_COST + DENSE_COST * unknowns**3)
+#   * render: each figure costs FIGURE_COST (BODE_COST for bode plots) + POINT_COST * points
+#     (transient waveforms are decimated: DECIMATE_COST * samples, at most 2 * PLOT_WIDTH points are drawn)
+#   * text solutions (.op and single-frequency .ac): branch quantities cost BRANCH_COST * elements**2
+#   * export (botlib.export): each exported value costs EXPORT_COST
+STEP_COST = 5e-5
+UNKNOWN_COST = 2e-7
+SOURCE_COST = 4e-5
+SOLVE_COST = 1.7e-4
+FACTOR_COST = 8e-7
+BATCH_COST = 3e-6
+DENSE_COST = 1e-9
+FIGURE_COST = 0.2
+BODE_COST = 0.3
+POINT_COST = 3e-6
+DECIMATE_COST = 2e-7
+BRANCH_COST = 4e-8
+EXPORT_COST = 5e-6
+
+# components that add a branch current to the unknowns
+BRANCH_UNKNOWNS = ('V', 'L', 'E', 'H')
+
+
+def count_samples(net):
+    """
+    'count_samples' provides the number of samples of the analysis
+    (for .ac analyses net.frequency_span() must be called before)
+
+    :param net: SpicePy network
+    :return: number of samples
+    """
+    analysis = net.analysis[0].lower()
+    if analysis == '.tran':
+        return int(float(net.convert_unit(net.analysis[2])) / float(net.convert_unit(net.analysis[1])))
+    elif analysis == '.ac':
+        return 1 if np.isscalar(net.f) else len(net.f)
+    else:
+        return 1
+
+
+def count_traces(net):
+    """
+    'count_traces' provides the number of figures and traces requested by .plot/.tf
+
+    :param net: SpicePy network
+    :return: number of figures, number of traces
+    """
+    analysis = net.analysis[0].lower()
+    if (analysis == '.tran') and (net.plot_cmd is not None):
+        return 1, len(net.plot_cmd.split()) - 1
+    elif (analysis == '.ac') and (not np.isscalar(net.f)) and (net.tf_cmd is not None):
+        # bode plots: magnitude and phase of each transfer function
+        n_tf = (len(net.tf_cmd.split()) - 1) // 2
+        return n_tf, 2 * n_tf
+    else:
+        return 0, 0
+
+
+def estimate(net, samples=None):
+    """
+    'estimate' predicts the CPU time needed to solve and render a network
+
+    :param net: SpicePy network
+    :param samples: number of samples (default: the one defined by the analysis)
+    :return: dictionary with the inputs of the model and the estimated 'solve', 'render' and 'total' time (s)
+    """
+    if samples is None:
+        samples = count_samples(net)
+    unknowns = net.node_num + sum(1 for name in net.names if name[0].upper() in BRANCH_UNKNOWNS)
+    elements = len(net.names)
+    sources = sum(1 for name in net.names if name[0].upper() in ('V', 'I'))
+    figures, traces = count_traces(net)
+    analysis = net.analysis[0].lower()
+
+    cost = {'unknowns': unknowns, 'elements': elements, 'sources': sources, 'samples': samples,
+            'figures': figures, 'traces': traces}
+    if analysis == '.tran':
+        # two factorizations: initial conditions and time step
+        cost['solve'] = 2 * (SOLVE_COST + FACTOR_COST * unknowns) + \
+            samples * (STEP_COST + UNKNOWN_COST * unknowns + SOURCE_COST * sources)
+    elif (analysis == '.ac') and (samples > 1) and (unknowns <= AC_DENSE_MAX):
+        cost['solve'] = samples * (BATCH_COST + DENSE_COST * unknowns ** 3)
+    else:
+        cost['solve'] = samples * (SOLVE_COST + FACTOR_COST * unknowns)
+    if (analysis == '.op') or ((analysis == '.ac') and np.isscalar(net.f)):
+        cost['render'] = BRANCH_COST * elements ** 2
+    elif analysis == '.tran':
+        cost['render'] = figures * FIGURE_COST + \
+            traces * (DECIMATE_COST * samples + POINT_COST * min(samples, 2 * PLOT_WIDTH))
+    else:
+        cost['render'] = figures * BODE_COST + traces * samples * POINT_COST
+    cost['total'] = cost['solve'] + cost['render']
+    return cost
+
+
+def plan(net, budget=CPU_BUDGET):
+    """
+    'plan' decides how a network is solved within a CPU budget
+
+    :param net: SpicePy network
+    :param budget: CPU budget (s)
+    :return:
+        * decision: 'admit', 'downscale' (fewer samples) or 'reject'
+        * samples: number of samples to be used
+        * cost: estimated cost (see 'estimate') with the samples to be used
+    """
+    cost = estimate(net)
+    if cost['total'] <= budget:
+        return 'admit', cost['samples'], cost
+
+    # only the number of samples of .tran and multi-frequency .ac analyses can be reduced
+    if cost['samples'] > MIN_SAMPLES:
+        # cost is linear in the number of samples
+        fixed = estimate(net, 0)['total']
+        per_sample = (cost['total'] - fixed) / cost['samples']
+        samples = int((budget - fixed) / per_sample)
+        if samples >= MIN_SAMPLES:
+            return 'downscale', samples, estimate(net, samples)
+
+    return 'reject', cost['samples'], cost
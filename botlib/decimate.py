@@ -0,0 +1,44 @@
+# ======================
+# general python modules
+# ======================
+import numpy as np
+
+# horizontal resolution of the plots (pixels): 6.4 in at 150 dpi
+PLOT_WIDTH = 960
+
+
+def minmax(y, buckets=PLOT_WIDTH):
+    """
+    'minmax' selects the samples of a waveform that are visible in a plot: the waveform is
+    split in 'buckets' (one for each pixel column) and, for each bucket, the minimum and the
+    maximum are kept. Peaks and fast transients are preserved exactly.
+
+    :param y: samples (1-D array)
+    :param buckets: number of buckets
+    :return: sorted indices of the selected samples (first and last sample are always included)
+    """
+    n = y.size
+    if n <= 2 * buckets:
+        return np.arange(n)
+
+    # buckets of equal size (the last one is padded with the last sample)
+    size = int(np.ceil(n / buckets))
+    padded = np.concatenate((y, np.full(buckets * size - n, y[-1])))
+    blocks = padded.reshape(buckets, size)
+
+    base = np.arange(buckets) * size
+    idx = np.concatenate(([0], base + blocks.argmin(axis=1), base + blocks.argmax(axis=1), [n - 1]))
+    return np.unique(np.minimum(idx, n - 1))
+
+
+def decimate(t, y, buckets=PLOT_WIDTH):
+    """
+    'decimate' reduces a waveform to the samples visible in a plot (see 'minmax')
+
+    :param t: time
+    :param y: samples
+    :param buckets: number of buckets
+    :return: decimated time and samples
+    """
+    idx = minmax(y, buckets)
+    return t[idx], y[idx]
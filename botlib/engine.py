@@ -0,0 +1,225 @@
+# ======================
+# general python modules
+# ======================
+from copy import deepcopy
+import numpy as np
+from scipy.sparse.linalg import splu, spsolve
+
+# ===================
+# module from SpicePy
+# ===================
+from spicepy.netsolve import net_solve
+import spicepy.transient_sources as tsr
+
+# multi-frequency .ac analyses of networks up to AC_DENSE_MAX unknowns are solved with
+# batched dense solves (chunks of at most AC_BATCH_BYTES bytes)
+AC_DENSE_MAX = 100
+AC_BATCH_BYTES = 64 * 2**20
+
+# numerical failures of the network itself (e.g. singular matrix): they are not solved again by SpicePy
+NUMERICAL_ERRORS = (np.linalg.LinAlgError, RuntimeError)
+
+
+def dc_solve(net):
+    """
+    'dc_solve' solves a DC network (sparse MNA matrix)
+
+    :param net: SpicePy network
+    :return: None (the solution is stored in net.x)
+    """
+    net.conductance_matrix()
+    net.rhs_matrix()
+
+    net.x = spsolve(net.G.tocsc(), np.asarray(net.rhs, dtype=float))
+
+
+def ac_solve(net):
+    """
+    'ac_solve' solves an AC network. Multi-frequency analyses of small networks are solved
+    in batches (one np.linalg.solve for a stack of matrices), the others with one sparse
+    solve for each frequency.
+
+    :param net: SpicePy network
+    :return: None (the solution is stored in net.x)
+    """
+    net.conductance_matrix()
+    net.dynamic_matrix()
+    net.rhs_matrix()
+    net.frequency_span()
+
+    G = net.G.tocsc().astype(complex)
+    C = net.C.tocsc().astype(complex)
+    rhs = np.asarray(net.rhs, dtype=complex)
+
+    if np.isscalar(net.f):
+        net.x = spsolve(G + 1j * 2 * np.pi * net.f * C, rhs)
+    elif G.shape[0] <= AC_DENSE_MAX:
+        net.x = batch_solve(G.toarray(), C.toarray(), rhs, net.f)
+    else:
+        net.x = np.zeros((G.shape[0], net.f.size), dtype=complex)
+        for k, f in enumerate(net.f):
+            net.x[:, k] = spsolve(G + 1j * 2 * np.pi * f * C, rhs)
+
+
+def batch_solve(G, C, rhs, f):
+    """
+    'batch_solve' solves (G + j 2 pi f C) x = rhs for many frequencies at once
+
+    :param G: conductance matrix (dense)
+    :param C: dynamic matrix (dense)
+    :param rhs: right-hand side
+    :param f: frequencies
+    :return: solution (one column for each frequency)
+    """
+    n = G.shape[0]
+    chunk = max(1, AC_BATCH_BYTES // (16 * n * n))
+    omega = 2 * np.pi * np.asarray(f)
+
+    x = np.zeros((n, omega.size), dtype=complex)
+    for k in range(0, omega.size, chunk):
+        w = omega[k:k + chunk]
+        A = G[np.newaxis, :, :] + 1j * w[:, np.newaxis, np.newaxis] * C[np.newaxis, :, :]
+        b = np.broadcast_to(rhs[:, np.newaxis], (w.size, n, 1))
+        x[:, k:k + w.size] = np.linalg.solve(A, b)[:, :, 0].T
+    return x
+
+
+def initial_conditions(net):
+    """
+    'initial_conditions' computes the solution at t=0 of a transient analysis: inductors
+    and capacitors are replaced by current and voltage sources set to their initial conditions
+    (same procedure of spicepy.netsolve.transient_solve)
+
+    :param net: SpicePy network (.tran) with the matrices already built
+    :return: solution at t=0
+    """
+    net_op = deepcopy(net)
+
+    net_op.reorder()
+    indexL = sorted(net_op.isort[1])
+    indexC = sorted(net_op.isort[2])
+    indexV = sorted(net_op.isort[3])
+    indexI = sorted(net_op.isort[4])
+
+    # sources at t=0 and first free id numbers of voltage and current sources
+    nv = 1
+    for iv in indexV:
+        if isinstance(net.values[iv], list):
+            tsr_fun = getattr(tsr, net.source_type[net.names[iv]])
+            net_op.values[iv] = tsr_fun(*net.values[iv], t=0)
+        nv = max(nv, int(net.names[iv][1:]) + 1)
+    ni = 1
+    for ii in indexI:
+        if isinstance(net.values[ii], list):
+            tsr_fun = getattr(tsr, net.source_type[net.names[ii]])
+            net_op.values[ii] = tsr_fun(*net.values[ii], t=0)
+        ni = max(ni, int(net.names[ii][1:]) + 1)
+
+    # inductors --> current sources, capacitors --> voltage sources
+    for k, il in enumerate(indexL):
+        net_op.values[il] = net_op.IC[net_op.names[il]]
+        net_op.names[il] = 'I' + str(ni + k)
+    for k, ic in enumerate(indexC):
+        net_op.values[ic] = net_op.IC[net_op.names[ic]]
+        net_op.names[ic] = 'V' + str(nv + k)
+
+    net_op.reorder()
+    net_op.analysis = ['.op']
+    dc_solve(net_op)
+
+    # unknowns of the transient analysis: node potentials, inductor currents and
+    # currents of voltage sources, VCVS and CCVS
+    NV = len(net.isort[3])
+    NE = len(net.isort[5])
+    NH = len(net.isort[8])
+    n = net_op.node_num
+    return np.concatenate((net_op.x[:n],
+                           np.array(net_op.values)[sorted(net.isort[1])],
+                           net_op.x[n:(n + NV)],
+                           net_op.x[(n + NV):(n + NV + NE)],
+                           net_op.x[(n + NV + NE):(n + NV + NE + NH)]))
+
+
+def transient_solve(net):
+    """
+    'transient_solve' solves a transient analysis with the trapezoidal rule (see 'trapezoidal')
+
+    :param net: SpicePy network
+    :return: None (time and solution are stored in net.t and net.x)
+    """
+    # time array
+    h = float(net.convert_unit(net.analysis[1]))
+    tend = float(net.convert_unit(net.analysis[2]))
+    net.t = np.arange(0, tend, h)
+
+    # matrices
+    net.conductance_matrix()
+    net.dynamic_matrix()
+    rhs = transient_rhs(net)
+    x0 = initial_conditions(net)
+
+    net.x = trapezoidal(net.G, net.C, rhs, h, x0)
+
+
+def transient_rhs(net):
+    """
+    'transient_rhs' evaluates the rhs of a transient analysis at all times
+
+    :param net: SpicePy network (.tran) with net.t
+    :return: rhs (one column for each time)
+    """
+    rhs_fun = net.rhs_matrix()
+    return np.column_stack([rhs_fun(t) for t in net.t])
+
+
+def trapezoidal(G, C, rhs, h, x0, lu=None):
+    """
+    'trapezoidal' integrates C dx/dt + G x = r(t) with the trapezoidal rule.
+    The time step is constant: the matrix is factorized once and the LU factors are
+    used at every step.
+
+    :param G: conductance matrix (sparse)
+    :param C: dynamic matrix (sparse)
+    :param rhs: r(t) (one column for each time)
+    :param h: time step
+    :param x0: solution at the first time
+    :param lu: LU factors of C + h/2 G (computed if not provided)
+    :return: solution (one column for each time)
+    """
+    # trapezoidal rule (Vlach, eq 9.4.6, pag. 277): K x[k] = M x[k-1] + h/2 (r[k-1] + r[k])
+    if lu is None:
+        lu = splu((C + 0.5 * h * G).tocsc())
+    M = (C - 0.5 * h * G).tocsr()
+    b = 0.5 * h * (rhs[:, :-1] + rhs[:, 1:])
+
+    x = np.zeros(rhs.shape)
+    x[:, 0] = x0
+    for k in range(1, rhs.shape[1]):
+        x[:, k] = lu.solve(M @ x[:, k - 1] + b[:, k - 1])
+    return x
+
+
+def solve_network(net):
+    """
+    'solve_network' solves a network with the sparse engine. If the engine fails
+    (e.g. a feature not supported) the network is solved by SpicePy (net_solve),
+    numerical failures (NUMERICAL_ERRORS) are raised.
+
+    :param net: SpicePy network
+    :return: None, or the error of the engine (string) when the network has been solved by SpicePy
+    """
+    analysis = net.analysis[0].lower()
+    try:
+        if analysis == '.op':
+            dc_solve(net)
+        elif analysis == '.ac':
+            ac_solve(net)
+        elif analysis == '.tran':
+            transient_solve(net)
+        else:
+            net_solve(net)
+    except NUMERICAL_ERRORS:
+        raise
+    except Exception as e:
+        net_solve(net)
+        return '{}: {}'.format(type(e).__name__, e)
@@ -0,0 +1,130 @@
+# ======================
+# general python modules
+# ======================
+import io
+import gzip
+from collections import OrderedDict
+import numpy as np
+
+# =============
+# bot modules
+# =============
+from botlib.solver import read_network
+from botlib.engine import solve_network
+from botlib import cost as cost_model
+
+
+def quantities(net):
+    """
+    'quantities' collects the numeric solution of a network:
+        * .tran: time, node potentials and branch currents (one value for each time step)
+        * .ac: frequency, node potentials and branch currents (complex, one value for each frequency)
+        * .op: node potentials, branch voltages, currents and powers
+
+    :param net: SpicePy network (solved)
+    :return: OrderedDict name --> values (1-D arrays)
+    """
+    analysis = net.analysis[0].lower()
+    data = OrderedDict()
+    if analysis == '.tran':
+        data['t'] = net.t
+    elif (analysis == '.ac') and (not np.isscalar(net.f)):
+        data['f'] = net.f
+
+    # node potentials
+    for name, num in sorted(net.node_label2num.items(), key=lambda ele: ele[1]):
+        if name != '0':
+            data['V({})'.format(name)] = net.x[num - 1, ...]
+
+    # branch quantities
+    net.branch_voltage()
+    net.branch_current()
+    single = 'f' not in data and 't' not in data
+    if single:
+        net.branch_power()
+    for k, name in enumerate(net.names):
+        if single:
+            data['v({})'.format(name)] = net.vb[k, ...]
+        data['i({})'.format(name)] = net.ib[k, ...]
+        if single:
+            data['p({})'.format(name)] = net.pb[k, ...]
+
+    return OrderedDict((name, np.atleast_1d(np.asarray(values))) for name, values in data.items())
+
+
+def to_npz(data):
+    """
+    'to_npz' writes the quantities in a compressed numpy archive (in memory)
+
+    :param data: OrderedDict name --> values
+    :return: bytes of the archive
+    """
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **data)
+    return buf.getvalue()
+
+
+def to_csv(data):
+    """
+    'to_csv' writes the quantities in a gzipped csv (in memory). Complex quantities are
+    split in real and imaginary part.
+
+    :param data: OrderedDict name --> values
+    :return: bytes of the gzipped csv
+    """
+    header = []
+    columns = []
+    for name, values in data.items():
+        if np.iscomplexobj(values):
+            header += ['re({})'.format(name), 'im({})'.format(name)]
+            columns += [values.real, values.imag]
+        else:
+            header.append(name)
+            columns.append(values)
+
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0) as gz:
+        np.savetxt(gz, np.column_stack(columns), fmt='%.17g', delimiter=',', header=','.join(header), comments='')
+    return buf.getvalue()
+
+
+def export(netlist, fmt='npz', budget=cost_model.CPU_BUDGET):
+    """
+    'export' solves a netlist and provides the numeric solution as a file.
+    It runs in the solver workers. Analyses are never downscaled: exported data are exact.
+
+    :param netlist: string with the netlist
+    :param fmt: 'npz' or 'csv'
+    :param budget: CPU budget (s)
+    :return: dictionary (see botlib.solver.solve) with the file in 'files' (list of (filename, bytes))
+    """
+    sol = {'analysis': None, 'solved': False, 'mex': None, 'notes': [], 'plots': [], 'files': [],
+           'cost': 0, 'downscaled': False, 'render_time': [], 'preview': False, 'engine_fallback': None}
+
+    net = read_network(netlist)
+    sol['analysis'] = net.analysis[0].lower()
+    if sol['analysis'] == '.ac':
+        net.frequency_span()
+
+    # no plots: only the solve and the export of all quantities
+    cost = cost_model.estimate(net)
+    sol['cost'] = cost['solve'] + cost_model.EXPORT_COST * cost['samples'] * (net.node_num + len(net.names))
+    if sol['cost'] > budget:
+        mex = "Your netlist is too demanding to be exported: "
+        mex += "{:d} unknowns and {:d} samples (estimated *{:.0f} s* of CPU).\n".format(
+            cost['unknowns'], cost['samples'], sol['cost'])
+        mex += "*The limit on this bot is currently {:.0f} s.*\n".format(budget)
+        mex += "Please reduce the size of the network (or of the analysis)."
+        sol['mex'] = mex
+        return sol
+
+    sol['engine_fallback'] = solve_network(net)
+    sol['solved'] = True
+
+    data = quantities(net)
+    filename = sol['analysis'][1:]
+    if fmt == 'csv':
+        sol['files'].append((filename + '.csv.gz', to_csv(data)))
+    else:
+        sol['files'].append((filename + '.npz', to_npz(data)))
+    return sol
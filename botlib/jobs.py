@@ -0,0 +1,50 @@
+# ==========================================
+# jobs run by the solver workers
+# ==========================================
+# The bot process submits these functions to the solver pool without importing NumPy,
+# matplotlib and SpicePy: the heavy modules are imported by the workers when they start (warm_up)
+
+# resolution of the plots sent to users and of the low-resolution previews (see botlib.render)
+RENDER_DPI = 150
+PREVIEW_DPI = 80
+
+# export formats: compressed numpy archive and gzipped csv (see botlib.export)
+EXPORT_FORMATS = ('npz', 'csv')
+
+
+def solve(*args, **kwargs):
+    """
+    'solve' parses, solves and renders a netlist (see botlib.solver.solve)
+    """
+    from botlib import solver
+    return solver.solve(*args, **kwargs)
+
+
+def sweep(*args, **kwargs):
+    """
+    'sweep' solves a netlist for many values of an element (see botlib.sweep.sweep)
+    """
+    from botlib import sweep as parametric
+    return parametric.sweep(*args, **kwargs)
+
+
+def export(*args, **kwargs):
+    """
+    'export' solves a netlist and exports all quantities in a file (see botlib.export.export)
+    """
+    from botlib import export as data_export
+    return data_export.export(*args, **kwargs)
+
+
+def warm_up():
+    """
+    'warm_up' imports the modules of all jobs and builds the figure templates (called when a worker starts)
+
+    :return: None
+    """
+    import importlib
+    from botlib import solver
+    # sweep and export have no warm-up: importing them is enough
+    for name in ('botlib.sweep', 'botlib.export'):
+        importlib.import_module(name)
+    solver.warm_up()
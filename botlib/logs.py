@@ -0,0 +1,117 @@
+# ======================
+# general python modules
+# ======================
+import os
+import glob
+import gzip
+import queue
+import shutil
+import logging
+import logging.handlers
+
+
+def _gzip_namer(name):
+    """
+    '_gzip_namer' provides the name of a compressed rotated log
+
+    :param name: default name (e.g. 'SolverLog.log.1')
+    :return: name with '.gz'
+    """
+    return name + '.gz'
+
+
+def _gzip_rotator(source, dest):
+    """
+    '_gzip_rotator' compresses the rotated log
+
+    :param source: log file
+    :param dest: compressed file
+    :return: None
+    """
+    with open(source, 'rb') as fin, gzip.open(dest, 'wb') as fout:
+        shutil.copyfileobj(fin, fout)
+    os.remove(source)
+
+
+def file_handler(filename, fmt, max_bytes=10 * 2**20, backup_count=10, when=None, compress=True):
+    """
+    'file_handler' creates a rotating file handler
+
+    :param filename: log file
+    :param fmt: formatter
+    :param max_bytes: size of the log that triggers the rotation (size-based rotation)
+    :param backup_count: number of rotated logs that are kept
+    :param when: if provided (e.g. 'midnight') the rotation is time-based (see TimedRotatingFileHandler)
+    :param compress: if True rotated logs are compressed with gzip
+    :return: handler
+    """
+    if when is None:
+        handler = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes,
+                                                       backupCount=backup_count, delay=True)
+    else:
+        handler = logging.handlers.TimedRotatingFileHandler(filename, when=when,
+                                                            backupCount=backup_count, delay=True)
+    handler.setFormatter(fmt)
+
+    if compress:
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+
+    return handler
+
+
+def start_logging(loggers):
+    """
+    'start_logging' connects the loggers to a queue: records are written on file by a
+    background thread (QueueListener), so the caller never waits for the disk.
+
+    :param loggers: dictionary logger --> list of handlers (records of a logger go only to its handlers)
+    :return: QueueListener (call stop() to flush the queue)
+    """
+    log_queue = queue.Queue(-1)
+
+    handlers = []
+    for logger, logger_handlers in loggers.items():
+        for handler in logger_handlers:
+            handler.addFilter(logging.Filter(logger.name))
+            handlers.append(handler)
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def log_segments(filename):
+    """
+    'log_segments' provides the log file and its rotated segments (newest first)
+
+    :param filename: log file
+    :return: list of existing files
+    """
+    def suffix(fname):
+        # 'SolverLog.log.3.gz' --> '3' (size-based) or 'SolverLog.log.2020-01-01.gz' --> '2020-01-01' (time-based)
+        return fname[len(filename) + 1:].replace('.gz', '')
+
+    segments = glob.glob(filename + '.*')
+    if all(suffix(fname).isdigit() for fname in segments):
+        segments.sort(key=lambda fname: int(suffix(fname)))
+    else:
+        segments.sort(key=suffix, reverse=True)
+
+    if os.path.exists(filename):
+        segments.insert(0, filename)
+    return segments
+
+
+def open_segment(fname):
+    """
+    'open_segment' opens a log segment in binary mode (compressed or not)
+
+    :param fname: log segment
+    :return: file object
+    """
+    if fname.endswith('.gz'):
+        return gzip.open(fname, 'rb')
+    else:
+        return open(fname, 'rb')
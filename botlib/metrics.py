@@ -0,0 +1,301 @@
+# ======================
+# general python modules
+# ======================
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# upper bounds (s) of the buckets of the timing histograms
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# content type of the text exposition format (Prometheus)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(labels):
+    """
+    '_format_labels' formats the labels of a sample
+
+    :param labels: tuple of (name, value)
+    :return: string (e.g. '{stage="solve"}', empty without labels)
+    """
+    if not labels:
+        return ''
+    values = ['{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+              for name, value in labels]
+    return '{' + ','.join(values) + '}'
+
+
+def _format_value(value):
+    """
+    '_format_value' formats the value of a sample
+
+    :param value: number
+    :return: string
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    """
+    'Metric' is the base class of counters and gauges: one value for each combination of labels.
+    When 'func' is provided the values are read when the metric is exposed.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=(), func=None):
+        """
+        :param name: name of the metric
+        :param help: description
+        :param labels: names of the labels
+        :param func: function providing the value (or a dictionary tuple of label values --> value)
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.func = func
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError("{} needs the labels {}".format(self.name, self.labels))
+        return tuple(labels[name] for name in self.labels)
+
+    def samples(self):
+        """
+        'samples' provides the current values
+
+        :return: list of (name, labels, value)
+        """
+        if self.func is not None:
+            values = self.func()
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+            if not self.labels:
+                # metrics without labels are exposed from the start
+                values.setdefault((), 0)
+        return [(self.name, tuple(zip(self.labels, key)), value) for key, value in sorted(values.items())]
+
+
+class Counter(Metric):
+    """
+    'Counter' is a value that only increases
+    """
+    kind = 'counter'
+
+    def inc(self, value=1, **labels):
+        """
+        'inc' increases the counter
+
+        :param value: increment
+        :param labels: label values
+        :return: None
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    """
+    'Gauge' is a value that can go up and down
+    """
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        """
+        'set' sets the gauge
+
+        :param value: new value
+        :param labels: label values
+        :return: None
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """
+    'Histogram' counts observations (e.g. durations) in cumulative buckets
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        """
+        :param name: name of the metric
+        :param help: description
+        :param labels: names of the labels
+        :param buckets: upper bounds of the buckets (sorted)
+        """
+        super(Histogram, self).__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        """
+        'observe' adds an observation
+
+        :param value: observed value
+        :param labels: label values
+        :return: None
+        """
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts, total, cnt = self._values[key]
+            for k, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[k] += 1
+                    break
+            self._values[key][1] = total + value
+            self._values[key][2] = cnt + 1
+
+    def samples(self):
+        """
+        'samples' provides buckets (cumulative), sum and count of each combination of labels
+
+        :return: list of (name, labels, value)
+        """
+        with self._lock:
+            values = {key: (list(counts), total, cnt) for key, (counts, total, cnt) in self._values.items()}
+
+        res = []
+        for key, (counts, total, cnt) in sorted(values.items()):
+            labels = tuple(zip(self.labels, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                res.append((self.name + '_bucket', labels + (('le', _format_value(bound)),), cumulative))
+            res.append((self.name + '_sum', labels, total))
+            res.append((self.name + '_count', labels, cnt))
+        return res
+
+
+class Registry(object):
+    """
+    'Registry' collects the metrics of the bot and renders them in the Prometheus text format
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=(), func=None):
+        """
+        'counter' creates and registers a Counter (see Metric for the parameters)
+        """
+        return self._add(Counter(name, help, labels, func))
+
+    def gauge(self, name, help, labels=(), func=None):
+        """
+        'gauge' creates and registers a Gauge (see Metric for the parameters)
+        """
+        return self._add(Gauge(name, help, labels, func))
+
+    def histogram(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        """
+        'histogram' creates and registers a Histogram (see Histogram for the parameters)
+        """
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def expose(self):
+        """
+        'expose' renders all metrics (text exposition format)
+
+        :return: string
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append('{}{} {}'.format(name, _format_labels(labels), _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+def process_rss(pid):
+    """
+    'process_rss' provides the resident memory of a process (Linux only)
+
+    :param pid: process id
+    :return: RSS in bytes (0 if not available)
+    """
+    try:
+        with open('/proc/{}/statm'.format(pid)) as fid:
+            return int(fid.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class MetricsServer(object):
+    """
+    'MetricsServer' exposes a Registry on http://<listen>:<port>/metrics (background thread)
+    """
+
+    def __init__(self, registry, listen='127.0.0.1', port=9100):
+        """
+        :param registry: Registry
+        :param listen: address (local only by default)
+        :param port: port
+        """
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        """
+        'start' runs the HTTP server
+
+        :return: None
+        """
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.expose().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # scrapes are not logged
+                pass
+
+        self._httpd = ThreadingHTTPServer((self.listen, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='MetricsServer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        'stop' stops the HTTP server
+
+        :return: None
+        """
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
@@ -0,0 +1,116 @@
+# ======================
+# general python modules
+# ======================
+import os
+import glob
+import json
+import time
+import threading
+
+
+class PendingNetlists(object):
+    """
+    'PendingNetlists' tracks the users that called /netlist and whose netlist is expected
+    in the next text message. Each entry expires after 'ttl' seconds.
+    """
+
+    def __init__(self, ttl=3600, filename=None):
+        """
+        :param ttl: time to live of an entry (s)
+        :param filename: json file used by save/load (None: not persistent)
+        """
+        self.ttl = ttl
+        self.filename = filename
+        self._expiry = {}
+        self._lock = threading.Lock()
+
+    def add(self, chat_id):
+        """
+        'add' marks a user as waiting for a netlist
+
+        :param chat_id: chat id
+        :return: None
+        """
+        with self._lock:
+            self._expiry[chat_id] = time.time() + self.ttl
+
+    def pop(self, chat_id):
+        """
+        'pop' checks if a user is waiting for a netlist and removes the entry
+
+        :param chat_id: chat id
+        :return: True if the user was waiting for a netlist (and the entry is not expired)
+        """
+        with self._lock:
+            expiry = self._expiry.pop(chat_id, None)
+        return (expiry is not None) and (expiry >= time.time())
+
+    def sweep(self):
+        """
+        'sweep' removes expired entries
+
+        :return: number of removed entries
+        """
+        now = time.time()
+        with self._lock:
+            expired = [chat_id for chat_id, expiry in self._expiry.items() if expiry < now]
+            for chat_id in expired:
+                del self._expiry[chat_id]
+        return len(expired)
+
+    def import_markers(self, folder):
+        """
+        'import_markers' imports the old '<chat_id>_waitnetlist' marker files (they are removed)
+
+        :param folder: folder with the marker files
+        :return: number of imported markers
+        """
+        cnt = 0
+        for fname in glob.glob(os.path.join(folder, '*_waitnetlist')):
+            try:
+                chat_id = int(os.path.basename(fname).replace('_waitnetlist', ''))
+                # the marker expires ttl seconds after its creation
+                with self._lock:
+                    self._expiry[chat_id] = os.path.getmtime(fname) + self.ttl
+                os.remove(fname)
+                cnt += 1
+            except (ValueError, OSError):
+                continue
+        return cnt
+
+    def save(self):
+        """
+        'save' writes the entries on file (if filename is set)
+
+        :return: None
+        """
+        if self.filename is None:
+            return
+
+        self.sweep()
+        with self._lock:
+            data = {str(chat_id): expiry for chat_id, expiry in self._expiry.items()}
+
+        with open(self.filename + '.tmp', 'w') as fid:
+            json.dump(data, fid)
+        os.replace(self.filename + '.tmp', self.filename)
+
+    def load(self):
+        """
+        'load' reads the entries from file (if filename is set and the file exists)
+
+        :return: None
+        """
+        if (self.filename is None) or (not os.path.exists(self.filename)):
+            return
+
+        try:
+            with open(self.filename) as fid:
+                data = json.load(fid)
+        except (OSError, ValueError):
+            return
+
+        with self._lock:
+            for chat_id, expiry in data.items():
+                self._expiry[int(chat_id)] = expiry
+        self.sweep()
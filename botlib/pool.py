@@ -0,0 +1,301 @@
+# ======================
+# general python modules
+# ======================
+import os
+import sys
+import time
+import queue
+import threading
+import traceback
+import subprocess
+import multiprocessing as mp
+from multiprocessing.connection import Connection
+from concurrent.futures import Future
+
+
+class PoolFull(Exception):
+    """
+    'PoolFull' is raised when the job queue of the pool is full
+    """
+    pass
+
+
+class SolverTimeout(Exception):
+    """
+    'SolverTimeout' is raised when a job exceeds the wall-clock timeout (the worker is killed)
+    """
+    pass
+
+
+class WorkerCrashed(Exception):
+    """
+    'WorkerCrashed' is raised when a worker dies while running a job
+    """
+    pass
+
+
+def _worker_main(conn):
+    """
+    '_worker_main' is the loop executed by each worker process
+
+    :param conn: end of the pipe connected to the pool (the first message is the initializer,
+                 a function called once when the worker starts, e.g. warm-up)
+    :return: None
+    """
+    try:
+        initializer = conn.recv()
+    except (EOFError, KeyboardInterrupt):
+        return
+
+    if initializer is not None:
+        initializer()
+
+    # warm: the pool can send jobs
+    conn.send(True)
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        # None is the stop signal
+        if job is None:
+            break
+
+        func, args, kwargs = job
+        try:
+            res = (True, func(*args, **kwargs))
+        except Exception as e:
+            e.worker_traceback = traceback.format_exc()
+            res = (False, e)
+
+        try:
+            conn.send(res)
+        except Exception:
+            # the exception is not picklable: send a generic one
+            conn.send((False, RuntimeError(traceback.format_exc())))
+
+
+class SolverPool(object):
+    """
+    'SolverPool' runs jobs in a pool of warm worker processes.
+
+    Each worker is driven by a thread of the main process that picks jobs from the
+    queue, sends them to the worker and waits at most 'timeout' seconds for the result.
+    When the timeout expires the worker is killed and replaced by a fresh one.
+    A thread picks jobs only when its worker is warm (initializer completed).
+
+    Workers are new interpreters (python -m botlib.pool) and not forks of the main process:
+    workers are replaced while the bot is running threads, and a forked child could inherit
+    a lock held by one of them (e.g. logging) and deadlock.
+    """
+
+    def __init__(self, processes=None, timeout=60, max_queue=100, initializer=None, on_ready=None):
+        """
+        :param processes: number of worker processes (default: number of cores)
+        :param timeout: wall-clock timeout in seconds for each job
+        :param max_queue: maximum number of jobs waiting in the queue
+        :param initializer: function called by each worker when it starts, e.g. heavy imports (it must be picklable)
+        :param on_ready: function called with the warm-up time (s) every time a worker is ready
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.timeout = timeout
+        self.initializer = initializer
+        self.on_ready = on_ready
+        self._jobs = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._procs = {}    # driving thread --> worker process
+        self._started = 0   # workers that completed the first warm-up (see wait_ready)
+        self._ready = threading.Event()
+
+    def start(self):
+        """
+        'start' spawns the workers
+
+        :return: None
+        """
+        self._started = 0
+        self._ready.clear()
+        for k in range(self.processes):
+            th = threading.Thread(target=self._serve, name='SolverPool-{}'.format(k), daemon=True)
+            th.start()
+            self._threads.append(th)
+
+    def stop(self):
+        """
+        'stop' stops all workers (running jobs are completed)
+
+        :return: None
+        """
+        for th in self._threads:
+            self._jobs.put(None)
+        for th in self._threads:
+            th.join()
+        self._threads = []
+
+    def wait_ready(self, timeout=None):
+        """
+        'wait_ready' waits until all workers started by 'start' are warm (or died during the warm-up)
+
+        :param timeout: maximum wait (s), None: no limit
+        :return: True if all workers are ready
+        """
+        return self._ready.wait(timeout)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        'submit' puts a job in the queue
+
+        :param func: function to be executed in a worker (it must be picklable)
+        :param args: positional arguments of func
+        :param kwargs: keyword arguments of func
+        :return: Future with the result of the job
+        """
+        future = Future()
+        try:
+            self._jobs.put_nowait((future, func, args, kwargs))
+        except queue.Full:
+            raise PoolFull("{} jobs already waiting".format(self._jobs.maxsize))
+        return future
+
+    def queue_depth(self):
+        """
+        'queue_depth' provides the number of jobs waiting in the queue
+
+        :return: number of waiting jobs
+        """
+        return self._jobs.qsize()
+
+    def in_flight(self):
+        """
+        'in_flight' provides the number of jobs currently running in the workers
+
+        :return: number of running jobs
+        """
+        return self._in_flight
+
+    def worker_pids(self):
+        """
+        'worker_pids' provides the process ids of the workers
+
+        :return: list of pids
+        """
+        with self._lock:
+            return [proc.pid for proc in self._procs.values()]
+
+    def _spawn(self):
+        """
+        '_spawn' starts a new worker process and waits for its warm-up (called by the thread driving the worker).
+        A worker that dies during the warm-up is replaced when a job arrives.
+
+        :return: process and the pool end of the pipe
+        """
+        start = time.perf_counter()
+        conn, child_conn = mp.Pipe()
+
+        # the worker finds botlib and the modules of the jobs on the same path of the pool
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+        proc = subprocess.Popen([sys.executable, '-m', 'botlib.pool', str(child_conn.fileno())],
+                                pass_fds=(child_conn.fileno(),), env=env)
+        child_conn.close()
+        with self._lock:
+            self._procs[threading.get_ident()] = proc
+
+        try:
+            conn.send(self.initializer)
+            conn.recv()
+        except (EOFError, OSError):
+            self._kill(proc, conn)
+        else:
+            if self.on_ready is not None:
+                self.on_ready(time.perf_counter() - start)
+        return proc, conn
+
+    @staticmethod
+    def _kill(proc, conn):
+        """
+        '_kill' terminates a worker process
+
+        :param proc: worker process
+        :param conn: pool end of the pipe
+        :return: None
+        """
+        conn.close()
+        proc.kill()
+        proc.wait()
+
+    def _serve(self):
+        """
+        '_serve' is the loop of the thread driving one worker
+
+        :return: None
+        """
+        proc, conn = self._spawn()
+        with self._lock:
+            self._started += 1
+            if self._started >= self.processes:
+                self._ready.set()
+
+        while True:
+            job = self._jobs.get()
+
+            # None is the stop signal
+            if job is None:
+                try:
+                    conn.send(None)
+                    proc.wait(self.timeout)
+                except (OSError, subprocess.TimeoutExpired):
+                    # the worker is already dead (e.g. SIGTERM sent to the process group) or stuck
+                    pass
+                finally:
+                    if proc.poll() is None:
+                        self._kill(proc, conn)
+                    with self._lock:
+                        self._procs.pop(threading.get_ident(), None)
+                break
+
+            future, func, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            # replace dead workers
+            if proc.poll() is not None:
+                self._kill(proc, conn)
+                proc, conn = self._spawn()
+
+            respawn = False
+            with self._lock:
+                self._in_flight += 1
+            try:
+                conn.send((func, args, kwargs))
+                if conn.poll(self.timeout):
+                    ok, res = conn.recv()
+                else:
+                    # timeout: kill the worker (a new one is started below)
+                    self._kill(proc, conn)
+                    respawn = True
+                    ok, res = False, SolverTimeout("job exceeded {} s".format(self.timeout))
+            except (EOFError, OSError):
+                self._kill(proc, conn)
+                respawn = True
+                ok, res = False, WorkerCrashed("worker died while running the job")
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+            if ok:
+                future.set_result(res)
+            else:
+                future.set_exception(res)
+
+            # the result is not delayed by the warm-up of the new worker
+            if respawn:
+                proc, conn = self._spawn()
+
+
+if __name__ == '__main__':
+    # worker process: the argument is the file descriptor of its end of the pipe (see SolverPool._spawn)
+    _worker_main(Connection(int(sys.argv[1])))
@@ -0,0 +1,123 @@
+# ======================
+# general python modules
+# ======================
+import io
+import os
+import time
+import pstats
+import cProfile
+import tempfile
+
+# number of functions listed in the summary (sorted by cumulative time)
+PROFILE_TOP = 15
+
+# sort keys of the full listing (first key is used for the summary)
+PROFILE_SORT = ('cumulative', 'tottime')
+
+
+def _listing(stats, sort, limit=None):
+    """
+    '_listing' prints the statistics of a profile
+
+    :param stats: pstats.Stats
+    :param sort: sort key
+    :param limit: number of functions printed (all if None)
+    :return: string
+    """
+    buf = io.StringIO()
+    stats.stream = buf
+    stats.sort_stats(sort)
+    if limit is None:
+        stats.print_stats()
+    else:
+        stats.print_stats(limit)
+    return buf.getvalue()
+
+
+def _short_name(func):
+    """
+    '_short_name' formats a function of a profile (filename:line(name)) without the full path
+
+    :param func: tuple (filename, line, name)
+    :return: string
+    """
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return '{}:{}({})'.format(os.path.basename(filename), line, name)
+
+
+def hotspots(stats, top=PROFILE_TOP):
+    """
+    'hotspots' summarizes a profile: the functions with the largest cumulative time
+
+    :param stats: pstats.Stats
+    :param top: number of functions
+    :return: list of (function, calls, own time (s), cumulative time (s))
+    """
+    rows = [(_short_name(func), nc, tt, ct) for func, (cc, nc, tt, ct, callers) in stats.stats.items()]
+    rows.sort(key=lambda row: row[3], reverse=True)
+    return rows[:top]
+
+
+def profile(func, *args, top=PROFILE_TOP):
+    """
+    'profile' runs a job under cProfile. It is executed in the solver workers in place of 'func'
+    (only for the jobs to be profiled: other jobs do not pay any overhead)
+
+    :param func: function of the job (e.g. botlib.solver.solve)
+    :param args: arguments of func
+    :param top: number of functions in the summary
+    :return: dictionary with
+        * result: result of func (None if func raised an exception)
+        * error: string with the exception raised by func (None otherwise)
+        * elapsed: wall time (s) of the job
+        * hotspots: see 'hotspots'
+        * listing: text of the full profile (one listing for each key of PROFILE_SORT)
+        * stats: profile in the pstats format (bytes, see 'python -m pstats')
+    """
+    res = {'result': None, 'error': None}
+
+    prof = cProfile.Profile()
+    start = time.perf_counter()
+    prof.enable()
+    try:
+        res['result'] = func(*args)
+    except Exception as e:
+        res['error'] = '{}: {}'.format(type(e).__name__, e)
+    finally:
+        prof.disable()
+    res['elapsed'] = time.perf_counter() - start
+
+    stats = pstats.Stats(prof)
+    res['hotspots'] = hotspots(stats, top)
+    res['listing'] = ''.join(_listing(stats, sort) for sort in PROFILE_SORT)
+
+    # marshal format of pstats (it can only be written to a file)
+    fd, fname = tempfile.mkstemp(suffix='.prof')
+    os.close(fd)
+    try:
+        stats.dump_stats(fname)
+        with open(fname, 'rb') as fid:
+            res['stats'] = fid.read()
+    finally:
+        os.remove(fname)
+
+    return res
+
+
+def format_hotspots(res):
+    """
+    'format_hotspots' formats the summary of a profile in a message (markdown)
+
+    :param res: result of 'profile'
+    :return: string
+    """
+    mex = '*Profile* ({:.3f} s)\n'.format(res['elapsed'])
+    if res['error'] is not None:
+        mex += 'The job failed: `{}`\n'.format(res['error'].replace('`', "'"))
+    mex += '`{:>8} {:>8} {:>6}  {}\n'.format('cum (s)', 'own (s)', 'calls', 'function')
+    for name, calls, own, cumulative in res['hotspots']:
+        mex += '{:8.4f} {:8.4f} {:6d}  {}\n'.format(cumulative, own, calls, name.replace('`', "'"))
+    mex += '`'
+    return mex
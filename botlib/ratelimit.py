@@ -0,0 +1,83 @@
+# ======================
+# general python modules
+# ======================
+import time
+import threading
+
+
+class TokenBucket(object):
+    """
+    'TokenBucket' limits the rate of an operation (thread safe)
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: tokens per second
+        :param capacity: maximum number of tokens (default: rate)
+        """
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds):
+        """
+        'pause' stops giving tokens for some time (e.g. after a RetryAfter)
+
+        :param seconds: pause length
+        :return: None
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+    def try_acquire(self):
+        """
+        'try_acquire' takes a token if available (without waiting)
+
+        :return: True if the token has been taken
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return False
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def is_full(self):
+        """
+        'is_full' checks if the bucket is full (i.e. it has not been used for a while)
+
+        :return: True/False
+        """
+        with self._lock:
+            now = time.monotonic()
+            return (now >= self._paused_until) and \
+                (self._tokens + (now - self._last) * self.rate >= self.capacity)
+
+    def acquire(self):
+        """
+        'acquire' waits until a token is available and takes it
+
+        :return: None
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                    self._last = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    self._last = self._paused_until
+                    wait = self._paused_until - now
+            time.sleep(wait)
@@ -0,0 +1,312 @@
+# ======================
+# general python modules
+# ======================
+import io
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+
+from botlib.decimate import decimate
+
+# resolution of the plots sent to users
+from botlib.jobs import RENDER_DPI
+
+
+class FigureTemplate(object):
+    """
+    'FigureTemplate' is a figure built once and reused for all plots of the same type:
+    only line data, labels and limits are updated.
+    Templates are not managed by pyplot (plt.close('all') does not affect them).
+    """
+
+    def __init__(self, nrows, xlog=False, marker=None):
+        """
+        :param nrows: number of subplots (one column)
+        :param xlog: if True the x axis is logarithmic
+        :param marker: marker of the lines (e.g. 'o'), None for lines only
+        """
+        self.marker = marker
+        self.fig = Figure()
+        FigureCanvasAgg(self.fig)
+        axs = self.fig.subplots(nrows, 1, squeeze=False)
+        self.axes = list(axs[:, 0])
+        self.lines = [[] for ax in self.axes]
+        for ax in self.axes:
+            if xlog:
+                ax.set_xscale('log')
+            ax.grid()
+
+    def draw(self, series, ylabels, xlabel, title=None, legend=True, fontsize=16):
+        """
+        'draw' updates the figure
+
+        :param series: for each subplot, list of (x, y, label)
+        :param ylabels: label of the y axis of each subplot
+        :param xlabel: label of the x axis (last subplot)
+        :param title: title of the first subplot
+        :param legend: if True a legend is added to each subplot
+        :param fontsize: font size of labels and title
+        :return: figure
+        """
+        for ax, lines, data, ylabel in zip(self.axes, self.lines, series, ylabels):
+            for k, (x, y, label) in enumerate(data):
+                if k < len(lines):
+                    lines[k].set_data(x, y)
+                    lines[k].set_label(label)
+                    lines[k].set_visible(True)
+                else:
+                    lines.append(ax.plot(x, y, label=label, marker=self.marker)[0])
+
+            # unused lines of previous plots
+            for line in lines[len(data):]:
+                line.set_visible(False)
+                line.set_label('_hidden')
+
+            ax.relim(visible_only=True)
+            ax.autoscale_view()
+            ax.set_ylabel(ylabel, fontsize=fontsize)
+            if legend:
+                ax.legend()
+            elif ax.get_legend() is not None:
+                # legend of a previous plot
+                ax.get_legend().remove()
+
+        self.axes[-1].set_xlabel(xlabel, fontsize=fontsize)
+        if title is not None:
+            self.axes[0].set_title(title, fontsize=fontsize)
+        self.fig.tight_layout()
+        return self.fig
+
+
+# templates of the worker: (plot type, options) --> FigureTemplate
+_templates = {}
+
+
+def get_template(kind, nrows=1):
+    """
+    'get_template' provides the template of a plot type (created at first use)
+
+    :param kind: 'tran', 'bode', 'bode_db', 'sweep_op' or 'sweep_tran'
+    :param nrows: number of subplots (transient plots and sweeps)
+    :return: FigureTemplate
+    """
+    key = (kind, nrows)
+    if key not in _templates:
+        if kind in ('tran', 'sweep_tran'):
+            _templates[key] = FigureTemplate(nrows)
+        elif kind == 'sweep_op':
+            _templates[key] = FigureTemplate(nrows, marker='o')
+        else:
+            _templates[key] = FigureTemplate(2, xlog=True)
+    return _templates[key]
+
+
+def rasterize(hf, dpi=RENDER_DPI):
+    """
+    'rasterize' draws a figure once on its Agg canvas (savefig draws figures with a
+    layout engine twice)
+
+    :param hf: figure
+    :param dpi: resolution
+    :return: PIL image (RGB)
+    """
+    canvas = hf.canvas if isinstance(hf.canvas, FigureCanvasAgg) else FigureCanvasAgg(hf)
+    hf.set_dpi(dpi)
+    canvas.draw()
+    img = Image.frombuffer('RGBA', canvas.get_width_height(), canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+    return img.convert('RGB')
+
+
+def to_png(img, palette=False):
+    """
+    'to_png' encodes an image in png
+
+    :param img: PIL image
+    :param palette: if True the image is converted to a 256-color palette (smaller file)
+    :return: bytes of the png image
+    """
+    buf = io.BytesIO()
+    if palette:
+        img.convert('P', palette=Image.ADAPTIVE, colors=256).save(buf, format='png', optimize=True)
+    else:
+        img.save(buf, format='png')
+    return buf.getvalue()
+
+
+def encode(hf, dpi=RENDER_DPI, palette=False):
+    """
+    'encode' renders a figure to png (the figure is not closed)
+
+    :param hf: figure
+    :param dpi: resolution
+    :param palette: if True the image is converted to a 256-color palette (smaller file)
+    :return: bytes of the png image
+    """
+    return to_png(rasterize(hf, dpi), palette)
+
+
+def encode_pyplot(hf, dpi=RENDER_DPI, palette=False):
+    """
+    'encode_pyplot' renders a pyplot figure to png and closes it (plots drawn by SpicePy)
+
+    :param hf: pyplot figure
+    :param dpi: resolution
+    :param palette: if True the image is converted to a 256-color palette (smaller file)
+    :return: bytes of the png image
+    """
+    try:
+        return encode(hf, dpi, palette)
+    finally:
+        plt.close(hf)
+
+
+def tile(images):
+    """
+    'tile' arranges images of the same size in a grid (as square as possible)
+
+    :param images: list of PIL images
+    :return: PIL image
+    """
+    cols = int(np.ceil(np.sqrt(len(images))))
+    rows = int(np.ceil(len(images) / cols))
+    width, height = images[0].size
+
+    img = Image.new('RGB', (cols * width, rows * height), 'white')
+    for k, image in enumerate(images):
+        img.paste(image, ((k % cols) * width, (k // cols) * height))
+    return img
+
+
+def _quantity(net, label):
+    """
+    '_quantity' computes a quantity of the .plot/.tf commands
+
+    :param net: SpicePy network (solved)
+    :param label: e.g. 'V(2)', 'I(R1)'
+    :return: values
+    """
+    variable = label[2:-1]
+    if label[0] == 'V':
+        return np.squeeze(net.get_voltage(variable))
+    else:
+        return np.squeeze(net.get_current(variable))
+
+
+def render_tran(net, dpi=RENDER_DPI, palette=False):
+    """
+    'render_tran' plots the quantities of the .plot command (same layout of net.plot).
+    Waveforms are decimated to the plot resolution (see botlib.decimate).
+
+    :param net: SpicePy network (.tran, solved)
+    :param dpi: resolution
+    :param palette: if True the image uses a 256-color palette
+    :return: bytes of the png image
+    """
+    labels = net.plot_cmd.upper().split()[1:]
+    voltages = [label for label in labels if label.startswith('V(')]
+    currents = [label for label in labels if label.startswith('I(')]
+    groups = [(group, ylabel) for group, ylabel in ((voltages, 'voltage (V)'), (currents, 'current (A)')) if group]
+    if not groups:
+        raise ValueError("no variables in {}".format(net.plot_cmd))
+
+    series = [[decimate(net.t, np.real(_quantity(net, label))) + (label,) for label in group]
+              for group, ylabel in groups]
+
+    template = get_template('tran', len(groups))
+    hf = template.draw(series, [ylabel for group, ylabel in groups], 'time (s)')
+    return encode(hf, dpi, palette)
+
+
+def render_bode(net, decibel=False, dpi=RENDER_DPI, palette=False, composite=False):
+    """
+    'render_bode' plots the bode diagram of each transfer function of the .tf command
+    (same layout of net.bode)
+
+    :param net: SpicePy network (multi-frequency .ac, solved)
+    :param decibel: if True the magnitude is in decibel
+    :param dpi: resolution
+    :param palette: if True the images use a 256-color palette
+    :param composite: if True the diagrams are tiled in a single image
+    :return: list of png images (bytes), one for each transfer function (only one if composite)
+    """
+    template = get_template('bode_db' if decibel else 'bode')
+
+    images = []
+    for out, inp in np.array(net.tf_cmd.upper().split()[1:]).reshape(-1, 2):
+        H = _quantity(net, out) / _quantity(net, inp)
+        if decibel:
+            magnitude, ylabel = 20 * np.log10(np.abs(H)), 'magnitude (dB)'
+        else:
+            magnitude, ylabel = np.abs(H), 'magnitude'
+
+        hf = template.draw([[(net.f, magnitude, out)], [(net.f, np.angle(H) * 180 / np.pi, out)]],
+                           [ylabel, 'phase (deg)'], 'frequency (Hz)', title='tf: ' + out + '/' + inp, legend=False, fontsize=14)
+        images.append(rasterize(hf, dpi))
+
+    if composite and len(images) > 1:
+        images = [tile(images)]
+    return [to_png(img, palette) for img in images]
+
+
+def render_sweep_op(name, values, results, dpi=RENDER_DPI, palette=False):
+    """
+    'render_sweep_op' plots the quantities of a .op sweep as functions of the swept value
+    (voltages and currents in separate subplots)
+
+    :param name: swept element
+    :param values: values of the element
+    :param results: dictionary label --> list of values (one for each value of the element)
+    :param dpi: resolution
+    :param palette: if True the image uses a 256-color palette
+    :return: bytes of the png image
+    """
+    voltages = [label for label in results if label[0] == 'V']
+    currents = [label for label in results if label[0] == 'I']
+    groups = [(group, ylabel) for group, ylabel in ((voltages, 'voltage (V)'), (currents, 'current (A)')) if group]
+
+    series = [[(values, results[label], label) for label in group] for group, ylabel in groups]
+    template = get_template('sweep_op', len(groups))
+    hf = template.draw(series, [ylabel for group, ylabel in groups], name)
+    return encode(hf, dpi, palette)
+
+
+def render_sweep_tran(t, name, values, results, dpi=RENDER_DPI, palette=False):
+    """
+    'render_sweep_tran' overlays the transient responses obtained with all values of the swept
+    element (one subplot for each quantity, waveforms are decimated as in 'render_tran')
+
+    :param t: time
+    :param name: swept element
+    :param values: values of the element
+    :param results: dictionary label --> list of waveforms (one for each value of the element)
+    :param dpi: resolution
+    :param palette: if True the image uses a 256-color palette
+    :return: bytes of the png image
+    """
+    series = [[decimate(t, waveform) + ('{} = {:.3g}'.format(name, value),)
+               for value, waveform in zip(values, waveforms)] for waveforms in results.values()]
+
+    template = get_template('sweep_tran', len(results))
+    hf = template.draw(series, list(results), 'time (s)', legend=len(values) <= 10, fontsize=14)
+    return encode(hf, dpi, palette)
+
+
+def warm_up():
+    """
+    'warm_up' builds and renders all templates (called when a worker starts)
+
+    :return: None
+    """
+    t = np.linspace(0, 1, 10)
+    f = np.logspace(0, 3, 10)
+    for nrows in (1, 2):
+        get_template('tran', nrows).draw([[(t, t, 'warm-up')]] * nrows, ['voltage (V)'] * nrows, 'time (s)')
+        encode(get_template('tran', nrows).fig)
+    for kind in ('bode', 'bode_db'):
+        get_template(kind).draw([[(f, f, 'warm-up')]] * 2, ['magnitude', 'phase (deg)'], 'frequency (Hz)',
+                                title='warm-up', legend=False, fontsize=14)
+        encode(get_template(kind).fig)
@@ -0,0 +1,251 @@
+# ======================
+# general python modules
+# ======================
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from botlib.ratelimit import TokenBucket
+
+
+class Rejected(Exception):
+    """
+    'Rejected' is raised when a job is not admitted
+    """
+    pass
+
+
+class RateLimited(Rejected):
+    """
+    'RateLimited' is raised when a user submits jobs too fast
+    """
+    pass
+
+
+class TooManyJobs(Rejected):
+    """
+    'TooManyJobs' is raised when a chat has too many jobs waiting or running
+    """
+    pass
+
+
+class Overloaded(Rejected):
+    """
+    'Overloaded' is raised when too many jobs are waiting (load shedding)
+    """
+    pass
+
+
+class FairScheduler(object):
+    """
+    'FairScheduler' admits jobs and feeds them to the solver pool.
+
+    Admission: each user has a token bucket (rate and burst), each chat has a maximum number
+    of jobs waiting or running, and the total number of waiting jobs is limited.
+    Scheduling: jobs wait in per-user queues served round-robin, so that a user with many
+    jobs does not delay the others. Priority jobs (admins) skip the admission checks and
+    are served first. The pool never holds more jobs than 'slots'.
+    """
+
+    def __init__(self, pool, slots=None, rate=0.1, burst=5, max_per_chat=2, max_queue=100):
+        """
+        :param pool: SolverPool
+        :param slots: maximum number of jobs sent to the pool at the same time (default: pool processes)
+        :param rate: sustained number of jobs per second for each user
+        :param burst: number of jobs a user can submit at once
+        :param max_per_chat: maximum number of jobs (waiting or running) of a chat
+        :param max_queue: maximum number of waiting jobs
+        """
+        self.pool = pool
+        self.slots = slots or pool.processes
+        self.rate = rate
+        self.burst = burst
+        self.max_per_chat = max_per_chat
+        self.max_queue = max_queue
+        self._buckets = {}
+        self._chats = {}             # chat_id --> jobs waiting or running
+        self._priority = deque()     # priority jobs
+        self._queues = OrderedDict()    # user_id --> deque of jobs (round-robin order)
+        self._waiting = 0
+        self._dispatched = 0
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """
+        'start' runs the dispatching thread
+
+        :return: None
+        """
+        self._thread = threading.Thread(target=self._run, name='FairScheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        'stop' stops the dispatching thread (waiting jobs are cancelled)
+
+        :return: None
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        with self._cond:
+            jobs = list(self._priority) + [job for jobs in self._queues.values() for job in jobs]
+            self._priority.clear()
+            self._queues.clear()
+            self._waiting = 0
+        for job in jobs:
+            job[0].cancel()
+
+    def submit(self, user_id, chat_id, func, *args, priority=False, **kwargs):
+        """
+        'submit' admits a job
+
+        :param user_id: user submitting the job
+        :param chat_id: chat of the job
+        :param func: function to be executed in the pool (see SolverPool.submit)
+        :param args: positional arguments of func
+        :param priority: if True the job skips the admission checks and is served first
+        :param kwargs: keyword arguments of func
+        :return:
+            * future: Future with the result of the job
+            * position: 0 if the job is sent to the pool at once, otherwise position in the queue
+        """
+        future = Future()
+        job = (future, user_id, chat_id, func, args, kwargs)
+
+        with self._cond:
+            if self._stopped:
+                raise Overloaded("scheduler stopped")
+
+            if not priority:
+                if self._chats.get(chat_id, 0) >= self.max_per_chat:
+                    raise TooManyJobs("{} jobs already submitted".format(self.max_per_chat))
+                if self._waiting >= self.max_queue:
+                    raise Overloaded("{} jobs already waiting".format(self.max_queue))
+                if not self._bucket(user_id).try_acquire():
+                    raise RateLimited("more than {} jobs in a row".format(self.burst))
+
+            self._chats[chat_id] = self._chats.get(chat_id, 0) + 1
+            self._waiting += 1
+            if priority:
+                self._priority.append(job)
+            else:
+                self._queues.setdefault(user_id, deque()).append(job)
+
+            position = self._position(user_id, priority)
+            self._cond.notify()
+
+        return future, position
+
+    def queue_depth(self):
+        """
+        'queue_depth' provides the number of waiting jobs
+
+        :return: number of waiting jobs
+        """
+        return self._waiting
+
+    def _bucket(self, user_id):
+        """
+        '_bucket' provides the token bucket of a user (buckets not used for a while are removed)
+
+        :param user_id: user id
+        :return: TokenBucket
+        """
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= 1000:
+                for old in [key for key, value in self._buckets.items() if value.is_full()]:
+                    del self._buckets[old]
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _position(self, user_id, priority):
+        """
+        '_position' estimates the position of the last job of a user (round-robin order)
+
+        :param user_id: user id
+        :param priority: True if the job is a priority one
+        :return: 0 if a pool slot is available, otherwise position in the queue
+        """
+        if priority:
+            ahead = len(self._priority) - 1
+        else:
+            k = len(self._queues[user_id])
+            ahead = len(self._priority) + k - 1
+            ahead += sum(min(len(jobs), k) for key, jobs in self._queues.items() if key != user_id)
+
+        free = self.slots - self._dispatched
+        return max(0, ahead - free + 1)
+
+    def _next(self):
+        """
+        '_next' takes the next job (priority jobs first, then round-robin over users)
+
+        :return: job
+        """
+        if self._priority:
+            return self._priority.popleft()
+
+        user_id, jobs = self._queues.popitem(last=False)
+        job = jobs.popleft()
+        if jobs:
+            # the user goes to the end of the round
+            self._queues[user_id] = jobs
+        return job
+
+    def _run(self):
+        """
+        '_run' sends the jobs to the pool when a slot is free
+
+        :return: None
+        """
+        while True:
+            with self._cond:
+                while not self._stopped and (self._waiting == 0 or self._dispatched >= self.slots):
+                    self._cond.wait()
+                if self._stopped:
+                    break
+
+                job = self._next()
+                self._waiting -= 1
+                self._dispatched += 1
+
+            future, user_id, chat_id, func, args, kwargs = job
+            try:
+                pool_future = self.pool.submit(func, *args, **kwargs)
+            except Exception as e:
+                self._done(job, None, e)
+                continue
+            pool_future.add_done_callback(lambda res, job=job: self._done(job, res))
+
+    def _done(self, job, pool_future, exception=None):
+        """
+        '_done' releases the slot of a job and passes on its result
+
+        :param job: job
+        :param pool_future: Future of the pool (None if exception is provided)
+        :param exception: exception raised while submitting the job
+        :return: None
+        """
+        future, user_id, chat_id = job[:3]
+
+        with self._cond:
+            self._dispatched -= 1
+            self._chats[chat_id] -= 1
+            if self._chats[chat_id] == 0:
+                del self._chats[chat_id]
+            self._cond.notify()
+
+        if exception is None:
+            exception = pool_future.exception()
+        if exception is None:
+            future.set_result(pool_future.result())
+        else:
+            future.set_exception(exception)
@@ -0,0 +1,142 @@
+# ======================
+# general python modules
+# ======================
+import os
+import glob
+import sqlite3
+import threading
+from collections import namedtuple
+
+# user settings (all flags are False by default)
+#   * nodal_pot: node potentials included in the results
+#   * polar: complex numbers in polar form
+#   * decibel: bode plots in decibel
+#   * composite: bode plots of all transfer functions tiled in one image
+Settings = namedtuple('Settings', ['nodal_pot', 'polar', 'decibel', 'composite'])
+DEFAULT = Settings(nodal_pot=False, polar=False, decibel=False, composite=False)
+
+# columns of the settings table (same order of Settings)
+COLUMNS = ', '.join(Settings._fields)
+INSERT = 'INSERT OR REPLACE INTO settings (chat_id, {}) VALUES (?, {})'.format(
+    COLUMNS, ', '.join('?' * len(Settings._fields)))
+
+
+class SettingsStore(object):
+    """
+    'SettingsStore' keeps the settings of all users in a SQLite database (WAL mode).
+    Settings are cached in memory: lookups do not access the database.
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: SQLite database
+        """
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS settings ('
+                         'chat_id INTEGER PRIMARY KEY, '
+                         'nodal_pot INTEGER NOT NULL DEFAULT 0, '
+                         'polar INTEGER NOT NULL DEFAULT 0, '
+                         'decibel INTEGER NOT NULL DEFAULT 0, '
+                         'composite INTEGER NOT NULL DEFAULT 0)')
+
+        # databases created before a flag was added
+        existing = [row[1] for row in self._db.execute('PRAGMA table_info(settings)')]
+        for field in Settings._fields:
+            if field not in existing:
+                self._db.execute('ALTER TABLE settings ADD COLUMN {} INTEGER NOT NULL DEFAULT 0'.format(field))
+
+        # load all settings in the cache
+        self._cache = {}
+        for row in self._db.execute('SELECT chat_id, {} FROM settings'.format(COLUMNS)):
+            self._cache[row[0]] = Settings(*[bool(flag) for flag in row[1:]])
+
+    def get(self, chat_id):
+        """
+        'get' provides the settings of a user (default settings for unknown users)
+
+        :param chat_id: chat id
+        :return: Settings
+        """
+        return self._cache.get(chat_id, DEFAULT)
+
+    def reset(self, chat_id):
+        """
+        'reset' restores the default settings of a user
+
+        :param chat_id: chat id
+        :return: Settings
+        """
+        return self.set(chat_id, DEFAULT)
+
+    def set(self, chat_id, settings):
+        """
+        'set' stores the settings of a user
+
+        :param chat_id: chat id
+        :param settings: Settings
+        :return: Settings
+        """
+        with self._lock:
+            self._db.execute(INSERT, (chat_id,) + tuple(int(flag) for flag in settings))
+            self._cache[chat_id] = settings
+        return settings
+
+    def toggle(self, chat_id, field):
+        """
+        'toggle' switches a flag of the user settings (atomic)
+
+        :param chat_id: chat id
+        :param field: name of the flag ('nodal_pot', 'polar', 'decibel' or 'composite')
+        :return: new Settings
+        """
+        if field not in Settings._fields:
+            raise ValueError("unknown setting '{}'".format(field))
+
+        with self._lock:
+            old = self._cache.get(chat_id, DEFAULT)
+            new = old._replace(**{field: not getattr(old, field)})
+            self._db.execute(INSERT, (chat_id,) + tuple(int(flag) for flag in new))
+            self._cache[chat_id] = new
+        return new
+
+    def import_cnf(self, folder):
+        """
+        'import_cnf' imports the old '<chat_id>.cnf' files (three lines: nodal_pot, polar
+        and decibel flags). Imported files are renamed '<chat_id>.cnf.imported'.
+
+        :param folder: folder with the cnf files
+        :return: number of imported files
+        """
+        cnt = 0
+        for fname in glob.glob(os.path.join(folder, '*.cnf')):
+            try:
+                chat_id = int(os.path.basename(fname)[:-4])
+                with open(fname) as fid:
+                    flags = [fid.readline().strip() == 'True' for k in range(3)]
+            except (ValueError, OSError):
+                continue
+
+            with self._lock:
+                self._db.execute('INSERT OR IGNORE INTO settings (chat_id, nodal_pot, polar, decibel) '
+                                 'VALUES (?, ?, ?, ?)', (chat_id,) + tuple(int(flag) for flag in flags))
+                row = self._db.execute('SELECT {} FROM settings WHERE chat_id = ?'.format(COLUMNS),
+                                       (chat_id,)).fetchone()
+                self._cache[chat_id] = Settings(*[bool(flag) for flag in row])
+
+            os.replace(fname, fname + '.imported')
+            cnt += 1
+
+        return cnt
+
+    def close(self):
+        """
+        'close' closes the database
+
+        :return: None
+        """
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,217 @@
+# ======================
+# general python modules
+# ======================
+import io
+import os
+import time
+import tempfile
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+# ===================
+# module from SpicePy
+# ===================
+import spicepy.netlist as ntl
+
+# sparse solver (SpicePy is used as fallback)
+from botlib.engine import solve_network
+
+# cost-based guard (replaces the former limits on nodes and samples)
+from botlib import cost as cost_model
+
+# plots are drawn on pre-built figure templates
+from botlib import render
+
+
+def read_network(netlist):
+    """
+    'read_network' creates a SpicePy network from the netlist text
+
+    :param netlist: string with the netlist
+    :return: SpicePy network
+    """
+    # SpicePy reads netlists from file: use a temporary file owned by this process
+    fd, fname = tempfile.mkstemp(suffix='.txt')
+    try:
+        with os.fdopen(fd, 'w') as fid:
+            fid.write(netlist)
+        net = ntl.Network(fname)
+    finally:
+        os.remove(fname)
+
+    return net
+
+
+def solve(netlist, nodal_pot=False, polar=False, dB=False, budget=cost_model.CPU_BUDGET,
+          dpi=render.RENDER_DPI, palette=False, composite=False):
+    """
+    'solve' parses, solves and renders a netlist. It runs in the solver workers.
+
+    :param netlist: string with the netlist
+    :param nodal_pot: if True node potentials are included in the results
+    :param polar: if True complex numbers are printed in polar form
+    :param dB: if True bode plots are in decibel
+    :param budget: CPU budget (s): larger analyses are downscaled or rejected (see botlib.cost)
+    :param dpi: resolution of the plots
+    :param palette: if True plots use a 256-color palette (smaller images)
+    :param composite: if True the bode plots of all transfer functions are tiled in one image
+    :return: dictionary with
+        * analysis: analysis type
+        * solved: True if the network has been solved
+        * mex: solution formatted in a string (None when the solution is a plot)
+        * notes: messages to be sent before the solution
+        * plots: list of png images (bytes) with the plots
+        * cost: estimated CPU time (s)
+        * downscaled: True if the number of samples has been reduced
+        * render_time: rendering time (s) of each plot
+        * preview: True if plots are rendered below the default resolution
+        * timings: time (s) spent in each stage (parse, frequency_span, solve, branch, print, render)
+        * engine_fallback: error of the sparse engine when the network has been solved by SpicePy (None otherwise)
+    """
+    sol = {'analysis': None, 'solved': False, 'mex': None, 'notes': [], 'plots': [],
+           'cost': 0, 'downscaled': False, 'render_time': [], 'preview': dpi < render.RENDER_DPI,
+           'timings': {}, 'engine_fallback': None}
+    timings = sol['timings']
+
+    # create network
+    start = time.perf_counter()
+    net = read_network(netlist)
+    sol['analysis'] = net.analysis[0].lower()
+    timings['parse'] = time.perf_counter() - start
+
+    # estimate the cost of the job and compare it with the CPU budget
+    if sol['analysis'] == '.ac':
+        start = time.perf_counter()
+        net.frequency_span()
+        timings['frequency_span'] = time.perf_counter() - start
+    original_samples = cost_model.count_samples(net)
+    decision, samples, cost = cost_model.plan(net, budget)
+    sol['cost'] = cost['total']
+
+    if decision == 'reject':
+        mex = "Your netlist is too demanding for this bot: "
+        mex += "{:d} unknowns and {:d} samples (estimated *{:.0f} s* of CPU).\n".format(
+            cost['unknowns'], cost['samples'], cost['total'])
+        mex += "*The limit on this bot is currently {:.0f} s.*\n".format(budget)
+        mex += "Please reduce the size of the network (or of the analysis) or take a look to the computational "
+        mex += "core of this bot that does not have this limitation:\n"
+        mex += "[SpicePy project](https://github.com/giaccone/SpicePy)"
+        sol['mex'] = mex
+        return sol
+
+    elif decision == 'downscale':
+        old_analysis = "`" + " ".join(net.analysis) + "`"
+        if sol['analysis'] == '.tran':
+            step = float(net.convert_unit(net.analysis[2])) / (samples - 1)
+            net.analysis[1] = '{:.3e}'.format(step)
+        else:
+            scale = samples / original_samples
+            net.analysis[2] = str(max(1, int(np.floor(scale * float(net.convert_unit(net.analysis[2]))))))
+            net.frequency_span()
+            samples = cost_model.count_samples(net)
+        new_analysis = "`" + " ".join(net.analysis) + "`"
+        sol['downscaled'] = True
+
+        mex = "Your netlist defines a '{}' analysis with *{:d}* samples\n".format(sol['analysis'], original_samples)
+        mex += "Since this bot runs on a limited hardware shared by many users\n"
+        mex += "The analysis has been limited to *{:d}* samples:\n".format(samples)
+        mex += "original analysis: " + old_analysis + "\n"
+        mex += "new analysis: " + new_analysis + "\n"
+        sol['notes'].append(mex)
+
+    if sol['analysis'] == '.op':
+        # force polar to False for .op problems
+        polar = False
+
+    # solve the network
+    start = time.perf_counter()
+    sol['engine_fallback'] = solve_network(net)
+    sol['solved'] = True
+    timings['solve'] = time.perf_counter() - start
+
+    # .op and .ac (single-frequency): prepare mex to be printed
+    if (sol['analysis'] == '.op') | ((sol['analysis'] == '.ac') & (np.isscalar(net.f))):
+        # get branch quantities
+        start = time.perf_counter()
+        net.branch_voltage()
+        net.branch_current()
+        net.branch_power()
+        timings['branch'] = time.perf_counter() - start
+
+        # prepare message
+        start = time.perf_counter()
+        mex = net.print(polar=polar, message=True)
+        mex = mex.replace('==============================================\n'
+                          '               branch quantities'
+                          '\n==============================================\n', '*branch quantities*\n`')
+        mex = mex.replace('----------------------------------------------', '')
+        mex += '`'
+
+        # if the user wants node potentials add it to mex
+        if nodal_pot:
+            # create local dictionary node-number 2 node-label
+            num2node_label = {num: name for name, num in net.node_label2num.items() if name != '0'}
+
+            # compute the node potentials
+            mex0 = '*node potentials*\n`'
+            for num in num2node_label:
+                voltage = net.get_voltage('(' + num2node_label[num] + ')')[0]
+                if polar:
+                    mex0 += 'v(' + num2node_label[num] + ') = {:10.4f} V < {:10.4f}°\n'.format(np.abs(voltage), np.angle(voltage) * 180 / np.pi)
+                else:
+                    mex0 += 'v(' + num2node_label[num] + ') = {:10.4f} V\n'.format(voltage)
+
+            # add newline
+            mex0 += '`\n\n'
+
+            # add node potentials before branch quantities
+            mex = mex0 + mex
+
+        sol['mex'] = mex
+        timings['print'] = time.perf_counter() - start
+
+    elif sol['analysis'] == '.tran':
+        start = time.perf_counter()
+        try:
+            plots = [render.render_tran(net, dpi, palette)]
+        except Exception:
+            # layouts not supported by the templates: plot with SpicePy
+            plt.close('all')
+            plots = [render.encode_pyplot(net.plot(), dpi, palette)]
+        sol['plots'] += plots
+        sol['render_time'].append(time.perf_counter() - start)
+        timings['render'] = sum(sol['render_time'])
+
+    elif sol['analysis'] == '.ac':
+        start = time.perf_counter()
+        try:
+            plots = render.render_bode(net, dB, dpi, palette, composite)
+        except Exception:
+            plt.close('all')
+            hf = net.bode(decibel=dB)
+            plots = [render.encode_pyplot(fig, dpi, palette) for fig in (hf if isinstance(hf, list) else [hf])]
+        sol['plots'] += plots
+        sol['render_time'] += [(time.perf_counter() - start) / len(plots)] * len(plots)
+        timings['render'] = sum(sol['render_time'])
+
+    return sol
+
+
+def warm_up():
+    """
+    'warm_up' builds the figure templates (see botlib.render) and renders an empty pyplot figure,
+    so that the first job of a worker does not pay the matplotlib initialization (fonts, backend)
+
+    :return: None
+    """
+    render.warm_up()
+
+    hf = plt.figure()
+    plt.plot([0, 1], [0, 1], label='warm-up')
+    plt.xlabel('time (s)', fontsize=16)
+    plt.legend()
+    plt.tight_layout()
+    hf.savefig(io.BytesIO(), format='png', dpi=150)
+    plt.close(hf)
@@ -0,0 +1,278 @@
+# ======================
+# general python modules
+# ======================
+import os
+import json
+import time
+import logging
+import threading
+
+from botlib.logs import log_segments, open_segment
+
+# analysis types
+ANALYSES = ('.op', '.ac', '.tran')
+
+# time windows available for queries (s)
+WINDOWS = {'24h': 24 * 3600, '7d': 7 * 24 * 3600, '30d': 30 * 24 * 3600}
+
+
+def parse_stat_line(line):
+    """
+    'parse_stat_line' parses a line of StatBot.log
+    (e.g. '2019-01-01 10:00:00,000 - StatLog - INFO - Analysis: .op - UserID: 123')
+
+    :param line: line of the log
+    :return: analysis, user id, timestamp
+    """
+    ele = line.split(' - ')
+    timestamp = time.mktime(time.strptime(ele[0][:19], '%Y-%m-%d %H:%M:%S'))
+    analysis = ele[3].replace('Analysis: ', '').lower()
+    user_id = int(ele[4].replace('UserID: ', ''))
+    return analysis, user_id, timestamp
+
+
+class UsageStats(object):
+    """
+    'UsageStats' keeps running aggregates about the use of the bot: number of analyses per
+    type and distinct users (all-time, per day and, for the last 24 hours, per hour).
+    """
+
+    def __init__(self, filename=None, exclude=()):
+        """
+        :param filename: json file used as checkpoint (None: not persistent)
+        :param exclude: user ids not included in the stats (e.g. admins)
+        """
+        self.filename = filename
+        self.exclude = set(exclude)
+        self.offset = 0    # bytes of StatBot.log already included in the aggregates
+        self._total = self._bucket()
+        self._days = {}
+        self._hours = {}
+        self._seen = set()    # all users found in the log (excluded users too)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket():
+        return {'analysis': {key: 0 for key in ANALYSES}, 'users': set()}
+
+    def add(self, analysis, user_id, timestamp=None):
+        """
+        'add' records an analysis
+
+        :param analysis: analysis type
+        :param user_id: user id
+        :param timestamp: time of the analysis (default: now)
+        :return: None
+        """
+        with self._lock:
+            self._seen.add(user_id)
+        if user_id in self.exclude:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+
+        day = time.strftime('%Y-%m-%d', time.localtime(timestamp))
+        hour = int(timestamp // 3600)
+
+        with self._lock:
+            if hour not in self._hours:
+                # new hour: drop hours older than 24 h
+                for old in [h for h in self._hours if h <= hour - 24]:
+                    del self._hours[old]
+                self._hours[hour] = self._bucket()
+            if day not in self._days:
+                self._days[day] = self._bucket()
+
+            for bucket in (self._total, self._days[day], self._hours[hour]):
+                bucket['analysis'][analysis] = bucket['analysis'].get(analysis, 0) + 1
+                bucket['users'].add(user_id)
+
+    def query(self, window=None):
+        """
+        'query' provides the aggregates
+
+        :param window: None (all-time) or one of the keys of WINDOWS
+        :return: dictionary with the number of analyses per type and the number of users
+        """
+        with self._lock:
+            if window is None:
+                buckets = [self._total]
+            elif window == '24h':
+                hour = int(time.time() // 3600)
+                buckets = [bucket for h, bucket in self._hours.items() if h > hour - 24]
+            else:
+                first_day = time.strftime('%Y-%m-%d', time.localtime(time.time() - WINDOWS[window]))
+                buckets = [bucket for day, bucket in self._days.items() if day > first_day]
+
+            analysis = {key: 0 for key in ANALYSES}
+            users = set()
+            for bucket in buckets:
+                for key, value in bucket['analysis'].items():
+                    analysis[key] = analysis.get(key, 0) + value
+                users.update(bucket['users'])
+
+        return {'analysis': analysis, 'users': len(users)}
+
+    def all_users(self):
+        """
+        'all_users' provides all users found in StatBot.log (excluded users too)
+
+        :return: set of user ids
+        """
+        with self._lock:
+            return set(self._seen)
+
+    def _read_users(self, logfile):
+        """
+        '_read_users' collects the users of all segments of StatBot.log (aggregates are not changed)
+
+        :param logfile: StatBot.log
+        :return: None
+        """
+        users = set()
+        for fname in log_segments(logfile):
+            with open_segment(fname) as fid:
+                for line in fid:
+                    try:
+                        users.add(parse_stat_line(line.decode('utf-8'))[1])
+                    except (ValueError, IndexError):
+                        pass
+
+        with self._lock:
+            self._seen.update(users)
+
+    def _read_segment(self, fname, offset=0):
+        """
+        '_read_segment' adds to the aggregates the lines of a log segment
+
+        :param fname: log segment
+        :param offset: first byte to be read
+        :return: number of lines read and position at the end of the segment
+        """
+        cnt = 0
+        with open_segment(fname) as fid:
+            fid.seek(offset)
+            for line in fid:
+                try:
+                    self.add(*parse_stat_line(line.decode('utf-8')))
+                    cnt += 1
+                except (ValueError, IndexError):
+                    pass
+            return cnt, fid.tell()
+
+    def read_log(self, logfile, bootstrap=False):
+        """
+        'read_log' adds to the aggregates the part of StatBot.log not yet included
+
+        :param logfile: StatBot.log
+        :param bootstrap: if True all rotated segments are read too (no checkpoint available)
+        :return: number of lines read
+        """
+        segments = log_segments(logfile)
+        rotated = [fname for fname in segments if fname != logfile]
+
+        cnt = 0
+        if bootstrap:
+            # read all rotated segments (oldest first)
+            for fname in rotated[::-1]:
+                cnt += self._read_segment(fname)[0]
+            self.offset = 0
+
+        elif os.path.exists(logfile) and os.path.getsize(logfile) < self.offset:
+            # the log has been rotated: read the end of the previous segment
+            if rotated:
+                cnt += self._read_segment(rotated[0], self.offset)[0]
+            self.offset = 0
+
+        if os.path.exists(logfile):
+            n, self.offset = self._read_segment(logfile, self.offset)
+            cnt += n
+
+        return cnt
+
+    def save(self, logfile=None):
+        """
+        'save' writes the checkpoint (if filename is set)
+
+        :param logfile: StatBot.log (its size is saved to read only new lines on load)
+        :return: None
+        """
+        if self.filename is None:
+            return
+
+        if (logfile is not None) and os.path.exists(logfile):
+            self.offset = os.path.getsize(logfile)
+
+        with self._lock:
+            data = {'offset': self.offset,
+                    'total': self._dump(self._total),
+                    'days': {day: self._dump(bucket) for day, bucket in self._days.items()},
+                    'hours': {str(hour): self._dump(bucket) for hour, bucket in self._hours.items()},
+                    'seen': sorted(self._seen)}
+
+        with open(self.filename + '.tmp', 'w') as fid:
+            json.dump(data, fid)
+        os.replace(self.filename + '.tmp', self.filename)
+
+    def load(self, logfile=None):
+        """
+        'load' reads the checkpoint (if filename is set and the file exists) and the
+        new lines of StatBot.log
+
+        :param logfile: StatBot.log
+        :return: None
+        """
+        bootstrap = True
+        read_users = False
+        if (self.filename is not None) and os.path.exists(self.filename):
+            try:
+                with open(self.filename) as fid:
+                    data = json.load(fid)
+
+                with self._lock:
+                    self.offset = data['offset']
+                    self._total = self._restore(data['total'])
+                    self._days = {day: self._restore(bucket) for day, bucket in data['days'].items()}
+                    self._hours = {int(hour): self._restore(bucket) for hour, bucket in data['hours'].items()}
+                    self._seen = set(data.get('seen', ()))
+                bootstrap = False
+                # checkpoints written before 'seen' was added: users are read from the whole log
+                read_users = 'seen' not in data
+            except (OSError, ValueError, KeyError):
+                self.offset = 0
+
+        if logfile is not None:
+            self.read_log(logfile, bootstrap=bootstrap)
+            if read_users:
+                self._read_users(logfile)
+
+    @staticmethod
+    def _dump(bucket):
+        return {'analysis': bucket['analysis'], 'users': sorted(bucket['users'])}
+
+    @staticmethod
+    def _restore(bucket):
+        return {'analysis': bucket['analysis'], 'users': set(bucket['users'])}
+
+
+class StatsHandler(logging.Handler):
+    """
+    'StatsHandler' updates UsageStats every time StatLog logs an analysis
+    """
+
+    def __init__(self, stats):
+        """
+        :param stats: UsageStats
+        """
+        super().__init__(level=logging.INFO)
+        self.stats = stats
+
+    def emit(self, record):
+        # message: 'Analysis: .op - UserID: 123'
+        try:
+            ele = record.getMessage().split(' - ')
+            analysis = ele[0].replace('Analysis: ', '').lower()
+            user_id = int(ele[1].replace('UserID: ', ''))
+            self.stats.add(analysis, user_id, record.created)
+        except (ValueError, IndexError):
+            self.handleError(record)
@@ -0,0 +1,263 @@
+# ======================
+# general python modules
+# ======================
+import numpy as np
+from scipy.sparse import csc_matrix
+from scipy.sparse.linalg import splu
+
+# =============
+# bot modules
+# =============
+from botlib.solver import read_network
+from botlib.engine import initial_conditions, transient_rhs, trapezoidal
+from botlib import cost as cost_model
+from botlib import render
+from botlib.decimate import PLOT_WIDTH
+
+# maximum number of values of a sweep
+SWEEP_MAX = 50
+
+# maximum number of quantities plotted (node potentials when the netlist has no .plot)
+QUANTITIES_MAX = 8
+
+# elements that can be swept (sources must be constant)
+SWEEP_ELEMENTS = ('R', 'C', 'L', 'V', 'I')
+
+
+def _quantities(net):
+    """
+    '_quantities' provides the quantities to be plotted: the ones of .plot (if any) or the node potentials
+
+    :param net: SpicePy network
+    :return: list of labels (e.g. ['V(2)', 'I(R1)'])
+    """
+    if net.plot_cmd is not None:
+        labels = net.plot_cmd.upper().split()[1:]
+    else:
+        labels = ['V({})'.format(name) for name, num in sorted(net.node_label2num.items(), key=lambda ele: ele[1])
+                  if name != '0']
+    return labels[:QUANTITIES_MAX]
+
+
+def _evaluate(net, label):
+    """
+    '_evaluate' computes a quantity from the current solution of the network
+
+    :param net: SpicePy network (solved)
+    :param label: 'V(...)' or 'I(...)'
+    :return: value (scalar for .op, array for .tran)
+    """
+    variable = label[2:-1]
+    if label[0] == 'V':
+        res = net.get_voltage(variable)
+    else:
+        res = net.get_current(variable)
+    res = np.real(np.squeeze(res))
+    return res.item() if res.ndim == 0 else res
+
+
+def _incidence(net, index):
+    """
+    '_incidence' provides the incidence vector of a two-terminal element (node rows of the MNA unknowns)
+
+    :param net: SpicePy network (matrices already built)
+    :param index: index of the element
+    :return: incidence vector
+    """
+    a = np.zeros(net.G.shape[0])
+    N1, N2 = net.nodes[index]
+    if N1 != 0:
+        a[N1 - 1] = 1
+    if N2 != 0:
+        a[N2 - 1] = -1
+    return a
+
+
+def op_sweep(net, index, values):
+    """
+    'op_sweep' solves a .op network for all values of an element at once.
+    The MNA matrix is factorized once: a resistor is a rank-one update of the matrix
+    (Sherman-Morrison formula) and a source is a linear update of the rhs.
+
+    :param net: SpicePy network (.op)
+    :param index: index of the element
+    :param values: values of the element
+    :return: solutions (one column for each value)
+    """
+    name = net.names[index]
+    v0 = net.values[index]
+
+    net.conductance_matrix()
+    net.rhs_matrix()
+    rhs0 = np.asarray(net.rhs, dtype=float)
+    lu = splu(net.G.tocsc())
+    x0 = lu.solve(rhs0)
+
+    if name[0].upper() == 'R':
+        a = _incidence(net, index)
+        z = lu.solve(a)
+
+        dg = 1.0 / values - 1.0 / v0
+        X = x0[:, np.newaxis] - z[:, np.newaxis] * (dg * (a @ x0) / (1 + dg * (a @ z)))[np.newaxis, :]
+
+    else:
+        # rhs due to a unit change of the source
+        net.values[index] = v0 + 1
+        net.rhs_matrix()
+        u = lu.solve(np.asarray(net.rhs, dtype=float) - rhs0)
+        X = x0[:, np.newaxis] + u[:, np.newaxis] * (values - v0)[np.newaxis, :]
+
+    net.values[index] = v0
+    return X
+
+
+def tran_sweep(net, index, values):
+    """
+    'tran_sweep' solves a .tran network for all values of an element.
+    The matrices and the rhs are assembled once: for each value only the stamp of a resistor,
+    capacitor or inductor is updated (one factorization for each value), while a source only
+    changes the rhs linearly (one factorization for all values). Initial conditions do not depend
+    on capacitors and inductors.
+
+    :param net: SpicePy network (.tran)
+    :param index: index of the element
+    :param values: values of the element
+    :return: generator of the solutions (net.values holds the value of the element while its solution is used)
+    """
+    kind = net.names[index][0].upper()
+    v0 = net.values[index]
+
+    h = float(net.convert_unit(net.analysis[1]))
+    net.t = np.arange(0, float(net.convert_unit(net.analysis[2])), h)
+    net.conductance_matrix()
+    net.dynamic_matrix()
+    rhs0 = transient_rhs(net)
+    G0 = net.G.tocsc()
+    C0 = net.C.tocsc()
+
+    # stamp of the element for a unit change of its value
+    if kind in ('R', 'C'):
+        a = csc_matrix(_incidence(net, index)).T
+        stamp = a @ a.T
+    elif kind == 'L':
+        row = net.node_num + sorted(net.isort[1]).index(index)
+        stamp = csc_matrix(([-1.0], ([row], [row])), shape=G0.shape)
+
+    else:
+        # rhs due to a unit change of the source (constant in time)
+        net.values[index] = v0 + 1
+        u = net.rhs_matrix()(0) - rhs0[:, 0]
+        net.values[index] = v0
+
+    lu = splu((C0 + 0.5 * h * G0).tocsc()) if kind in ('V', 'I') else None
+    x0 = initial_conditions(net) if kind in ('C', 'L') else None
+
+    try:
+        for value in values:
+            net.values[index] = value
+            G, C, rhs = G0, C0, rhs0
+            if kind == 'R':
+                G = G0 + (1.0 / value - 1.0 / v0) * stamp
+            elif kind in ('C', 'L'):
+                C = C0 + (value - v0) * stamp
+            else:
+                rhs = rhs0 + (value - v0) * u[:, np.newaxis]
+
+            x_init = x0 if x0 is not None else initial_conditions(net)
+            yield trapezoidal(G, C, rhs, h, x_init, lu)
+    finally:
+        net.values[index] = v0
+
+
+def sweep(netlist, element, start, stop, n, budget=cost_model.CPU_BUDGET, dpi=render.RENDER_DPI, palette=False):
+    """
+    'sweep' solves a netlist for n values of an element (linearly spaced between start and stop).
+    It runs in the solver workers.
+
+    :param netlist: string with the netlist
+    :param element: name of the element (e.g. 'R1')
+    :param start: first value (string, SpicePy units are allowed, e.g. '1k')
+    :param stop: last value
+    :param n: number of values
+    :param budget: CPU budget (s)
+    :param dpi: resolution of the plot
+    :param palette: if True the plot uses a 256-color palette
+    :return: dictionary (see botlib.solver.solve) with one plot
+    """
+    sol = {'analysis': None, 'solved': False, 'mex': None, 'notes': [], 'plots': [],
+           'cost': 0, 'downscaled': False}
+
+    net = read_network(netlist)
+    sol['analysis'] = net.analysis[0].lower()
+
+    # checks (names are case insensitive, as in SpicePy)
+    if sol['analysis'] not in ('.op', '.tran'):
+        sol['mex'] = "*Sweeps are available for .op and .tran analyses only.*"
+        return sol
+    names = [ele.upper() for ele in net.names]
+    if (element.upper() not in names) or (element[0].upper() not in SWEEP_ELEMENTS):
+        sol['mex'] = "*{} is not a resistor, capacitor, inductor or independent source " \
+                     "of your netlist.*".format(element)
+        return sol
+    index = names.index(element.upper())
+    name = net.names[index]
+    kind = name[0].upper()
+    if isinstance(net.values[index], list):
+        sol['mex'] = "*{} is a time-dependent source and cannot be swept.*".format(name)
+        return sol
+    if (sol['analysis'] == '.op') and (kind in ('C', 'L')):
+        sol['mex'] = "*{} has no effect on a .op analysis.*".format(name)
+        return sol
+    if not 2 <= n <= SWEEP_MAX:
+        sol['mex'] = "*The number of values must be between 2 and {}.*".format(SWEEP_MAX)
+        return sol
+
+    try:
+        bounds = [float(net.convert_unit(value)) for value in (start, stop)]
+    except ValueError:
+        bounds = [np.nan]
+    if not np.all(np.isfinite(bounds)):
+        sol['mex'] = "*Start and stop must be numbers* (SpicePy units are allowed, e.g. 1k or 2.2u)."
+        return sol
+
+    values = np.linspace(bounds[0], bounds[1], n)
+    if (kind in ('R', 'C', 'L')) and np.any(values <= 0):
+        sol['mex'] = "*Values of {} must be positive.*".format(name)
+        return sol
+
+    # cost: n solutions and one figure with n curves for each quantity
+    cost = cost_model.estimate(net)
+    labels = _quantities(net)
+    if sol['analysis'] == '.tran':
+        # the rhs (sources) is evaluated once for all values
+        rhs_cost = cost['samples'] * cost_model.SOURCE_COST * cost['sources']
+        sol['cost'] = n * (cost['solve'] - rhs_cost) + rhs_cost + cost_model.FIGURE_COST + n * len(labels) * (
+            cost_model.DECIMATE_COST * cost['samples'] + cost_model.POINT_COST * min(cost['samples'], 2 * PLOT_WIDTH))
+    else:
+        sol['cost'] = 2 * cost['solve'] + cost_model.FIGURE_COST
+    if sol['cost'] > budget:
+        mex = "Your sweep is too demanding for this bot (estimated *{:.0f} s* of CPU).\n".format(sol['cost'])
+        mex += "*The limit on this bot is currently {:.0f} s.*\n".format(budget)
+        mex += "Please reduce the number of values or the analysis."
+        sol['mex'] = mex
+        return sol
+
+    # solve
+    results = {label: [] for label in labels}
+    if sol['analysis'] == '.op':
+        X = op_sweep(net, index, values)
+        for k, value in enumerate(values):
+            net.x = X[:, k]
+            net.values[index] = value
+            for label in labels:
+                results[label].append(_evaluate(net, label))
+        sol['plots'].append(render.render_sweep_op(name, values, results, dpi, palette))
+    else:
+        for x in tran_sweep(net, index, values):
+            net.x = x
+            for label in labels:
+                results[label].append(_evaluate(net, label))
+        sol['plots'].append(render.render_sweep_tran(net.t, name, values, results, dpi, palette))
+
+    sol['solved'] = True
+    return sol
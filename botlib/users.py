@@ -0,0 +1,165 @@
+# ======================
+# general python modules
+# ======================
+import os
+import time
+import threading
+
+
+class UserRegistry(object):
+    """
+    'UserRegistry' keeps in memory all users of the bot with their last-seen time and
+    whether they can be reached (a broadcast failed because they closed the bot).
+
+    Files are only appended:
+        * database: one user id per line (new users)
+        * journal: '<user id> seen <timestamp>' and '<user id> reachable|unreachable' lines
+    """
+
+    def __init__(self, database, journal, seen_resolution=24 * 3600):
+        """
+        :param database: file with the user ids
+        :param journal: file with last-seen and reachability updates
+        :param seen_resolution: a new last-seen time is written only if the previous one is older (s)
+        """
+        self.database = database
+        self.journal = journal
+        self.seen_resolution = seen_resolution
+        self._users = {}    # user id --> [last seen (written), last seen, unreachable]
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        'load' reads database and journal
+
+        :return: None
+        """
+        journal_lines = 0
+        with self._lock:
+            if os.path.exists(self.database):
+                with open(self.database) as fid:
+                    for line in fid:
+                        try:
+                            self._users.setdefault(int(line), [0, 0, False])
+                        except ValueError:
+                            pass
+
+            if os.path.exists(self.journal):
+                with open(self.journal) as fid:
+                    for line in fid:
+                        journal_lines += 1
+                        ele = line.split()
+                        try:
+                            user = self._users.setdefault(int(ele[0]), [0, 0, False])
+                            if ele[1] == 'seen':
+                                user[0] = user[1] = float(ele[2])
+                            else:
+                                user[2] = ele[1] == 'unreachable'
+                        except (ValueError, IndexError):
+                            pass
+
+        # rewrite the journal when it is much longer than needed
+        if journal_lines > 2 * len(self._users) + 1000:
+            self.compact()
+
+    def compact(self):
+        """
+        'compact' rewrites the journal with the current state of each user
+
+        :return: None
+        """
+        with self._lock:
+            with open(self.journal + '.tmp', 'w') as fid:
+                for user_id, (seen, _, unreachable) in self._users.items():
+                    if seen:
+                        fid.write('{} seen {:.0f}\n'.format(user_id, seen))
+                    if unreachable:
+                        fid.write('{} unreachable\n'.format(user_id))
+            os.replace(self.journal + '.tmp', self.journal)
+
+    def _append(self, fname, line):
+        with open(fname, 'a') as fid:
+            fid.write(line + '\n')
+
+    def touch(self, user_id):
+        """
+        'touch' records a contact with a user
+
+        :param user_id: user id
+        :return: True if the user is new
+        """
+        now = time.time()
+        with self._lock:
+            user = self._users.get(user_id)
+            new = user is None
+            if new:
+                user = self._users[user_id] = [0, 0, False]
+                self._append(self.database, str(user_id))
+
+            user[1] = now
+            if now - user[0] >= self.seen_resolution:
+                user[0] = now
+                self._append(self.journal, '{} seen {:.0f}'.format(user_id, now))
+
+            # a user that contacts the bot is reachable again
+            if user[2]:
+                user[2] = False
+                self._append(self.journal, '{} reachable'.format(user_id))
+
+        return new
+
+    def set_reachable(self, user_id, reachable):
+        """
+        'set_reachable' records if a user can be reached (e.g. result of a broadcast)
+
+        :param user_id: user id
+        :param reachable: True/False
+        :return: None
+        """
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                # new users are written in the database (the journal can be compacted)
+                user = self._users[user_id] = [0, 0, False]
+                self._append(self.database, str(user_id))
+            if user[2] == reachable:
+                user[2] = not reachable
+                self._append(self.journal, '{} {}'.format(user_id, 'reachable' if reachable else 'unreachable'))
+
+    def merge(self, user_ids):
+        """
+        'merge' adds users known from other sources (e.g. StatBot.log)
+
+        :param user_ids: iterable of user ids
+        :return: number of new users
+        """
+        with self._lock:
+            new = [user_id for user_id in user_ids if user_id not in self._users]
+            if new:
+                with open(self.database, 'a') as fid:
+                    for user_id in new:
+                        self._users[user_id] = [0, 0, False]
+                        fid.write(str(user_id) + '\n')
+        return len(new)
+
+    def reachable_users(self):
+        """
+        'reachable_users' provides the users that can be reached
+
+        :return: list of user ids
+        """
+        with self._lock:
+            return [user_id for user_id, user in self._users.items() if not user[2]]
+
+    def last_seen(self, user_id):
+        """
+        'last_seen' provides the last contact with a user
+
+        :param user_id: user id
+        :return: timestamp (0 if unknown)
+        """
+        with self._lock:
+            return self._users[user_id][1] if user_id in self._users else 0
+
+    def __len__(self):
+        return len(self._users)
@@ -0,0 +1,212 @@
+# ======================
+# general python modules
+# ======================
+import json
+import asyncio
+import logging
+import threading
+
+# ==========================
+# python-temegam-bot modules
+# ==========================
+import telegram as telegram
+
+# HTTP responses
+RESPONSES = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+             405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+class WebhookServer(object):
+    """
+    'WebhookServer' is a minimal asyncio HTTP server receiving Telegram updates.
+    Each update is acknowledged immediately and then passed to 'on_update', which must
+    be fast (e.g. put the update in the dispatcher queue).
+    """
+
+    def __init__(self, listen, port, path, on_update, secret_token=None, max_body=2**20, idle_timeout=60):
+        """
+        :param listen: address to listen on
+        :param port: port
+        :param path: URL path of the webhook
+        :param on_update: function called with the update (dictionary decoded from json)
+        :param secret_token: if provided, requests must include it in 'X-Telegram-Bot-Api-Secret-Token'
+        :param max_body: maximum size of an update (bytes)
+        :param idle_timeout: idle connections are closed after this time (s)
+        """
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.on_update = on_update
+        self.secret_token = secret_token
+        self.max_body = max_body
+        self.idle_timeout = idle_timeout
+        self.logger = logging.getLogger('OtherLog')
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._connections = {}      # open connections: serving task --> stream writer (see _handle)
+
+    def start(self):
+        """
+        'start' runs the server in a background thread (with its own event loop)
+
+        :return: None
+        """
+        self._thread = threading.Thread(target=self._run, name='WebhookServer', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        """
+        'stop' stops the server (open connections are closed)
+
+        :return: None
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def _run(self):
+        """
+        '_run' is the body of the server thread
+
+        :return: None
+        """
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.listen, self.port))
+        if self.port == 0:
+            # random port (tests)
+            self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+
+        try:
+            self._loop.run_forever()
+        finally:
+            # stop accepting connections, then close the ones still open (e.g. keep-alive):
+            # wait_closed waits for them. Connections accepted just before the stop start
+            # their task later (see _handle): repeat until no task is left. The server is
+            # closed at the end: a connection accepted after close() would be leaked by asyncio
+            for sock in self._server.sockets:
+                self._loop.remove_reader(sock.fileno())
+            while True:
+                for writer in list(self._connections.values()):
+                    writer.close()
+                # run the callbacks already scheduled (e.g. connection_made of accepted connections)
+                self._loop.run_until_complete(asyncio.sleep(0))
+                tasks = asyncio.all_tasks(self._loop)
+                if not tasks:
+                    break
+                self._loop.run_until_complete(asyncio.wait(tasks, timeout=0.1))
+            self._server.close()
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+    def _check(self, method, path, headers):
+        """
+        '_check' validates a request
+
+        :param method: HTTP method
+        :param path: URL path
+        :param headers: HTTP headers (lowercase names)
+        :return: HTTP status
+        """
+        if path.split('?')[0] != self.path:
+            return 404
+        if method != 'POST':
+            return 405
+        if (self.secret_token is not None) and (headers.get('x-telegram-bot-api-secret-token') != self.secret_token):
+            return 403
+        return 200
+
+    async def _handle(self, reader, writer):
+        """
+        '_handle' serves a connection (keep-alive is supported)
+
+        :param reader: stream reader
+        :param writer: stream writer
+        :return: None
+        """
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                # request line and headers
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.idle_timeout)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                    break
+
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, path, version = lines[0].split(' ', 2)
+                    headers = {}
+                    for line in lines[1:]:
+                        if ':' in line:
+                            name, value = line.split(':', 1)
+                            headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    self._respond(writer, 400, False)
+                    break
+
+                if length > self.max_body:
+                    self._respond(writer, 413, False)
+                    break
+
+                body = await reader.readexactly(length)
+                status = self._check(method, path, headers)
+                keep_alive = (version.strip() == 'HTTP/1.1') and (headers.get('connection', '').lower() != 'close')
+
+                # acknowledge first, then pass the update
+                self._respond(writer, status, keep_alive)
+                await writer.drain()
+
+                if status == 200:
+                    try:
+                        self.on_update(json.loads(body.decode('utf-8')))
+                    except Exception as e:
+                        self.logger.error("Webhook update {} caused error {}".format(body[:200], e))
+
+                if not keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            self._connections.pop(task, None)
+
+    @staticmethod
+    def _respond(writer, status, keep_alive):
+        """
+        '_respond' writes an empty HTTP response
+
+        :param writer: stream writer
+        :param status: HTTP status
+        :param keep_alive: if False the connection will be closed
+        :return: None
+        """
+        writer.write('HTTP/1.1 {} {}\r\nContent-Length: 0\r\nConnection: {}\r\n\r\n'.format(
+            status, RESPONSES[status], 'keep-alive' if keep_alive else 'close').encode('latin-1'))
+
+
+def start_webhook(updater, server):
+    """
+    'start_webhook' starts dispatcher, job queue and the webhook server
+    (updates received by the server are put in the dispatcher queue)
+
+    :param updater: telegram Updater
+    :param server: WebhookServer (its on_update is set here)
+    :return: None
+    """
+    server.on_update = lambda data: updater.update_queue.put(telegram.Update.de_json(data, updater.bot))
+
+    # same as Updater.start_polling, without the polling thread
+    updater.running = True
+    updater.job_queue.start()
+    threading.Thread(target=updater.dispatcher.start, name='dispatcher').start()
+
+    server.start()
@@ -0,0 +1,129 @@
+# ==========================================
+# tests of the background broadcast
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+import os
+import json
+import threading
+
+import pytest
+import telegram
+
+from botlib import broadcast
+from botlib.broadcast import Broadcast
+
+
+class FakeBot(object):
+    """
+    'FakeBot' records the messages sent and raises the errors given for each chat
+    (errors: chat_id --> list of exceptions raised by the first attempts)
+    """
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self._lock:
+            errors = self.errors.get(chat_id)
+            if errors:
+                raise errors.pop(0)
+            self.sent.append(chat_id)
+
+
+@pytest.fixture(autouse=True)
+def no_chat_interval(monkeypatch):
+    monkeypatch.setattr(broadcast, 'CHAT_INTERVAL', 0)
+
+
+def run(job):
+    job.start()
+    job._thread.join(10)
+    assert not job.is_running()
+    return job
+
+
+def test_results(tmp_path):
+    """
+    reachable and unreachable chats are reported, chats with other errors are not sent
+    (the checkpoint is removed at the end)
+    """
+    checkpoint = str(tmp_path / 'broadcast.json')
+    bot = FakeBot({2: [telegram.error.Unauthorized('Forbidden: bot was blocked by the user')],
+                   3: [telegram.error.BadRequest('Chat not found')],
+                   4: [telegram.error.TelegramError('Internal error')]})
+    results = []
+    progress = []
+    job = run(Broadcast(bot, [1, 2, 3, 4, 5], '*hello*', checkpoint, workers=2,
+                        on_result=lambda chat_id, ok: results.append((chat_id, ok)),
+                        on_progress=lambda *args: progress.append(args)))
+
+    assert sorted(bot.sent) == [1, 5]
+    assert sorted(results) == [(1, True), (2, False), (3, False), (5, True)]
+    assert job.done == {1: True, 2: False, 3: False, 5: True}
+    assert job.failed == {4}
+    assert progress[-1] == (2, 3, 5, True)
+    assert not os.path.exists(checkpoint)
+
+
+def test_retry(tmp_path):
+    """
+    the message is sent again after RetryAfter (all senders wait) and after network errors
+    """
+    bot = FakeBot({1: [telegram.error.RetryAfter(0.2)], 2: [telegram.error.NetworkError('timeout')]})
+    job = run(Broadcast(bot, [1, 2, 3], 'hello', str(tmp_path / 'broadcast.json')))
+
+    assert sorted(bot.sent) == [1, 2, 3]
+    assert job.counters() == (3, 0, 3)
+
+
+def test_abort(tmp_path):
+    """
+    a markdown error aborts the broadcast: no chat is marked unreachable
+    """
+    checkpoint = str(tmp_path / 'broadcast.json')
+    error = "Can't parse entities: can't find end of the entity starting at byte offset 0"
+    bot = FakeBot({chat_id: [telegram.error.BadRequest(error)] for chat_id in range(1, 11)})
+    results = []
+    aborted = []
+    job = run(Broadcast(bot, range(1, 11), '*hello', checkpoint, workers=1,
+                        on_result=lambda *args: results.append(args), on_abort=aborted.append))
+
+    assert aborted == [error]
+    assert results == []
+    assert bot.sent == []
+    assert job.done == {}
+    assert not os.path.exists(checkpoint)
+
+
+def test_resume(tmp_path):
+    """
+    a resumed broadcast skips the chats already done and retries the others
+    (null entries of old checkpoints are retried too)
+    """
+    checkpoint = str(tmp_path / 'broadcast.json')
+    assert Broadcast.resume(FakeBot(), checkpoint) is None
+
+    with open(checkpoint, 'w') as fid:
+        json.dump({'text': 'hello', 'chat_ids': [1, 2, 3, 4], 'done': {'1': True, '2': False, '3': None}}, fid)
+
+    bot = FakeBot()
+    job = run(Broadcast.resume(bot, checkpoint))
+    assert sorted(bot.sent) == [3, 4]
+    assert job.done == {1: True, 2: False, 3: True, 4: True}
+    assert job.counters() == (3, 1, 4)
+
+
+def test_checkpoint(tmp_path):
+    """
+    the checkpoint written while the broadcast runs does not include the chats to be retried
+    """
+    checkpoint = str(tmp_path / 'broadcast.json')
+    job = Broadcast(FakeBot({2: [telegram.error.TelegramError('Internal error')]}), [1, 2], 'hello', checkpoint)
+    job.done = {1: True}
+    job.failed = {2}
+    job._save()
+
+    with open(checkpoint) as fid:
+        assert json.load(fid) == {'text': 'hello', 'chat_ids': [1, 2], 'done': {'1': True}}
@@ -0,0 +1,147 @@
+# ==========================================
+# tests of the result cache and of the coalescing of identical jobs
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+from concurrent.futures import Future
+
+import pytest
+
+from botlib.cache import ResultCache, SingleFlight, CancelledJob, RetryJob, netlist_key, normalize_netlist
+
+
+def solution(mex, size=0):
+    return {'mex': mex, 'notes': [], 'plots': [b'x' * size]}
+
+
+def test_normalize_netlist():
+    """
+    comments, unknown lines and extra whitespaces do not change the key
+    """
+    netlist = "* title\nV1  1 0   10 ; source\nr1 1 0 1k\n\n.op\n.end\nR2 1 0 1k\n"
+    assert normalize_netlist(netlist) == ['V1 1 0 10', 'r1 1 0 1k', '.op', '.end']
+    assert netlist_key(netlist) == netlist_key("V1 1 0 10\nr1 1 0 1k\n.op\n.end\n")
+    assert netlist_key(netlist) != netlist_key("V1 1 0 10\nr1 1 0 2k\n.op\n")
+
+
+def test_key_flags():
+    """
+    only the flags used by the analysis change the key
+    """
+    op = "V1 1 0 10\nR1 1 0 1k\n.op\n"
+    assert netlist_key(op, polar=True, dB=True) == netlist_key(op)
+    assert netlist_key(op, nodal_pot=True) != netlist_key(op)
+
+    ac = "V1 1 0 1\nR1 1 2 1k\nC1 2 0 1u\n.ac dec 10 1 1k\n.plot v(2)\n"
+    keys = {netlist_key(ac), netlist_key(ac, polar=True), netlist_key(ac, dB=True), netlist_key(ac, composite=True)}
+    assert len(keys) == 4
+
+    tran = "V1 1 0 pulse(0 1 0 1u 1u 1m 2m)\nR1 1 2 1k\nC1 2 0 1u\n.tran 1u 1m\n"
+    assert netlist_key(tran, nodal_pot=True, polar=True, dB=True) == netlist_key(tran)
+
+
+def test_lru():
+    """
+    least recently used solutions are evicted (number of entries and total size)
+    """
+    cache = ResultCache(max_entries=2, max_bytes=100)
+    cache.put('a', solution('a'))
+    cache.put('b', solution('b'))
+    assert cache.get('a')['mex'] == 'a'
+    cache.put('c', solution('c'))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+
+    cache.put('big', solution('big', size=97))
+    assert cache.get('a') is None and cache.get('c') is None
+    cache.put('huge', solution('huge', size=200))
+    assert cache.get('huge') is None
+    assert cache.stats() == {'hits': 2, 'misses': 4, 'entries': 1, 'bytes': 100}
+
+
+def test_save_load(tmp_path):
+    """
+    the cache survives a restart (a corrupted file is ignored)
+    """
+    fname = str(tmp_path / 'cache.pkl')
+    cache = ResultCache(filename=fname)
+    cache.put('a', solution('a'))
+    cache.save()
+
+    restarted = ResultCache(filename=fname)
+    restarted.load()
+    assert restarted.get('a')['mex'] == 'a'
+
+    with open(fname, 'wb') as fid:
+        fid.write(b'garbage')
+    corrupted = ResultCache(filename=fname)
+    corrupted.load()
+    assert corrupted.stats()['entries'] == 0
+
+
+def test_coalescing():
+    """
+    requests with the same key wait for the job of the leader (on_result is called once)
+    """
+    stored = []
+    flight = SingleFlight(on_result=lambda key, result: stored.append((key, result)))
+    first, leader = flight.acquire('k')
+    assert leader
+    second, leader = flight.acquire('k')
+    assert not leader and second is first
+    assert flight.coalesced == 1 and flight.in_flight() == 1
+
+    job = Future()
+    flight.attach('k', job)
+    job.set_result('sol')
+    assert first.result() == 'sol' and second.result() == 'sol'
+    assert stored == [('k', 'sol')]
+    assert flight.in_flight() == 0
+
+    # the key is free again
+    assert flight.acquire('k')[1]
+
+
+def test_errors():
+    """
+    failures and cancellations of the job are passed to all waiting requests (nothing is stored)
+    """
+    stored = []
+    flight = SingleFlight(on_result=lambda key, result: stored.append(key))
+
+    future, leader = flight.acquire('failed')
+    job = Future()
+    flight.attach('failed', job)
+    job.set_exception(ValueError('bad netlist'))
+    with pytest.raises(ValueError):
+        future.result()
+
+    future, leader = flight.acquire('cancelled')
+    job = Future()
+    flight.attach('cancelled', job)
+    job.cancel()
+    with pytest.raises(CancelledJob):
+        future.result()
+
+    future, leader = flight.acquire('not submitted')
+    flight.fail('not submitted', OSError('pool full'))
+    with pytest.raises(OSError):
+        future.result()
+
+    assert stored == []
+    assert flight.in_flight() == 0
+
+
+def test_release():
+    """
+    a key released by the leader (e.g. rate limit of its user) is acquired again by the waiting requests
+    """
+    flight = SingleFlight()
+    flight.acquire('k')
+    follower, leader = flight.acquire('k')
+    flight.release('k')
+    with pytest.raises(RetryJob):
+        follower.result()
+
+    # the follower becomes the leader
+    future, leader = flight.acquire('k')
+    assert leader and future is not follower
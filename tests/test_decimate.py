@@ -0,0 +1,59 @@
+# ==========================================
+# tests of the decimation of transient waveforms
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+import numpy as np
+
+from botlib.decimate import minmax, decimate
+
+
+def test_short_waveform():
+    """
+    waveforms with at most two samples per bucket are not decimated
+    """
+    y = np.random.default_rng(0).standard_normal(20)
+    assert np.array_equal(minmax(y, buckets=10), np.arange(20))
+
+
+def test_extrema():
+    """
+    minimum and maximum of each bucket are kept (first and last sample too), indices are sorted
+    """
+    rng = np.random.default_rng(1)
+    y = rng.standard_normal(1003)
+    idx = minmax(y, buckets=10)
+
+    assert idx[0] == 0 and idx[-1] == y.size - 1
+    assert np.all(np.diff(idx) > 0)
+    assert idx.size <= 2 * 10 + 2
+    size = int(np.ceil(y.size / 10))
+    for k in range(10):
+        block = y[k * size:(k + 1) * size]
+        assert k * size + block.argmin() in idx
+        assert k * size + block.argmax() in idx
+
+
+def test_peaks():
+    """
+    isolated peaks survive the decimation and the plot range is unchanged
+    """
+    t = np.linspace(0, 1, 100000)
+    y = np.sin(2 * np.pi * 5 * t)
+    y[12345] = 10
+    y[67890] = -10
+    td, yd = decimate(t, y, buckets=100)
+
+    assert td.size <= 202
+    assert (yd.max(), yd.min()) == (10, -10)
+    assert td[np.argmax(yd)] == t[12345]
+    assert (td[0], td[-1]) == (t[0], t[-1])
+
+
+def test_constant_tail():
+    """
+    the padding of the last bucket does not add samples beyond the waveform
+    """
+    y = np.arange(101, dtype=float)
+    idx = minmax(y, buckets=10)
+    assert idx.max() == 100
+    assert np.array_equal(decimate(y, y, buckets=10)[0], y[idx])
@@ -0,0 +1,51 @@
+# ==========================================
+# tests of the solver engine
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+import os
+import glob
+
+import numpy as np
+import pytest
+
+from spicepy.netsolve import net_solve
+
+from botlib.solver import read_network
+from botlib.engine import solve_network
+
+# netlists of the benchmark corpus
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tools', 'corpus')
+
+# netlists with controlled sources (E, F, G, H) and initial conditions
+NETLISTS = {
+    'op_controlled': "V1 1 0 10\nR1 1 2 1k\nR2 2 0 2k\nE1 3 0 2 0 5\nR3 3 4 100\nG1 4 0 2 0 1m\nR4 4 0 1k\n"
+                     "H1 5 0 V1 100\nR5 5 0 1k\nF1 6 0 V1 2\nR6 6 0 10\n.op\n",
+    'ac_controlled': "V1 1 0 1\nR1 1 2 1k\nC1 2 0 1u\nE1 3 0 2 0 10\nR2 3 4 1k\nL1 4 0 10m\n"
+                     "G1 5 0 4 0 1m\nR3 5 0 1k\n.ac dec 10 10 100k\n",
+    'tran_ic': "V1 1 0 0\nR1 1 2 1k\nC1 2 0 1u ic=5\nL1 2 3 10m ic=1m\nR2 3 0 10\n"
+               "E1 4 0 2 0 2\nR3 4 0 1k\nH1 5 0 V1 100\nR4 5 0 1k\n.tran 10u 5m\n",
+    'tran_controlled': "V1 1 0 sin(0 1 1k)\nR1 1 2 1k\nC1 2 0 100n\nF1 3 0 V1 10\nR2 3 0 1k\n"
+                       "G1 4 0 3 0 1m\nR3 4 0 1k\nL1 4 5 1m\nR4 5 0 100\n.tran 5u 2m\n",
+}
+for fname in sorted(glob.glob(os.path.join(CORPUS, '*.net'))):
+    with open(fname) as fid:
+        NETLISTS[os.path.basename(fname)] = fid.read()
+
+
+@pytest.mark.parametrize('name', sorted(NETLISTS))
+def test_solve_network(name):
+    """
+    the sparse engine gives the same solution of SpicePy (without falling back to SpicePy)
+    """
+    net = read_network(NETLISTS[name])
+    assert solve_network(net) is None
+
+    ref = read_network(NETLISTS[name])
+    net_solve(ref)
+
+    assert net.x.shape == ref.x.shape
+    assert np.all(np.isfinite(net.x))
+    np.testing.assert_allclose(net.x, ref.x, rtol=1e-8, atol=1e-12)
+    if net.analysis[0].lower() == '.tran':
+        np.testing.assert_allclose(net.t, ref.t)
+
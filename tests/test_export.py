@@ -0,0 +1,88 @@
+# ==========================================
+# tests of the export of the numeric solution
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+import io
+import gzip
+
+import numpy as np
+
+from botlib.solver import read_network
+from botlib.engine import solve_network
+from botlib.export import export
+
+OP_NETLIST = "V1 1 0 10\nR1 1 2 1k\nR2 2 0 4k\n.op\n"
+AC_NETLIST = "V1 1 0 1\nR1 1 2 1k\nC1 2 0 1u\n.ac dec 10 10 10k\n"
+TRAN_NETLIST = "V1 1 0 pulse(0 1 0 1u 1u 1m 2m)\nR1 1 2 1k\nC1 2 0 1u\n.tran 10u 2m\n"
+
+
+def read_csv(content):
+    """
+    header and columns of a gzipped csv
+    """
+    text = gzip.decompress(content).decode('utf-8')
+    header = text.splitlines()[0].split(',')
+    values = np.loadtxt(io.StringIO(text), delimiter=',', skiprows=1, ndmin=2)
+    return header, values
+
+
+def test_npz_tran():
+    """
+    time, node potentials and branch currents of a .tran analysis are exported exactly
+    """
+    sol = export(TRAN_NETLIST, 'npz')
+    assert sol['solved'] and sol['mex'] is None
+    (filename, content), = sol['files']
+    assert filename == 'tran.npz'
+
+    data = np.load(io.BytesIO(content))
+    assert list(data.keys()) == ['t', 'V(1)', 'V(2)', 'i(V1)', 'i(R1)', 'i(C1)']
+
+    ref = read_network(TRAN_NETLIST)
+    solve_network(ref)
+    np.testing.assert_array_equal(data['t'], ref.t)
+    np.testing.assert_array_equal(data['V(2)'], ref.x[1, :])
+    np.testing.assert_allclose(data['i(R1)'], (data['V(1)'] - data['V(2)']) / 1e3, atol=1e-12)
+
+
+def test_csv_ac():
+    """
+    complex quantities are split in real and imaginary part
+    """
+    sol = export(AC_NETLIST, 'csv')
+    (filename, content), = sol['files']
+    assert filename == 'ac.csv.gz'
+
+    header, values = read_csv(content)
+    assert header[:5] == ['f', 're(V(1))', 'im(V(1))', 're(V(2))', 'im(V(2))']
+    ref = read_network(AC_NETLIST)
+    solve_network(ref)
+    assert values.shape == (ref.f.size, len(header))
+
+    # RC low-pass filter
+    f = values[:, 0]
+    np.testing.assert_array_equal(f, ref.f)
+    expected = 1 / (1 + 1j * 2 * np.pi * f * 1e-3)
+    np.testing.assert_allclose(values[:, 3] + 1j * values[:, 4], expected, rtol=1e-9)
+
+
+def test_csv_op():
+    """
+    a .op analysis is one row with potentials, branch voltages, currents and powers
+    """
+    header, values = read_csv(export(OP_NETLIST, 'csv')['files'][0][1])
+    row = dict(zip(header, values[0]))
+    assert values.shape == (1, len(header))
+    assert row['V(2)'] == 8
+    assert row['v(R2)'] == 8
+    assert abs(row['i(R1)'] - 2e-3) < 1e-15
+    assert abs(row['p(R2)'] - 16e-3) < 1e-15
+
+
+def test_budget():
+    """
+    exports beyond the CPU budget are rejected without solving
+    """
+    sol = export(TRAN_NETLIST, 'npz', budget=1e-6)
+    assert not sol['solved'] and sol['files'] == []
+    assert 'too demanding' in sol['mex']
@@ -0,0 +1,112 @@
+# ==========================================
+# tests of the log files and of their rotation
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+import gzip
+import time
+import logging
+
+from botlib.logs import file_handler, start_logging, log_segments, open_segment
+from botlib.stats import UsageStats
+
+
+def stat_line(analysis, user_id, timestamp=None):
+    """
+    line of StatBot.log (bytes)
+    """
+    return '{},000 - StatLog - INFO - Analysis: {} - UserID: {}\n'.format(
+        time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)), analysis, user_id).encode('utf-8')
+
+
+def test_log_segments(tmp_path):
+    """
+    segments are sorted newest first (size-based and time-based rotation)
+    """
+    log = str(tmp_path / 'Bot.log')
+    for suffix in ('', '.10.gz', '.2.gz', '.1.gz'):
+        open(log + suffix, 'w').close()
+    assert log_segments(log) == [log, log + '.1.gz', log + '.2.gz', log + '.10.gz']
+
+    log = str(tmp_path / 'Timed.log')
+    for suffix in ('.2020-01-02.gz', '.2020-01-10.gz', '.2019-12-31.gz'):
+        open(log + suffix, 'w').close()
+    assert log_segments(log) == [log + '.2020-01-10.gz', log + '.2020-01-02.gz', log + '.2019-12-31.gz']
+
+
+def test_rotation(tmp_path):
+    """
+    records go only to the handlers of their logger, rotated segments are compressed
+    """
+    fmt = logging.Formatter('%(message)s')
+    first = logging.getLogger('test_logs.first')
+    second = logging.getLogger('test_logs.second')
+    first.setLevel(logging.INFO)
+    second.setLevel(logging.INFO)
+    log1 = str(tmp_path / 'First.log')
+    log2 = str(tmp_path / 'Second.log')
+
+    listener = start_logging({first: [file_handler(log1, fmt, max_bytes=100, backup_count=3)],
+                              second: [file_handler(log2, fmt)]})
+    try:
+        for k in range(20):
+            first.info('first message {:02d}'.format(k))
+        second.info('second message')
+    finally:
+        listener.stop()
+        for logger in (first, second):
+            logger.handlers = []
+
+    segments = log_segments(log1)
+    assert segments[0] == log1
+    assert segments[1:] == [log1 + '.{}.gz'.format(k) for k in (1, 2, 3)]
+
+    lines = []
+    for fname in segments[::-1]:
+        with open_segment(fname) as fid:
+            lines += fid.read().decode('utf-8').splitlines()
+    # the oldest messages are in the segments removed after backup_count rotations
+    assert lines == ['first message {:02d}'.format(k) for k in range(20 - len(lines), 20)]
+    assert (tmp_path / 'Second.log').read_text() == 'second message\n'
+
+
+def test_stats_bootstrap(tmp_path):
+    """
+    without a checkpoint the stats are read from all segments (compressed ones too)
+    """
+    logfile = str(tmp_path / 'StatBot.log')
+    with gzip.open(logfile + '.2.gz', 'wb') as fid:
+        fid.write(stat_line('.op', 1) + stat_line('.op', 2))
+    with gzip.open(logfile + '.1.gz', 'wb') as fid:
+        fid.write(stat_line('.ac', 3))
+    with open(logfile, 'wb') as fid:
+        fid.write(stat_line('.tran', 4))
+
+    stats = UsageStats(filename=str(tmp_path / 'stats.json'))
+    stats.load(logfile)
+    assert stats.query() == {'analysis': {'.op': 2, '.ac': 1, '.tran': 1}, 'users': 4}
+
+
+def test_stats_after_rotation(tmp_path):
+    """
+    when the log rotated after the checkpoint, the tail of the rotated segment is read
+    """
+    logfile = str(tmp_path / 'StatBot.log')
+    checkpoint = str(tmp_path / 'stats.json')
+    with open(logfile, 'wb') as fid:
+        fid.write(stat_line('.op', 1) + stat_line('.op', 2))
+
+    stats = UsageStats(filename=checkpoint)
+    stats.load(logfile)
+    stats.save(logfile)
+
+    # new lines, then rotation
+    with open(logfile, 'ab') as fid:
+        fid.write(stat_line('.ac', 3))
+    with open(logfile, 'rb') as fin, gzip.open(logfile + '.1.gz', 'wb') as fout:
+        fout.write(fin.read())
+    with open(logfile, 'wb') as fid:
+        fid.write(stat_line('.tran', 4))
+
+    restarted = UsageStats(filename=checkpoint)
+    restarted.load(logfile)
+    assert restarted.query() == {'analysis': {'.op': 2, '.ac': 1, '.tran': 1}, 'users': 4}
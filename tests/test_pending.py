@@ -0,0 +1,105 @@
+# ==========================================
+# tests of the users waiting for a netlist
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+import os
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from botlib import pending
+from botlib.pending import PendingNetlists
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    clock of botlib.pending moved by hand (clock.now)
+    """
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(pending, 'time', SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def test_expiry(clock):
+    """
+    an entry is valid for ttl seconds and it is removed by pop
+    """
+    waiting = PendingNetlists(ttl=60)
+    waiting.add(1)
+    waiting.add(2)
+
+    clock.now += 60
+    assert waiting.pop(1)
+    assert not waiting.pop(1)
+
+    clock.now += 1
+    assert not waiting.pop(2)
+    assert not waiting.pop(3)
+
+
+def test_sweep(clock):
+    """
+    sweep removes only the expired entries
+    """
+    waiting = PendingNetlists(ttl=60)
+    waiting.add(1)
+    clock.now += 30
+    waiting.add(2)
+    clock.now += 31
+
+    assert waiting.sweep() == 1
+    assert waiting.pop(2)
+
+
+def test_save_load(tmp_path, clock):
+    """
+    entries survive a restart with their expiry (expired entries are not saved)
+    """
+    fname = str(tmp_path / 'pending.json')
+    waiting = PendingNetlists(ttl=60, filename=fname)
+    waiting.add(1)
+    clock.now += 30
+    waiting.add(2)
+    clock.now += 31
+    waiting.save()
+
+    with open(fname) as fid:
+        assert json.load(fid) == {'2': 1090.0}
+
+    restarted = PendingNetlists(ttl=60, filename=fname)
+    restarted.load()
+    assert not restarted.pop(1)
+    assert restarted.pop(2)
+
+
+def test_load_corrupted(tmp_path):
+    """
+    a missing or corrupted file is ignored
+    """
+    fname = str(tmp_path / 'pending.json')
+    waiting = PendingNetlists(filename=fname)
+    waiting.load()
+
+    with open(fname, 'w') as fid:
+        fid.write('{')
+    waiting.load()
+    assert waiting.sweep() == 0
+
+
+def test_import_markers(tmp_path, clock):
+    """
+    old marker files are imported (with the expiry given by their age) and removed
+    """
+    marker = tmp_path / '5_waitnetlist'
+    marker.write_text('')
+    os.utime(str(marker), (clock.now - 100, clock.now - 100))
+    (tmp_path / 'x_waitnetlist').write_text('')
+
+    waiting = PendingNetlists(ttl=3600)
+    assert waiting.import_markers(str(tmp_path)) == 1
+    assert not marker.exists()
+
+    clock.now += 3500
+    assert waiting.pop(5)
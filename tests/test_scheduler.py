@@ -0,0 +1,123 @@
+# ==========================================
+# tests of the admission control and of the fair scheduler
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+import queue
+from concurrent.futures import Future
+
+import pytest
+
+from botlib.scheduler import FairScheduler, RateLimited, TooManyJobs, Overloaded
+
+
+class FakePool(object):
+    """
+    'FakePool' keeps the submitted jobs: the tests complete them one at a time
+    """
+
+    def __init__(self, processes=1):
+        self.processes = processes
+        self.jobs = queue.Queue()
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self.jobs.put((future, args))
+        return future
+
+    def complete(self):
+        future, args = self.jobs.get(timeout=5)
+        future.set_result(args[0])
+        return args[0]
+
+
+def test_scheduler_order():
+    """
+    priority jobs are served first, then users are served round-robin
+    """
+    pool = FakePool()
+    scheduler = FairScheduler(pool, rate=0.1, burst=5, max_per_chat=5)
+    futures = [scheduler.submit(1, 1, None, 'a1')[0], scheduler.submit(1, 1, None, 'a2')[0],
+               scheduler.submit(1, 1, None, 'a3')[0], scheduler.submit(2, 2, None, 'b1')[0],
+               scheduler.submit(3, 3, None, 'p1', priority=True)[0]]
+    assert scheduler.queue_depth() == 5
+
+    scheduler.start()
+    try:
+        order = [pool.complete() for k in range(5)]
+    finally:
+        scheduler.stop()
+
+    assert order == ['p1', 'a1', 'b1', 'a2', 'a3']
+    assert [future.result(timeout=5) for future in futures] == ['a1', 'a2', 'a3', 'b1', 'p1']
+    assert scheduler.queue_depth() == 0
+
+
+def test_scheduler_position():
+    """
+    the position counts the jobs served before (round-robin) beyond the free slots
+    """
+    scheduler = FairScheduler(FakePool(), rate=0.1, burst=5, max_per_chat=5)
+    assert scheduler.submit(1, 1, None, 'a1')[1] == 0
+    assert scheduler.submit(1, 1, None, 'a2')[1] == 1
+    assert scheduler.submit(2, 2, None, 'b1')[1] == 1
+    assert scheduler.submit(1, 1, None, 'a3')[1] == 3
+    assert scheduler.submit(3, 3, None, 'p1', priority=True)[1] == 0
+    scheduler.stop()
+
+
+def test_scheduler_limits():
+    """
+    jobs beyond the burst of a user, the limit of a chat or the queue length are rejected
+    (priority jobs are always admitted)
+    """
+    scheduler = FairScheduler(FakePool(), rate=0.001, burst=2, max_per_chat=3, max_queue=4)
+
+    scheduler.submit(1, 1, None, 'a1')
+    scheduler.submit(1, 1, None, 'a2')
+    with pytest.raises(RateLimited):
+        scheduler.submit(1, 1, None, 'a3')
+
+    scheduler.submit(2, 1, None, 'b1')
+    with pytest.raises(TooManyJobs):
+        scheduler.submit(3, 1, None, 'c1')
+
+    scheduler.submit(4, 4, None, 'd1')
+    with pytest.raises(Overloaded):
+        scheduler.submit(5, 5, None, 'e1')
+
+    scheduler.submit(6, 1, None, 'p1', priority=True)
+    assert scheduler.queue_depth() == 5
+
+    # waiting jobs are cancelled when the scheduler stops
+    scheduler.stop()
+    with pytest.raises(Overloaded):
+        scheduler.submit(7, 7, None, 'f1')
+
+
+def test_scheduler_release():
+    """
+    a chat can submit again when its jobs are done, failures of the pool are passed on
+    and waiting jobs are cancelled by stop
+    """
+    pool = FakePool()
+    scheduler = FairScheduler(pool, rate=100, burst=100, max_per_chat=1)
+    scheduler.start()
+    try:
+        first = scheduler.submit(1, 1, None, 'a1')[0]
+        with pytest.raises(TooManyJobs):
+            scheduler.submit(1, 1, None, 'a2')
+        pool.complete()
+        assert first.result(timeout=5) == 'a1'
+
+        second = scheduler.submit(1, 1, None, 'a2')[0]
+        future, args = pool.jobs.get(timeout=5)
+        future.set_exception(ValueError('bad netlist'))
+        with pytest.raises(ValueError):
+            second.result(timeout=5)
+
+        # the pool slot is busy: the next job waits
+        scheduler.submit(2, 2, None, 'b1')
+        waiting = scheduler.submit(3, 3, None, 'c1')[0]
+    finally:
+        scheduler.stop()
+    assert waiting.cancelled()
@@ -0,0 +1,72 @@
+# ==========================================
+# tests of the settings store
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+import sqlite3
+
+from botlib.settings import SettingsStore, Settings, DEFAULT
+
+
+def test_toggle_and_reload(tmp_path):
+    """
+    toggled flags are cached and survive a new store on the same database
+    """
+    fname = str(tmp_path / 'settings.db')
+    store = SettingsStore(fname)
+    assert store.get(1) == DEFAULT
+
+    assert store.toggle(1, 'polar') == DEFAULT._replace(polar=True)
+    assert store.toggle(1, 'composite') == DEFAULT._replace(polar=True, composite=True)
+    assert store.toggle(1, 'polar') == DEFAULT._replace(composite=True)
+    store.set(2, Settings(True, True, True, False))
+    store.close()
+
+    store = SettingsStore(fname)
+    assert store.get(1) == DEFAULT._replace(composite=True)
+    assert store.get(2) == Settings(True, True, True, False)
+    assert store.reset(2) == DEFAULT
+    assert store.get(2) == DEFAULT
+    store.close()
+
+
+def test_migration(tmp_path):
+    """
+    databases created before a flag was added get the missing columns (flags of old rows are kept)
+    """
+    fname = str(tmp_path / 'settings.db')
+    db = sqlite3.connect(fname)
+    db.execute('CREATE TABLE settings (chat_id INTEGER PRIMARY KEY, nodal_pot INTEGER NOT NULL DEFAULT 0, '
+               'polar INTEGER NOT NULL DEFAULT 0, decibel INTEGER NOT NULL DEFAULT 0)')
+    db.execute('INSERT INTO settings VALUES (7, 1, 0, 1)')
+    db.commit()
+    db.close()
+
+    store = SettingsStore(fname)
+    assert store.get(7) == Settings(nodal_pot=True, polar=False, decibel=True, composite=False)
+    assert store.toggle(7, 'composite').composite
+    store.close()
+
+    db = sqlite3.connect(fname)
+    columns = [row[1] for row in db.execute('PRAGMA table_info(settings)')]
+    db.close()
+    assert columns == ['chat_id'] + list(Settings._fields)
+
+
+def test_import_cnf(tmp_path):
+    """
+    old cnf files are imported once (existing settings are not overwritten)
+    """
+    (tmp_path / '5.cnf').write_text('True\nFalse\nTrue\n')
+    (tmp_path / '6.cnf').write_text('True\nTrue\nTrue\n')
+    (tmp_path / 'bad.cnf').write_text('True\n')
+
+    store = SettingsStore(str(tmp_path / 'settings.db'))
+    store.toggle(6, 'decibel')
+    assert store.import_cnf(str(tmp_path)) == 2
+
+    assert store.get(5) == Settings(nodal_pot=True, polar=False, decibel=True, composite=False)
+    assert store.get(6) == DEFAULT._replace(decibel=True)
+    assert (tmp_path / '5.cnf.imported').exists()
+    assert (tmp_path / 'bad.cnf').exists()
+    assert store.import_cnf(str(tmp_path)) == 0
+    store.close()
@@ -0,0 +1,108 @@
+# ==========================================
+# tests of the usage statistics
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+import os
+import time
+import json
+
+from botlib.stats import UsageStats, parse_stat_line
+
+
+def stat_line(analysis, user_id, timestamp):
+    """
+    line of StatBot.log (bytes)
+    """
+    return '{},000 - StatLog - INFO - Analysis: {} - UserID: {}\n'.format(
+        time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)), analysis, user_id).encode('utf-8')
+
+
+def test_parse_stat_line():
+    """
+    analysis, user and time are read from a line of the log
+    """
+    timestamp = time.mktime((2019, 1, 1, 10, 0, 0, 0, 0, -1))
+    assert parse_stat_line(stat_line('.AC', 123, timestamp).decode('utf-8')) == ('.ac', 123, timestamp)
+
+
+def test_windows():
+    """
+    analyses are counted all-time and in the time windows (excluded users are not counted)
+    """
+    now = time.time()
+    stats = UsageStats(exclude=[99])
+    stats.add('.op', 1, now - 40 * 24 * 3600)
+    stats.add('.op', 2, now - 3 * 24 * 3600)
+    stats.add('.ac', 2, now - 3600)
+    stats.add('.tran', 3)
+    stats.add('.tran', 99)
+
+    assert stats.query() == {'analysis': {'.op': 2, '.ac': 1, '.tran': 1}, 'users': 3}
+    assert stats.query('30d') == {'analysis': {'.op': 1, '.ac': 1, '.tran': 1}, 'users': 2}
+    assert stats.query('7d') == {'analysis': {'.op': 1, '.ac': 1, '.tran': 1}, 'users': 2}
+    assert stats.query('24h') == {'analysis': {'.op': 0, '.ac': 1, '.tran': 1}, 'users': 2}
+
+
+def test_checkpoint(tmp_path):
+    """
+    after a restart only the lines written after the checkpoint are read
+    """
+    logfile = str(tmp_path / 'StatBot.log')
+    checkpoint = str(tmp_path / 'stats.json')
+    now = time.time()
+    with open(logfile, 'wb') as fid:
+        fid.write(stat_line('.op', 1, now - 7200) + stat_line('.ac', 2, now - 3600) + b'garbage\n')
+
+    stats = UsageStats(filename=checkpoint)
+    stats.load(logfile)
+    assert stats.query()['analysis'] == {'.op': 1, '.ac': 1, '.tran': 0}
+    stats.save(logfile)
+
+    with open(logfile, 'ab') as fid:
+        fid.write(stat_line('.tran', 3, now))
+
+    restarted = UsageStats(filename=checkpoint)
+    restarted.load(logfile)
+    assert restarted.query() == {'analysis': {'.op': 1, '.ac': 1, '.tran': 1}, 'users': 3}
+    assert restarted.query('24h')['users'] == 3
+    assert restarted.offset == os.path.getsize(logfile)
+
+
+def test_old_checkpoint(tmp_path):
+    """
+    checkpoints without the users found in the log (excluded users too) read them from the log
+    """
+    logfile = str(tmp_path / 'StatBot.log')
+    checkpoint = str(tmp_path / 'stats.json')
+    with open(logfile, 'wb') as fid:
+        fid.write(stat_line('.op', 1, time.time()) + stat_line('.op', 99, time.time()))
+
+    stats = UsageStats(filename=checkpoint, exclude=[99])
+    stats.load(logfile)
+    stats.save(logfile)
+    with open(checkpoint) as fid:
+        data = json.load(fid)
+    del data['seen']
+    with open(checkpoint, 'w') as fid:
+        json.dump(data, fid)
+
+    restarted = UsageStats(filename=checkpoint, exclude=[99])
+    restarted.load(logfile)
+    assert restarted.query()['users'] == 1
+    assert restarted.all_users() == {1, 99}
+
+
+def test_corrupted_checkpoint(tmp_path):
+    """
+    a corrupted checkpoint is ignored: the whole log is read
+    """
+    logfile = str(tmp_path / 'StatBot.log')
+    checkpoint = str(tmp_path / 'stats.json')
+    with open(logfile, 'wb') as fid:
+        fid.write(stat_line('.op', 1, time.time()))
+    with open(checkpoint, 'w') as fid:
+        fid.write('{"offset": ')
+
+    stats = UsageStats(filename=checkpoint)
+    stats.load(logfile)
+    assert stats.query()['analysis']['.op'] == 1
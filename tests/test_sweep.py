@@ -0,0 +1,87 @@
+# ==========================================
+# tests of the sweeps
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from botlib.solver import read_network
+from botlib.engine import dc_solve, transient_solve
+from botlib.sweep import op_sweep, tran_sweep, sweep
+
+# .op network with a controlled source
+OP_NETLIST = "V1 1 0 10\nR1 1 2 1k\nR2 2 0 2k\nR3 2 3 500\nI1 0 3 1m\nR4 3 0 3k\nE1 4 0 3 0 2\nR5 4 0 1k\n.op\n"
+
+# .tran network with initial conditions and a time-dependent source
+TRAN_NETLIST = "V1 1 0 sin(0 1 1k)\nR1 1 2 1k\nC1 2 0 100n ic=0.5\nL1 2 3 10m ic=1m\nR2 3 0 100\n" \
+               "I1 0 3 1m\nE1 4 0 3 0 2\nR3 4 0 1k\n.plot v(2) i(L1)\n.tran 5u 2m\n"
+
+
+@pytest.mark.parametrize('name, values', [('R2', [1, 100, 2e3, 1e6]), ('R3', [10, 1e3]),
+                                          ('V1', [-5, 0, 12]), ('I1', [0, 1e-3, -2e-2])])
+def test_op_sweep(name, values):
+    """
+    a .op sweep gives the same solutions of one solve for each value
+    """
+    values = np.array(values, dtype=float)
+
+    net = read_network(OP_NETLIST)
+    index = net.names.index(name)
+    X = op_sweep(net, index, values)
+
+    for k, value in enumerate(values):
+        ref = read_network(OP_NETLIST)
+        ref.values[index] = value
+        dc_solve(ref)
+        np.testing.assert_allclose(X[:, k], ref.x, rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize('name, values', [('R1', [100, 1e3, 1e4]), ('R2', [10, 1e3]), ('C1', [10e-9, 1e-6]),
+                                          ('L1', [1e-3, 100e-3]), ('I1', [0, -5e-3])])
+def test_tran_sweep(name, values):
+    """
+    a .tran sweep gives the same solutions of one solve for each value
+    """
+    values = np.array(values, dtype=float)
+
+    net = read_network(TRAN_NETLIST)
+    index = net.names.index(name)
+    v0 = net.values[index]
+    solutions = []
+    for x in tran_sweep(net, index, values):
+        solutions.append(x)
+        assert net.values[index] == values[len(solutions) - 1]
+    assert net.values[index] == v0
+
+    for x, value in zip(solutions, values):
+        ref = read_network(TRAN_NETLIST)
+        ref.values[index] = value
+        transient_solve(ref)
+        assert np.all(np.isfinite(x))
+        np.testing.assert_allclose(x, ref.x, rtol=1e-8, atol=1e-12)
+
+
+@pytest.mark.parametrize('netlist, element', [(OP_NETLIST, 'r2'), (TRAN_NETLIST, 'C1')])
+def test_sweep(netlist, element):
+    """
+    a sweep sends one plot at the requested resolution
+    """
+    sol = sweep(netlist, element, '1k' if element == 'r2' else '10n', '10k' if element == 'r2' else '1u', 5, dpi=50)
+    assert sol['solved'] and sol['mex'] is None
+    assert len(sol['plots']) == 1
+    assert Image.open(io.BytesIO(sol['plots'][0])).size == (320, 240)
+
+
+def test_sweep_errors():
+    """
+    invalid sweeps are explained to the user
+    """
+    assert 'no effect' in sweep("V1 1 0 1\nR1 1 2 1k\nC1 2 0 1u\n.op\n", 'C1', '1', '2', 5)['mex']
+    assert 'not a resistor' in sweep(OP_NETLIST, 'E1', '1', '2', 5)['mex']
+    assert 'time-dependent' in sweep(TRAN_NETLIST, 'V1', '1', '2', 5)['mex']
+    assert 'between 2 and' in sweep(OP_NETLIST, 'R1', '1', '2', 1)['mex']
+    assert 'positive' in sweep(OP_NETLIST, 'R1', '-1', '2', 5)['mex']
+    assert 'numbers' in sweep(OP_NETLIST, 'R1', 'x', '2', 5)['mex']
@@ -0,0 +1,97 @@
+# ==========================================
+# tests of the user registry
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+import time
+
+from botlib.users import UserRegistry
+
+
+def registry(tmp_path, **kwargs):
+    reg = UserRegistry(str(tmp_path / 'users.txt'), str(tmp_path / 'users.journal'), **kwargs)
+    reg.load()
+    return reg
+
+
+def test_journal(tmp_path):
+    """
+    users, last-seen times and reachability survive a restart
+    """
+    reg = registry(tmp_path)
+    assert reg.touch(1)
+    assert not reg.touch(1)
+    assert reg.touch(2)
+    reg.set_reachable(2, False)
+    reg.set_reachable(2, False)
+    assert reg.merge([2, 3, 4]) == 2
+    assert sorted(reg.reachable_users()) == [1, 3, 4]
+
+    assert (tmp_path / 'users.txt').read_text().split() == ['1', '2', '3', '4']
+    journal = (tmp_path / 'users.journal').read_text().splitlines()
+    assert [line.split()[:2] for line in journal] == [['1', 'seen'], ['2', 'seen'], ['2', 'unreachable']]
+
+    restarted = registry(tmp_path)
+    assert len(restarted) == 4
+    assert sorted(restarted.reachable_users()) == [1, 3, 4]
+    assert abs(restarted.last_seen(1) - time.time()) < 5
+    assert restarted.last_seen(3) == 0
+    assert restarted.last_seen(99) == 0
+
+
+def test_reachable_again(tmp_path):
+    """
+    a user that contacts the bot is reachable again
+    """
+    reg = registry(tmp_path)
+    reg.merge([1])
+    reg.set_reachable(1, False)
+    reg.touch(1)
+    assert reg.reachable_users() == [1]
+    assert registry(tmp_path).reachable_users() == [1]
+
+
+def test_seen_resolution(tmp_path):
+    """
+    a new last-seen time is written only once per resolution (the one in memory is always updated)
+    """
+    reg = registry(tmp_path, seen_resolution=3600)
+    reg.touch(1)
+    first = reg.last_seen(1)
+    time.sleep(0.01)
+    reg.touch(1)
+    assert reg.last_seen(1) > first
+    assert len((tmp_path / 'users.journal').read_text().splitlines()) == 1
+
+
+def test_unknown_user(tmp_path):
+    """
+    a user unknown to the registry is added to the database when its reachability is recorded
+    """
+    reg = registry(tmp_path)
+    reg.set_reachable(5, True)
+    reg.set_reachable(6, False)
+    assert (tmp_path / 'users.txt').read_text().split() == ['5', '6']
+
+    reg.compact()
+    assert sorted(registry(tmp_path).reachable_users()) == [5]
+
+
+def test_compaction(tmp_path):
+    """
+    a journal much longer than the number of users is rewritten with the current state at load
+    """
+    (tmp_path / 'users.txt').write_text('1\n2\n3\n')
+    with open(str(tmp_path / 'users.journal'), 'w') as fid:
+        for k in range(600):
+            fid.write('1 seen {}\n'.format(1000 + k))
+            fid.write('2 {}\n'.format('unreachable' if k % 2 == 0 else 'reachable'))
+        fid.write('3 unreachable\n')
+        fid.write('garbage\n')
+
+    reg = registry(tmp_path)
+    assert sorted((tmp_path / 'users.journal').read_text().splitlines()) == ['1 seen 1599', '3 unreachable']
+    assert sorted(reg.reachable_users()) == [1, 2]
+
+    restarted = registry(tmp_path)
+    assert restarted.last_seen(1) == 1599
+    assert sorted(restarted.reachable_users()) == [1, 2]
@@ -0,0 +1,89 @@
+# ==========================================
+# tests of the webhook server
+# ==========================================
+# run from the repository folder with: python -m pytest tests
+import json
+import time
+import socket
+import http.client
+
+import pytest
+
+from botlib.webhook import WebhookServer
+
+SECRET = 'secret-token'
+
+
+@pytest.fixture
+def server():
+    updates = []
+    server = WebhookServer('127.0.0.1', 0, '/hook', updates.append, secret_token=SECRET, max_body=1000)
+    server.updates = updates
+    server.start()
+    yield server
+    server.stop()
+
+
+def post(conn, path='/hook', body=b'{}', token=SECRET, method='POST'):
+    headers = {'Content-Type': 'application/json'}
+    if token is not None:
+        headers['X-Telegram-Bot-Api-Secret-Token'] = token
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def wait_updates(server, count, timeout=5):
+    # updates are passed on after the response
+    deadline = time.monotonic() + timeout
+    while (len(server.updates) < count) and (time.monotonic() < deadline):
+        time.sleep(0.01)
+    return server.updates
+
+
+def test_statuses(server):
+    """
+    updates are acknowledged and passed on, bad requests are rejected (same keep-alive connection)
+    """
+    conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+    update = {'update_id': 1, 'message': {'text': 'hello'}}
+    assert post(conn, body=json.dumps(update).encode('utf-8')) == 200
+    assert post(conn, token='wrong') == 403
+    assert post(conn, token=None) == 403
+    assert post(conn, path='/other') == 404
+    assert post(conn, method='GET', body=None) == 405
+    assert post(conn, path='/hook?x=1', body=b'{"update_id": 2}') == 200
+    conn.close()
+
+    assert wait_updates(server, 2) == [update, {'update_id': 2}]
+
+
+def test_too_large(server):
+    """
+    updates larger than max_body are rejected and the connection is closed
+    """
+    conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+    assert post(conn, body=b'x' * 1001) == 413
+    conn.close()
+    assert server.updates == []
+
+
+def test_stop_with_open_connection():
+    """
+    stop closes the connections still open (keep-alive) and the thread terminates
+    """
+    server = WebhookServer('127.0.0.1', 0, '/hook', lambda update: None)
+    server.start()
+    conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+    assert post(conn, token=None) == 200
+
+    idle = socket.create_connection(('127.0.0.1', server.port), timeout=5)
+    server.stop()
+    assert not server._thread.is_alive()
+
+    # the server closed both connections
+    assert conn.sock.recv(1) == b''
+    assert idle.recv(1) == b''
+    conn.close()
+    idle.close()
@@ -0,0 +1,440 @@
+"""
+Offline load test of SpicePyBot.
+
+The handlers of the bot (catch_netlist, netlist + reply, complex_repr, ...) are driven
+through stub updates and a fake bot that records the calls to the Telegram API.
+A corpus of netlists is replayed at a given concurrency, one phase for each analysis
+type and one phase with all netlists, and for each phase the script reports:
+    * latency percentiles (p50/p95/p99) of the handlers that solve a netlist
+    * throughput (netlists per second)
+    * peak RSS of the bot and of its solver workers
+
+usage: python tools/benchmark.py [--corpus DIR] [--concurrency N] [--repeat R] [--workers W] [--cache] [--json FILE]
+"""
+# ======================
+# general python modules
+# ======================
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import itertools
+from types import SimpleNamespace
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# the bot is imported from the parent folder
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from botlib.cache import normalize_netlist
+
+# default corpus and id of the (fake) admin
+CORPUS = os.path.join(ROOT, 'tools', 'corpus')
+ADMIN_ID = 1
+
+# users of the benchmark: each request comes from a new user (no rate limits)
+FIRST_USER = 1000
+
+# RSS sampling period (s)
+RSS_PERIOD = 0.05
+
+# percentiles reported
+PERCENTILES = (50, 95, 99)
+
+
+class FakeFile(object):
+    """
+    'FakeFile' is the file returned by FakeBot.getFile (download writes the netlist)
+    """
+
+    def __init__(self, text):
+        """
+        :param text: content of the file
+        """
+        self.text = text
+
+    def download(self, fname):
+        """
+        'download' writes the file
+
+        :param fname: destination
+        :return: fname
+        """
+        with open(fname, 'w') as fid:
+            fid.write(self.text)
+        return fname
+
+
+class FakeBot(object):
+    """
+    'FakeBot' replaces telegram.Bot: each call to the API is recorded (method, chat,
+    size of the payload) and returns immediately
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def _record(self, method, chat_id, size=0):
+        with self._lock:
+            self.calls.append((method, chat_id, size))
+        return SimpleNamespace(message_id=len(self.calls), chat_id=chat_id)
+
+    @staticmethod
+    def _size(media):
+        return len(media.getvalue()) if hasattr(media, 'getvalue') else 0
+
+    def send_message(self, chat_id, text='', **kwargs):
+        return self._record('send_message', chat_id, len(text))
+
+    def send_chat_action(self, chat_id, action=None, **kwargs):
+        return self._record('send_chat_action', chat_id)
+
+    def send_photo(self, chat_id, photo=None, **kwargs):
+        return self._record('send_photo', chat_id, self._size(photo))
+
+    def send_document(self, chat_id, document=None, **kwargs):
+        return self._record('send_document', chat_id, self._size(document))
+
+    def send_media_group(self, chat_id, media=(), **kwargs):
+        return self._record('send_media_group', chat_id, sum(len(item.media.input_file_content) for item in media))
+
+    def getFile(self, file_id):
+        return FakeFile(self.files[file_id])
+
+    def count(self, chat_id=None):
+        """
+        'count' provides the number of API calls (of a chat)
+
+        :param chat_id: chat id (None: all chats)
+        :return: number of calls
+        """
+        with self._lock:
+            return sum(1 for method, chat, size in self.calls if chat_id in (None, chat))
+
+
+def make_update(chat_id, text=None, document=None):
+    """
+    'make_update' creates a stub update
+
+    :param chat_id: chat id (also used as user id)
+    :param text: text of the message
+    :param document: file id of the document attached to the message
+    :return: update
+    """
+    message = SimpleNamespace(chat_id=chat_id, text=text, message_id=1,
+                              document=SimpleNamespace(file_id=document) if document else None,
+                              reply_text=lambda *args, **kwargs: None)
+    user = SimpleNamespace(id=chat_id, first_name='bench', last_name=None, username=None)
+    return SimpleNamespace(message=message, effective_user=user, effective_chat=SimpleNamespace(id=chat_id))
+
+
+def analysis_of(netlist):
+    """
+    'analysis_of' provides the analysis of a netlist (last command that is not .plot/.tf/.backanno/.end)
+
+    :param netlist: string with the netlist
+    :return: '.op', '.ac', '.tran' or ''
+    """
+    analysis = ''
+    for line in normalize_netlist(netlist):
+        if (line[0] == '.') and (line.split()[0].lower() not in ('.plot', '.tf', '.backanno', '.end')):
+            analysis = line.split()[0].lower()
+    return analysis
+
+
+def read_corpus(folder):
+    """
+    'read_corpus' reads all netlists of a folder
+
+    :param folder: folder with the netlists (*.net, *.txt, *.cir)
+    :return: list of (name, analysis, netlist)
+    """
+    corpus = []
+    for name in sorted(os.listdir(folder)):
+        if os.path.splitext(name)[1].lower() in ('.net', '.txt', '.cir'):
+            with open(os.path.join(folder, name)) as fid:
+                netlist = fid.read()
+            corpus.append((name, analysis_of(netlist), netlist))
+    return corpus
+
+
+def tree_rss(pid):
+    """
+    'tree_rss' provides the resident memory of a process and of its children (Linux only)
+
+    :param pid: process id
+    :return: RSS in bytes
+    """
+    pids = [pid]
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open('/proc/{}/stat'.format(entry)) as fid:
+                    # the name of the process (2nd field) may contain spaces
+                    if int(fid.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+
+    rss = 0
+    for p in pids:
+        try:
+            with open('/proc/{}/statm'.format(p)) as fid:
+                rss += int(fid.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            continue
+    return rss
+
+
+class RssMonitor(object):
+    """
+    'RssMonitor' samples the RSS of the bot and of its workers in a background thread
+    """
+
+    def __init__(self, period=RSS_PERIOD):
+        """
+        :param period: sampling period (s)
+        """
+        self.period = period
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = tree_rss(os.getpid())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            self.peak = max(self.peak, tree_rss(os.getpid()))
+
+
+def percentile(values, q):
+    """
+    'percentile' computes a percentile (nearest rank)
+
+    :param values: list of values
+    :param q: percentile (0-100)
+    :return: percentile (None if values is empty)
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class Benchmark(object):
+    """
+    'Benchmark' replays netlists through the handlers of the bot
+    """
+
+    def __init__(self, bot_module, concurrency=8):
+        """
+        :param bot_module: SpicePyBot module (already imported)
+        :param concurrency: number of requests processed at the same time
+        """
+        self.B = bot_module
+        self.concurrency = concurrency
+        self.bot = FakeBot()
+        self._next_user = FIRST_USER
+        self._lock = threading.Lock()
+
+    def _user(self):
+        with self._lock:
+            self._next_user += 1
+            return self._next_user
+
+    def _context(self, args=None):
+        return SimpleNamespace(bot=self.bot, args=args or [], user_data={}, chat_data={})
+
+    def request(self, k, netlist):
+        """
+        'request' sends a netlist as a new user. Requests alternate between the upload of a
+        file (catch_netlist) and /netlist followed by a text message (reply); some users
+        change their settings before (complex_repr, nodal_pot, decibel).
+
+        :param k: index of the request
+        :param netlist: string with the netlist
+        :return: latency (s) of the handler that solves the netlist, number of API calls
+        """
+        B = self.B
+        user = self._user()
+
+        # settings
+        toggle = (None, B.complex_repr, B.nodal_pot, B.decibel)[k % 4]
+        if toggle is not None:
+            toggle(make_update(user, '/' + toggle.__name__), self._context())
+
+        calls = self.bot.count(user)
+        if k % 2 == 0:
+            file_id = 'netlist-{}'.format(user)
+            self.bot.files[file_id] = netlist
+            update = make_update(user, document=file_id)
+            start = time.perf_counter()
+            B.catch_netlist(update, self._context())
+        else:
+            B.netlist(make_update(user, '/netlist'), self._context())
+            update = make_update(user, netlist)
+            start = time.perf_counter()
+            B.reply(update, self._context())
+        latency = time.perf_counter() - start
+
+        return latency, self.bot.count(user) - calls
+
+    def phase(self, netlists, repeat=1):
+        """
+        'phase' replays netlists at the given concurrency
+
+        :param netlists: list of netlists
+        :param repeat: number of times each netlist is sent
+        :return: dictionary with requests, latencies (p50/p95/p99, mean), throughput, API calls and peak RSS
+        """
+        work = [netlist for r in range(repeat) for netlist in netlists]
+        with RssMonitor() as rss:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                results = list(executor.map(self.request, range(len(work)), work))
+            elapsed = time.perf_counter() - start
+
+        latencies = [latency for latency, calls in results]
+        res = OrderedDict()
+        res['requests'] = len(work)
+        for q in PERCENTILES:
+            res['p{}'.format(q)] = percentile(latencies, q)
+        res['mean'] = sum(latencies) / len(latencies) if latencies else None
+        res['throughput'] = len(work) / elapsed if elapsed > 0 else None
+        res['api_calls'] = sum(calls for latency, calls in results) / max(1, len(results))
+        res['peak_rss'] = rss.peak
+        return res
+
+
+def load_bot(workdir, workers=None, cache=False):
+    """
+    'load_bot' imports the bot in a working folder (the bot writes there logs, users and caches)
+
+    :param workdir: working folder (an admin list with ADMIN_ID is created if missing)
+    :param workers: number of solver processes (default: the one of the bot)
+    :param cache: if False the result cache and the coalescing of identical netlists are disabled
+    :return: SpicePyBot module (workers not started), import time (s)
+    """
+    os.makedirs(os.path.join(workdir, 'admin_only'), exist_ok=True)
+    admin_list = os.path.join(workdir, 'admin_only', 'admin_list.txt')
+    if not os.path.exists(admin_list):
+        with open(admin_list, 'w') as fid:
+            fid.write(str(ADMIN_ID) + '\n')
+    os.chdir(workdir)
+
+    start = time.perf_counter()
+    import SpicePyBot as B
+    import_time = time.perf_counter() - start
+
+    if workers:
+        B.solver_pool.processes = workers
+        B.scheduler.slots = workers
+    if not cache:
+        # every request gets its own key: no cache hits and no request joins a running solve
+        B.result_cache.max_entries = 0
+        unique = itertools.count()
+        B.netlist_key = lambda *args, **kwargs: 'benchmark-{}'.format(next(unique))
+    return B, import_time
+
+
+def format_report(report):
+    """
+    'format_report' prints the results of all phases in a table
+
+    :param report: OrderedDict phase --> results (see Benchmark.phase)
+    :return: string
+    """
+    header = '{:<8} {:>8} {:>9} {:>9} {:>9} {:>9} {:>10} {:>9} {:>10}'.format(
+        'phase', 'requests', 'p50 ms', 'p95 ms', 'p99 ms', 'mean ms', 'req/s', 'calls', 'RSS MB')
+    lines = [header, '-' * len(header)]
+    for name, res in report.items():
+        lines.append('{:<8} {:>8d} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>10.2f} {:>9.1f} {:>10.1f}'.format(
+            name, res['requests'], 1000 * res['p50'], 1000 * res['p95'], 1000 * res['p99'], 1000 * res['mean'],
+            res['throughput'], res['api_calls'], res['peak_rss'] / 2**20))
+    return '\n'.join(lines)
+
+
+def parse_args():
+    """
+    'parse_args' reads the command line options
+
+    :return: options
+    """
+    parser = argparse.ArgumentParser(description='Offline load test of SpicePyBot')
+    parser.add_argument('--corpus', default=CORPUS, help='folder with the netlists (default: tools/corpus)')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests processed at the same time')
+    parser.add_argument('--repeat', type=int, default=5, help='number of times each netlist is sent')
+    parser.add_argument('--workers', type=int, default=None, help='solver processes (default: number of cores)')
+    parser.add_argument('--cache', action='store_true', help='keep the result cache (default: every netlist is solved)')
+    parser.add_argument('--json', default=None, help='write the results in a json file')
+    parser.add_argument('--workdir', default=None, help='working folder of the bot (default: temporary folder)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.json is not None:
+        args.json = os.path.abspath(args.json)
+    corpus = read_corpus(args.corpus)
+    if not corpus:
+        sys.exit('no netlists in {}'.format(args.corpus))
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='spicepybot-bench-')
+    B, import_time = load_bot(workdir, args.workers, args.cache)
+
+    start = time.perf_counter()
+    B.solver_pool.start()
+    B.scheduler.start()
+    bench = Benchmark(B, args.concurrency)
+    # first request: wait for the warm-up of the workers
+    bench.request(0, corpus[0][2])
+    startup_time = time.perf_counter() - start
+
+    report = OrderedDict()
+    try:
+        for analysis in ('.op', '.ac', '.tran'):
+            netlists = [netlist for name, an, netlist in corpus if an == analysis]
+            if netlists:
+                report[analysis] = bench.phase(netlists, args.repeat)
+        report['mixed'] = bench.phase([netlist for name, an, netlist in corpus], args.repeat)
+    finally:
+        B.scheduler.stop()
+        B.solver_pool.stop()
+        B.log_listener.stop()
+
+    print('netlists: {}, concurrency: {}, solver processes: {}, result cache: {}'.format(
+        len(corpus), args.concurrency, B.solver_pool.processes, 'on' if args.cache else 'off'))
+    print('import: {:.2f} s, workers ready: {:.2f} s'.format(import_time, startup_time))
+    print(format_report(report))
+    cache = B.result_cache.stats()
+    print('result cache: {} hits, {} misses, coalesced: {}'.format(cache['hits'], cache['misses'],
+                                                                  B.in_flight.coalesced))
+
+    if args.json is not None:
+        with open(args.json, 'w') as fid:
+            json.dump({'import_time': import_time, 'startup_time': startup_time, 'phases': report}, fid, indent=2)
+
+    if args.workdir is None:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
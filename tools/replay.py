@@ -0,0 +1,326 @@
+"""
+Regression and workload corpora from the logs of SpicePyBot.
+
+    * extract: the netlists logged in SolverLog.log (and in its rotated segments) are saved
+      as a corpus (one file for each distinct netlist) with the class of the error logged
+      by the bot ('netlist' or 'timeout') in corpus.json
+    * replay: the netlists of a corpus are solved offline through get_solution (fake bot,
+      see tools/benchmark.py); the class of each result is compared with the expected one
+      and the solve time is reported
+    * workload: a set of netlists taken from a corpus in the same proportions of .op/.ac/.tran
+      of StatBot.log (as computed by /stat); it can be replayed by tools/benchmark.py
+
+usage:
+    python tools/replay.py extract --logdir DIR --out DIR
+    python tools/replay.py replay --corpus DIR [--timeout S] [--check] [--update] [--json FILE]
+    python tools/replay.py workload --statlog FILE --out DIR [--corpus DIR] [-n N] [--window 24h|7d|30d]
+"""
+# ======================
+# general python modules
+# ======================
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from types import SimpleNamespace
+from collections import OrderedDict
+
+from benchmark import CORPUS, FIRST_USER, FakeBot, make_update, read_corpus, percentile, load_bot
+
+from botlib.cache import netlist_key
+from botlib.logs import log_segments, open_segment
+from botlib.stats import UsageStats, ANALYSES, WINDOWS
+
+# index of a corpus: file --> expected class, occurrences in the log, distinct users
+INDEX = 'corpus.json'
+
+# separator of the lines of a netlist in SolverLog
+SEPARATOR = '  /  '
+
+# classes of a result: solved, rejected by the cost guard or one of the errors of error_solution
+OUTCOMES = ('solved', 'rejected', 'netlist', 'timeout', 'busy', 'rate', 'jobs')
+
+
+def parse_solver_line(line):
+    """
+    'parse_solver_line' parses a line of SolverLog.log
+    (e.g. '2019-01-01 10:00:00,000 - SolverLog - ERROR - UserID: 123 - Netlist error: V1 1 0 1  /  R1 1 0 1k  /  ')
+
+    :param line: line of the log
+    :return: class of the error ('netlist' or 'timeout'), user id, netlist
+    """
+    ele = line.rstrip('\r\n').split(' - ', 4)
+    user_id = int(ele[3].replace('UserID: ', ''))
+    if ele[4].startswith('Netlist error: '):
+        kind, flat = 'netlist', ele[4][len('Netlist error: '):]
+    elif ele[4].startswith('Netlist timeout: '):
+        kind, flat = 'timeout', ele[4][len('Netlist timeout: '):]
+    else:
+        raise ValueError("unknown record: {}".format(ele[4][:40]))
+    return kind, user_id, '\n'.join(flat.split(SEPARATOR))
+
+
+def extract(logfile, out):
+    """
+    'extract' saves the distinct netlists of SolverLog.log and of its rotated segments
+
+    :param logfile: SolverLog.log
+    :param out: corpus folder
+    :return: index of the corpus (OrderedDict file --> entry)
+    """
+    netlists = OrderedDict()    # key --> entry
+    for fname in log_segments(logfile)[::-1]:
+        with open_segment(fname) as fid:
+            for line in fid:
+                try:
+                    kind, user_id, netlist = parse_solver_line(line.decode('utf-8', errors='replace'))
+                except (ValueError, IndexError):
+                    continue
+
+                key = netlist_key(netlist)
+                if key not in netlists:
+                    netlists[key] = {'netlist': netlist, 'expected': kind, 'count': 0, 'users': set()}
+                entry = netlists[key]
+                entry['count'] += 1
+                entry['users'].add(user_id)
+                # the last class logged is the one expected
+                entry['expected'] = kind
+
+    os.makedirs(out, exist_ok=True)
+    index = OrderedDict()
+    for key, entry in netlists.items():
+        name = '{}_{}.net'.format(entry['expected'], key[:12])
+        with open(os.path.join(out, name), 'w') as fid:
+            fid.write(entry['netlist'])
+        index[name] = {'expected': entry['expected'], 'count': entry['count'], 'users': len(entry['users'])}
+
+    with open(os.path.join(out, INDEX), 'w') as fid:
+        json.dump(index, fid, indent=2)
+    return index
+
+
+def outcome(sol):
+    """
+    'outcome' provides the class of a result of get_solution
+
+    :param sol: solution
+    :return: one of OUTCOMES
+    """
+    if sol['solved']:
+        return 'solved'
+    return sol.get('error', 'rejected')
+
+
+def replay(B, corpus, index):
+    """
+    'replay' solves all netlists of a corpus through get_solution (one new user for each netlist)
+
+    :param B: SpicePyBot module (workers started and warm)
+    :param corpus: list of (name, analysis, netlist) (see read_corpus)
+    :param index: index of the corpus (expected classes)
+    :return: list of results (dictionaries with file, analysis, expected, outcome, time)
+    """
+    bot = FakeBot()
+    results = []
+    for k, (name, analysis, netlist) in enumerate(corpus):
+        user = FIRST_USER + k
+        fname = './users/{}.txt'.format(user)
+        with open(fname, 'w') as fid:
+            fid.write(netlist)
+
+        context = SimpleNamespace(bot=bot, args=[])
+        start = time.perf_counter()
+        sol = B.get_solution(fname, make_update(user), context)
+        elapsed = time.perf_counter() - start
+
+        results.append({'file': name, 'analysis': analysis, 'expected': index.get(name, {}).get('expected'),
+                        'outcome': outcome(sol), 'time': elapsed})
+    return results
+
+
+def format_replay(results):
+    """
+    'format_replay' summarizes a replay: results by expected class and solve times by outcome
+
+    :param results: see 'replay'
+    :return: string
+    """
+    lines = ['{:<10} {}'.format('expected', ' '.join('{:>8}'.format(name) for name in OUTCOMES))]
+    for expected in sorted(set(str(res['expected']) for res in results)):
+        counts = [sum(1 for res in results if (str(res['expected']) == expected) and (res['outcome'] == name))
+                  for name in OUTCOMES]
+        lines.append('{:<10} {}'.format(expected, ' '.join('{:>8d}'.format(cnt) for cnt in counts)))
+
+    lines.append('')
+    lines.append('{:<10} {:>8} {:>9} {:>9} {:>9}'.format('outcome', 'netlists', 'p50 ms', 'p95 ms', 'max ms'))
+    for name in OUTCOMES:
+        times = [res['time'] for res in results if res['outcome'] == name]
+        if times:
+            lines.append('{:<10} {:>8d} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+                name, len(times), 1000 * percentile(times, 50), 1000 * percentile(times, 95), 1000 * max(times)))
+
+    changed = [res for res in results if (res['expected'] is not None) and (res['outcome'] != res['expected'])]
+    if changed:
+        lines.append('')
+        lines.append('netlists with a different class:')
+        for res in changed:
+            lines.append('    {}: {} --> {}'.format(res['file'], res['expected'], res['outcome']))
+    return '\n'.join(lines)
+
+
+def mix(statlog, admins=(), window=None):
+    """
+    'mix' provides the number of analyses per type of StatBot.log (same aggregates of /stat)
+
+    :param statlog: StatBot.log (rotated segments are read too)
+    :param admins: user ids excluded from the stats
+    :param window: None (all-time) or one of the keys of WINDOWS
+    :return: dictionary analysis --> number of analyses
+    """
+    stats = UsageStats(exclude=admins)
+    stats.read_log(statlog, bootstrap=True)
+    return stats.query(window)['analysis']
+
+
+def allocate(counts, n):
+    """
+    'allocate' splits n requests in the proportions of counts (largest remainder method)
+
+    :param counts: dictionary analysis --> number of analyses
+    :param n: number of requests
+    :return: dictionary analysis --> number of requests
+    """
+    total = sum(counts.values())
+    if total == 0:
+        raise ValueError('no analyses in the log')
+
+    quotas = {key: n * value / total for key, value in counts.items()}
+    res = {key: int(quota) for key, quota in quotas.items()}
+    for key in sorted(quotas, key=lambda key: res[key] - quotas[key])[:n - sum(res.values())]:
+        res[key] += 1
+    return res
+
+
+def workload(counts, corpus, n, out, seed=0):
+    """
+    'workload' writes n netlists taken from a corpus with the proportions of counts
+    (netlists of each type are used in turn, the order is shuffled)
+
+    :param counts: dictionary analysis --> number of analyses (see 'mix')
+    :param corpus: list of (name, analysis, netlist) (see read_corpus)
+    :param n: number of netlists
+    :param out: workload folder
+    :param seed: seed of the shuffle
+    :return: dictionary analysis --> number of netlists written
+    """
+    requests = allocate(counts, n)
+    work = []
+    for analysis, cnt in requests.items():
+        available = [(name, netlist) for name, an, netlist in corpus if an == analysis]
+        if cnt and not available:
+            raise ValueError('no {} netlists in the corpus'.format(analysis))
+        work += [available[k % len(available)] for k in range(cnt)]
+    random.Random(seed).shuffle(work)
+
+    os.makedirs(out, exist_ok=True)
+    for k, (name, netlist) in enumerate(work):
+        with open(os.path.join(out, '{:05d}_{}'.format(k, name)), 'w') as fid:
+            fid.write(netlist)
+    return requests
+
+
+def parse_args():
+    """
+    'parse_args' reads the command line options
+
+    :return: options
+    """
+    parser = argparse.ArgumentParser(description='Regression and workload corpora from the logs of SpicePyBot')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('extract', help='save the netlists of SolverLog.log as a corpus')
+    p.add_argument('--logdir', default='.', help='folder with SolverLog.log (default: current folder)')
+    p.add_argument('--out', required=True, help='corpus folder')
+
+    p = sub.add_parser('replay', help='solve a corpus through get_solution and check the results')
+    p.add_argument('--corpus', required=True, help='corpus folder (see extract)')
+    p.add_argument('--timeout', type=float, default=None, help='timeout of a solve (default: the one of the bot)')
+    p.add_argument('--workers', type=int, default=None, help='solver processes (default: number of cores)')
+    p.add_argument('--check', action='store_true', help='exit with status 1 if a class differs from the expected one')
+    p.add_argument('--update', action='store_true', help='store the current classes as the expected ones')
+    p.add_argument('--json', default=None, help='write the results in a json file')
+
+    p = sub.add_parser('workload', help='netlists in the proportions of StatBot.log')
+    p.add_argument('--statlog', required=True, help='StatBot.log (rotated segments are read too)')
+    p.add_argument('--corpus', default=CORPUS, help='folder with the netlists (default: tools/corpus)')
+    p.add_argument('--out', required=True, help='workload folder')
+    p.add_argument('-n', type=int, default=100, help='number of netlists')
+    p.add_argument('--window', choices=sorted(WINDOWS), default=None, help='time window (default: all-time)')
+    p.add_argument('--admins', type=int, nargs='*', default=[], help='user ids excluded (as /stat does)')
+    p.add_argument('--seed', type=int, default=0, help='seed of the shuffle')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for option in ('logdir', 'out', 'corpus', 'json', 'statlog'):
+        if getattr(args, option, None) is not None:
+            setattr(args, option, os.path.abspath(getattr(args, option)))
+
+    if args.command == 'extract':
+        index = extract(os.path.join(args.logdir, 'SolverLog.log'), args.out)
+        kinds = [entry['expected'] for entry in index.values()]
+        print('{} netlists ({} errors, {} timeouts) saved in {}'.format(
+            len(index), kinds.count('netlist'), kinds.count('timeout'), args.out))
+
+    elif args.command == 'replay':
+        corpus = read_corpus(args.corpus)
+        index_file = os.path.join(args.corpus, INDEX)
+        index = OrderedDict()
+        if os.path.exists(index_file):
+            with open(index_file) as fid:
+                index = json.load(fid, object_pairs_hook=OrderedDict)
+
+        workdir = tempfile.mkdtemp(prefix='spicepybot-replay-')
+        B, import_time = load_bot(workdir, args.workers)
+        if args.timeout is not None:
+            B.solver_pool.timeout = args.timeout
+        B.solver_pool.start()
+        B.scheduler.start()
+        try:
+            # the first netlist must not be timed with the warm-up of the workers
+            B.solver_pool.wait_ready()
+            results = replay(B, corpus, index)
+        finally:
+            B.scheduler.stop()
+            B.solver_pool.stop()
+            B.log_listener.stop()
+
+        print(format_replay(results))
+        if args.json is not None:
+            with open(args.json, 'w') as fid:
+                json.dump(results, fid, indent=2)
+        if args.update:
+            for res in results:
+                index.setdefault(res['file'], {})['expected'] = res['outcome']
+            with open(index_file, 'w') as fid:
+                json.dump(index, fid, indent=2)
+        if args.check and any((res['expected'] is not None) and (res['outcome'] != res['expected'])
+                              for res in results):
+            sys.exit(1)
+
+    elif args.command == 'workload':
+        counts = mix(args.statlog, args.admins, args.window)
+        total = max(1, sum(counts.values()))
+        requests = workload(counts, read_corpus(args.corpus), args.n, args.out, args.seed)
+        for analysis in ANALYSES:
+            print('{:<6} {:>6.2f} % of the log --> {:d} netlists'.format(
+                analysis, counts.get(analysis, 0) / total * 100, requests.get(analysis, 0)))
+        print('workload saved in {} (python tools/benchmark.py --corpus {})'.format(args.out, args.out))
+
+
+if __name__ == '__main__':
+    main()